@@ -0,0 +1,356 @@
+"""
+Crash-safe autosave
+
+Edits are appended to a per-document journal on a background thread, as
+(start, end, replacement) records against the previous state, so each
+autosave writes only what changed. Every so often the journal is compacted
+into a snapshot written to a temporary file and renamed over the old one.
+Saving to the document itself goes through the same atomic replace.
+
+The snapshot is first written at the first edit, so opening or saving a
+document writes nothing extra. Each journal is locked by the process
+writing it while it is open; recovery leaves locked journals alone, as
+they belong to a document open in another window.
+
+After a crash, snapshot plus journal give back the last autosaved text; a
+torn last record is ignored.
+"""
+
+import os
+import json
+import queue
+import hashlib
+import tempfile
+import threading
+
+import appdirs
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+FOLDER = os.path.join(appdirs.user_data_dir("Littera"), "autosave")
+
+# Compact once the journal holds this many records or bytes
+COMPACT_RECORDS = 200
+COMPACT_BYTES = 1024 * 1024
+
+
+def atomic_write(path, data):
+    """Write bytes to path so that it holds either the old or the new data."""
+    folder = os.path.dirname(os.path.abspath(path))
+    handle, temp = tempfile.mkstemp(dir=folder, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            os.chmod(temp, os.stat(path).st_mode & 0o777)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def lock_file(path):
+    """Open path and lock it; return the open file, or None if it is locked
+    already, by another process or another open file of this one."""
+    file = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+def unlock_file(file, path):
+    # Removed first, so that nobody locks a file that is about to go
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    file.close()
+
+
+# Characters compared at a time when looking for the changed range
+DIFF_BLOCK = 4096
+
+
+def diff(old, new):
+    """Return (start, end, replacement) turning old into new."""
+    limit = min(len(old), len(new))
+
+    # Common prefix and suffix, compared a block of slices at a time and
+    # then, inside the block that differs, by halving the step
+    start = 0
+    step = DIFF_BLOCK
+    while step:
+        while start + step <= limit and old[start:start + step] == new[start:start + step]:
+            start += step
+        step //= 2
+
+    end = 0
+    step = DIFF_BLOCK
+    while step:
+        while end + step <= limit - start and \
+                old[len(old) - end - step:len(old) - end] == new[len(new) - end - step:len(new) - end]:
+            end += step
+        step //= 2
+    return start, len(old) - end, new[start:len(new) - end]
+
+
+def document_key(path):
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+
+
+class Recovery:
+    """Text rebuilt from a journal left behind by an earlier session."""
+
+    def __init__(self, key, path, encoding, text):
+        self.key = key
+        self.path = path
+        self.encoding = encoding
+        self.text = text
+
+
+class Journal:
+    def __init__(self, folder, key):
+        self.snapshot = os.path.join(folder, key + ".snap")
+        self.journal = os.path.join(folder, key + ".journal")
+        self.lockPath = os.path.join(folder, key + ".lock")
+        self.path = None
+        self.encoding = "utf-8"
+        self.text = ""
+        self.seq = 0
+        self.records = 0
+        self.file = None
+        self.lock = None
+
+    def begin(self, path, encoding, text):
+        # Nothing is written until the first edit
+        self.path = path
+        self.encoding = encoding
+        self.text = text
+
+    def append(self, text):
+        if text == self.text:
+            return False
+        if self.file is None:
+            # The first edit: the snapshot holds it whole
+            self.text = text
+            self.compact()
+            return True
+        start, end, replacement = diff(self.text, text)
+        self.seq += 1
+        line = json.dumps({"seq": self.seq, "s": start, "e": end, "t": replacement})
+        self.file.write(line + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.text = text
+        self.records += 1
+
+        if self.records >= COMPACT_RECORDS or self.file.tell() >= COMPACT_BYTES:
+            self.compact()
+        return True
+
+    def compact(self):
+        if self.lock is None:
+            self.lock = lock_file(self.lockPath)
+            if self.lock is None:
+                raise OSError("journal in use by another window: " + self.journal)
+        data = json.dumps({"seq": self.seq, "path": self.path,
+                           "encoding": self.encoding, "text": self.text})
+        atomic_write(self.snapshot, data.encode("utf-8"))
+
+        # Records up to seq are in the snapshot now; a crash before the
+        # truncate only leaves records that replay skips
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.journal, "w", encoding="utf-8")
+        self.records = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.lock is not None:
+            unlock_file(self.lock, self.lockPath)
+            self.lock = None
+
+    def remove(self):
+        self.close()
+        for path in (self.journal, self.snapshot):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def load(folder, key):
+        """Rebuild the autosaved text of key, or return None."""
+        try:
+            with open(os.path.join(folder, key + ".snap"), "r", encoding="utf-8") as file:
+                info = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        text = info["text"]
+        try:
+            with open(os.path.join(folder, key + ".journal"), "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record["seq"] > info["seq"]:
+                        text = text[:record["s"]] + record["t"] + text[record["e"]:]
+        except OSError:
+            pass
+        return Recovery(key, info["path"], info["encoding"], text)
+
+
+class Autosaver(threading.Thread):
+    """Runs journal, save and recovery I/O in order on one worker thread.
+
+    All methods may be called from the UI thread and return immediately;
+    callbacks run on the worker thread. Text may be given as a string or
+    as a textmodel.Snapshot, which is only joined on the worker thread."""
+
+    def __init__(self, folder=FOLDER):
+        super().__init__(name="Autosaver", daemon=True)
+
+        self.folder = folder
+        self.tasks = queue.Queue()
+        self.journal = None
+        self.pending = None
+        self.lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+
+        self.start()
+
+    def begin(self, path, encoding, text):
+        """Start journaling a document whose current state is text."""
+        self.tasks.put((self._begin, (path, encoding, text)))
+
+    def record(self, text):
+        # Only the newest unwritten state matters; older ones are dropped
+        with self.lock:
+            queued = self.pending is not None
+            self.pending = text
+        if not queued:
+            self.tasks.put((self._record, ()))
+
+    def save(self, path, text, encoding, callback=None):
+        self.tasks.put((self._save, (path, text, encoding, callback)))
+
+    def discard(self):
+        with self.lock:
+            self.pending = None
+        self.tasks.put((self._discard, ()))
+
+    def recover(self, callback):
+        """Call callback with the Recovery of every journal on disk that is
+        not the current one."""
+        self.tasks.put((self._recover, (callback,)))
+
+    def forget(self, key):
+        self.tasks.put((lambda: Journal(self.folder, key).remove(), ()))
+
+    def stop(self, keep=True):
+        """Write out pending edits, keep or remove the journal, and wait."""
+        if not keep:
+            self.discard()
+        self.tasks.put(None)
+        self.join()
+
+    def _key(self, path):
+        # Untitled buffers get a journal of their own per session
+        if path is None:
+            return "untitled-{}-{}".format(os.getpid(), id(self))
+        return document_key(path)
+
+    def _begin(self, path, encoding, text):
+        text = str(text)
+        if self.journal is not None:
+            self.journal.remove()
+        self.journal = Journal(self.folder, self._key(path))
+        self.journal.begin(path, encoding, text)
+
+    def _record(self):
+        with self.lock:
+            text, self.pending = self.pending, None
+        if text is not None and self.journal is not None:
+            self.journal.append(str(text))
+
+    def _save(self, path, text, encoding, callback):
+        error = None
+        text = str(text)
+        try:
+            # Line endings as text mode wrote them before
+            atomic_write(path, text.replace("\n", os.linesep).encode(encoding))
+            self._begin(path, encoding, text)
+        except (OSError, UnicodeError) as exc:
+            error = exc
+        if callback is not None:
+            callback(path, error)
+
+    def _discard(self):
+        if self.journal is not None:
+            self.journal.remove()
+            self.journal = None
+
+    def _recover(self, callback):
+        current = self.journal.snapshot if self.journal is not None else None
+        found = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".snap") and entry.path != current:
+                key = entry.name[:-5]
+                lockPath = os.path.join(self.folder, key + ".lock")
+                lock = lock_file(lockPath)
+                if lock is None:
+                    # Still being written by a window that is open
+                    continue
+                try:
+                    recovery = Journal.load(self.folder, key)
+                    if recovery is None:
+                        continue
+                    if (recovery.path is None and not recovery.text) or \
+                            (recovery.path is not None and self._matches(recovery)):
+                        Journal(self.folder, key).remove()
+                        continue
+                    found.append((entry.stat().st_mtime, recovery))
+                finally:
+                    unlock_file(lock, lockPath)
+        found.sort(key=lambda item: item[0], reverse=True)
+        callback([recovery for _, recovery in found])
+
+    def _matches(self, recovery):
+        # Nothing to recover if the file already holds the autosaved text
+        try:
+            with open(recovery.path, "r", encoding=recovery.encoding, newline="") as file:
+                return file.read().replace("\r\n", "\n") == recovery.text
+        except (OSError, UnicodeError):
+            return False
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                self._record()
+                if self.journal is not None:
+                    self.journal.close()
+                return
+            function, args = task
+            try:
+                function(*args)
+            except Exception as error:
+                print("autosave failed:", error)
@@ -0,0 +1,125 @@
+"""
+Headless batch converter
+
+Converts a directory tree of Markdown files to HTML and/or PDF with the same
+extensions and PDF template as the editor, spread across a process pool.
+
+Usage: python -m batch SOURCE [-o OUTPUT] [-f html pdf] [-j WORKERS] [-c CHAPTER_WORKERS]
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import export
+import chapters
+import pdfcache
+
+
+def find_markdown(source):
+    if os.path.isfile(source):
+        return [source]
+
+    found = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".md"):
+                found.append(os.path.join(root, name))
+    return found
+
+
+def convert_file(path, target, formats, template=export.TEMPLATE, chapterWorkers=1, cache=None):
+    """Convert one file; returns (path, bytes read, seconds, pisa errors)."""
+    start = time.perf_counter()
+
+    with open(path, "r", encoding="utf-8") as file:
+        md = file.read()
+    content = export.md2html(md)
+
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    err = 0
+    if "html" in formats:
+        title = os.path.splitext(os.path.basename(path))[0]
+        with open(target + ".html", "w", encoding="utf-8") as file:
+            file.write(export.html_page(content, title))
+    if "pdf" in formats:
+        err = chapters.html2pdf_parallel(
+            content, target + ".pdf", template, chapterWorkers,
+            cache=pdfcache.FragmentCache(cache or None) if cache is not None else None)
+
+    return path, len(md.encode("utf-8")), time.perf_counter() - start, err
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m batch", description="Convert Markdown files to HTML and/or PDF.")
+    parser.add_argument("source", help="a .md file or a directory to search recursively")
+    parser.add_argument("-o", "--output", default=None,
+                        help="output directory (default: next to each source file)")
+    parser.add_argument("-f", "--format", nargs="+", choices=["html", "pdf"], default=["pdf"],
+                        help="output formats (default: pdf)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("-c", "--chapter-workers", type=int, default=1,
+                        help="processes per PDF for long documents split at top-level headings (default: 1)")
+    parser.add_argument("--cache", nargs="?", const="", default=None, metavar="DIR",
+                        help="reuse rendered sections of long documents from a fragment cache "
+                             "(default folder: the user cache dir)")
+    parser.add_argument("-t", "--template", default=export.TEMPLATE,
+                        help="PDF template (default: options/pdf_options.html)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    files = find_markdown(args.source)
+    if not files:
+        print("no Markdown files found in", args.source)
+        return 1
+
+    base = args.source if os.path.isdir(args.source) else os.path.dirname(args.source)
+    jobs = {}
+    for path in files:
+        stem = os.path.splitext(path)[0]
+        if args.output:
+            stem = os.path.join(args.output, os.path.relpath(stem, base))
+        jobs[path] = stem
+
+    failed = 0
+    total = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(convert_file, path, target, args.format, args.template,
+                               args.chapter_workers, args.cache): path
+                   for path, target in jobs.items()}
+
+        for future in as_completed(futures):
+            try:
+                path, size, seconds, err = future.result()
+            except Exception as error:
+                failed += 1
+                print("FAILED  ", futures[future], error)
+                continue
+
+            total += size
+            status = "ok" if not err else "pisa errors: " + str(err)
+            if err:
+                failed += 1
+            print("{:8.3f}s  {}  ({})".format(seconds, path, status))
+
+    elapsed = time.perf_counter() - start
+    print("{} file(s), {:.1f} KiB in {:.2f}s with {} worker(s): {:.1f} files/s, {:.1f} KiB/s".format(
+        len(files), total / 1024, elapsed, args.workers,
+        len(files) / elapsed, total / 1024 / elapsed))
+    if failed:
+        print(failed, "file(s) failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Throughput of bulk generation under rate limits
+
+Starts the mock chat completions server in-process with a requests-per-
+minute limit and a share of failing requests, runs bulkgen over a set of
+prompts, first one at a time and then with several requests in flight,
+and reports requests per second, retries and how many requests the server
+turned away. Then stops a run part way and resumes it from its output.
+
+Usage: python benchmarks/bulk_generation.py [-n PROMPTS] [-c CONCURRENCY] [--rpm N] [--errors F]
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+import argparse
+import contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import bulkgen  # noqa: E402
+import mockllm  # noqa: E402
+from jsonlstore import JsonlStore  # noqa: E402
+
+
+def prompts(count):
+    return [("p{}".format(number), [{"role": "user", "content": "prompt number {}".format(number)}])
+            for number in range(count)]
+
+
+async def run(server, url, output, items, concurrency, rpm, stopAfter=None):
+    scheduler = bulkgen.Scheduler(output, concurrency, rpm=rpm, apiBase=url, maxTokens=50)
+    before = server.rejected
+    start = time.perf_counter()
+    task = asyncio.ensure_future(scheduler.run(items))
+    if stopAfter is not None:
+        while scheduler.done < stopAfter:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        return scheduler, None, time.perf_counter() - start
+    skipped, _ = await task
+    return scheduler, (skipped, server.rejected - before), time.perf_counter() - start
+
+
+async def bench(args, folder):
+    server = mockllm.MockServer(ttft=0.05, delay=0.0005, tokens=50, rpm=args.rpm, errors=args.errors)
+    url = await server.start()
+    items = prompts(args.prompts)
+
+    # Silence the per-request lines; only the summary matters here
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        results = []
+        for concurrency in (1, args.concurrency):
+            output = os.path.join(folder, "c{}.jsonl".format(concurrency))
+            server.recent.clear()
+            results.append((concurrency,) + await run(server, url, output, items, concurrency, args.rpm))
+
+        output = os.path.join(folder, "resumed.jsonl")
+        server.recent.clear()
+        stopped, _, _ = await run(server, url, output, items, args.concurrency, args.rpm, args.prompts // 2)
+        resumed, (resumeSkipped, _), _ = await run(server, url, output, items, args.concurrency, args.rpm)
+    server.close()
+
+    for concurrency, scheduler, (skipped, rejected), seconds in results:
+        print("concurrency {:3}  {:4} done {:3} failed  {:6.2f}s  {:6.1f} req/s  "
+              "{:3} retries  {:3} turned away".format(
+                  concurrency, scheduler.done, scheduler.failed, seconds,
+                  scheduler.done / seconds, scheduler.retries, rejected))
+
+    with JsonlStore(output) as store:
+        answered = bulkgen.answered(store)
+    print("resume: stopped after {}, skipped {} on resume, answered {} more; {} of {} prompts answered".format(
+        stopped.done, resumeSkipped, resumed.done, len(answered), len(items)))
+    return 0 if len(answered) == len(items) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--prompts", type=int, default=60)
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--rpm", type=int, default=600, help="limit the mock server enforces")
+    parser.add_argument("--errors", type=float, default=0.05, help="fraction of requests failing with 503")
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix="littera-bulk-")
+    try:
+        return asyncio.run(bench(args, folder))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
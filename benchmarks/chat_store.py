@@ -0,0 +1,87 @@
+"""
+Memory and row latency of the chat message store as history grows
+
+Fills a MessageStore in steps up to the full count, and at each step
+reads what the virtual list and the transcript would: a screen of rows at
+random scroll positions, and the window of messages around one of them.
+Reports the row latency and the Python memory held by the store, which
+should stay flat, next to what keeping every message in memory took, as
+the list control and transcript did before.
+
+Usage: python benchmarks/chat_store.py [-n MESSAGES] [--steps N] [--screens N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import chatstore  # noqa: E402
+
+
+# Rows on screen, and messages in the transcript as chatGUI shows them
+SCREEN = 30
+WINDOW = 40
+QUESTION = "How would you phrase the opening of chapter {} so that it reads more naturally?"
+ANSWER = ("Here is a longer answer so that the message has something to carry. " * 6).strip()
+
+
+def messages(start, end):
+    for number in range(start, end):
+        yield ("user", QUESTION.format(number)) if number % 2 == 0 else ("assistant", ANSWER)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--messages", type=int, default=100000)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--screens", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix="littera-chat-")
+    try:
+        tracemalloc.start()
+        store = chatstore.MessageStore(os.path.join(folder, "chat.sqlite"))
+        print("{:>9} {:>12} {:>12} {:>12} {:>14}".format(
+            "messages", "row (us)", "window (ms)", "store (KiB)", "in memory (KiB)"))
+        for step in range(1, args.steps + 1):
+            store.extend(messages(len(store), args.messages * step // args.steps))
+
+            # Memory as the widgets held it: every message as text
+            everything = [content for _, content in messages(0, len(store))]
+            held = sum(sys.getsizeof(content) for content in everything) + sys.getsizeof(everything)
+            del everything
+
+            rows = 0
+            start = time.perf_counter()
+            for _ in range(args.screens):
+                top = random.randrange(max(1, len(store) - SCREEN))
+                for index in range(top, min(top + SCREEN, len(store))):
+                    store[index]
+                    rows += 1
+            row = (time.perf_counter() - start) / rows
+
+            start = time.perf_counter()
+            for _ in range(args.screens):
+                index = random.randrange(len(store))
+                store.window(index - WINDOW // 2, index + WINDOW // 2)
+            window = (time.perf_counter() - start) / args.screens
+
+            print("{:>9} {:>12.1f} {:>12.2f} {:>12.0f} {:>14.0f}".format(
+                len(store), row * 1e6, window * 1000, tracemalloc.get_traced_memory()[0] / 1024, held / 1024))
+        store.close()
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(folder)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
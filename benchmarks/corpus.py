@@ -0,0 +1,88 @@
+"""
+Synthetic Markdown corpora for the benchmarks
+
+Documents are generated from a fixed seed so every run sees the same text.
+They mix what the editor's extensions handle (tables, fenced code, sane
+lists, smarty punctuation) with plain prose, headings and links.
+"""
+
+import random
+
+
+SIZES = {"small": 16 * 1024, "medium": 256 * 1024, "large": 1024 * 1024}
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud "
+         "exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute irure "
+         "reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint "
+         "occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim").split()
+
+
+def sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    roll = rng.random()
+    if roll < 0.15:
+        index = rng.randrange(len(words) - 2)
+        words[index:index + 2] = ['"' + words[index], words[index + 1] + '"']
+    elif roll < 0.25:
+        words.insert(rng.randrange(1, len(words)), "--")
+    elif roll < 0.35:
+        words[-1] += "'s"
+    elif roll < 0.45:
+        words[rng.randrange(len(words))] = "**" + rng.choice(WORDS) + "**"
+    elif roll < 0.5:
+        words[rng.randrange(len(words))] = "[link](https://example.com/{})".format(rng.randrange(100))
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + rng.choice([".", ".", "!", "?", "..."])
+
+
+def paragraph(rng):
+    return " ".join(sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def table(rng):
+    columns = rng.randint(2, 5)
+    lines = ["| " + " | ".join(rng.choice(WORDS).title() for _ in range(columns)) + " |",
+             "|" + "---|" * columns]
+    for _ in range(rng.randint(2, 8)):
+        lines.append("| " + " | ".join(str(rng.randrange(1000)) for _ in range(columns)) + " |")
+    return "\n".join(lines)
+
+
+def code(rng):
+    lines = ["```python", "def {}(items):".format(rng.choice(WORDS))]
+    for _ in range(rng.randint(2, 10)):
+        lines.append("    {} = {}(items)  # {}".format(
+            rng.choice(WORDS), rng.choice(WORDS), rng.choice(WORDS)))
+    lines += ["    return items", "```"]
+    return "\n".join(lines)
+
+
+def bullets(rng):
+    lines = []
+    ordered = rng.random() < 0.5
+    for index in range(1, rng.randint(3, 8)):
+        marker = "{}.".format(index) if ordered else "-"
+        lines.append("{} {}".format(marker, sentence(rng)))
+        if rng.random() < 0.2:
+            lines.append("    - {}".format(sentence(rng)))
+    return "\n".join(lines)
+
+
+def document(size, seed=0):
+    """Return a Markdown document of about size characters."""
+    rng = random.Random(seed)
+    blocks = []
+    length = 0
+    chapter = 0
+    while length < size:
+        if not blocks or rng.random() < 0.04:
+            chapter += 1
+            block = "# Chapter {}".format(chapter)
+        elif rng.random() < 0.12:
+            block = "## " + sentence(rng).rstrip(".!?")
+        else:
+            block = rng.choices((paragraph, table, code, bullets), (10, 1, 1, 2))[0](rng)
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks) + "\n"
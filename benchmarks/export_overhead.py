@@ -0,0 +1,59 @@
+"""
+Per-export overhead of the PDF template on small documents
+
+Compares re-reading the template and letting xhtml2pdf load its @font-face
+fonts for every document (as onExport used to) with the template prepared
+once per process and the fonts registered once.
+
+Usage: python benchmarks/export_overhead.py [-n EXPORTS]
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export  # noqa: E402
+
+
+SMALL = "# Note\n\nA *short* note with **bold** text, `code` and a [link](https://example.com).\n\n" \
+        "- one\n- two\n\n| a | b |\n|---|---|\n| 1 | 2 |\n"
+
+
+def per_export(function, count):
+    function()
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--exports", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    content = export.md2html(SMALL)
+
+    def unprepared():
+        with open(export.TEMPLATE, "r", encoding="utf-8") as options:
+            source = options.read() + content + export.FOOTER + "</body></html>"
+        export.html2pdf(source, io.BytesIO())
+
+    def prepared():
+        export.html2pdf(export.build_source(content), io.BytesIO())
+
+    before = per_export(unprepared, args.exports)
+    after = per_export(prepared, args.exports)
+
+    print("template read + @font-face per export: {:7.1f} ms".format(before * 1000))
+    print("prepared template, fonts registered once: {:4.1f} ms".format(after * 1000))
+    print("saved per export: {:.1f} ms ({:.0%})".format(
+        (before - after) * 1000, (before - after) / before))
+
+
+if __name__ == "__main__":
+    main()
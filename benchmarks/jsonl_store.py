@@ -0,0 +1,109 @@
+"""
+Append throughput and random-read latency of the JSONL record store
+
+Appends request/response records shaped like bulkgen's output under each
+fsync policy, then reads random ids through the offset index and, for
+comparison, by scanning the file for them. Also times opening the store
+with its index and without (a full scan), and compacting after a share of
+the records were written again.
+
+Usage: python benchmarks/jsonl_store.py [-n RECORDS] [--reads N] [--batch N]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import jsonlstore  # noqa: E402
+
+
+ANSWER = ("Here is a longer answer so that the record has something to carry. " * 8).strip()
+
+
+def record(number):
+    return {"id": "req-{:08d}".format(number), "error": None, "seconds": 0.5,
+            "messages": [{"role": "user", "content": "Question number {}?".format(number)}],
+            "answer": ANSWER, "usage": {"prompt_tokens": 12, "completion_tokens": 120, "total_tokens": 132}}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--records", type=int, default=200000)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix="littera-jsonl-")
+    records = [record(number) for number in range(args.records)]
+    try:
+        print("{:10} {:>10} {:>12} {:>10}".format("sync", "records", "records/s", "MB/s"))
+        for sync in ("never", "close", "flush"):
+            path = os.path.join(folder, sync + ".jsonl")
+            # fsync per batch is slow on some disks; a tenth of the records is enough to tell
+            count = args.records if sync != "flush" else max(1, args.records // 10)
+            start = time.perf_counter()
+            with jsonlstore.JsonlStore(path, sync=sync, batch=args.batch) as store:
+                store.extend(records[:count])
+            seconds = time.perf_counter() - start
+            print("{:10} {:>10} {:>12.0f} {:>10.1f}".format(
+                sync, count, count / seconds, os.path.getsize(path) / seconds / 1e6))
+
+        path = os.path.join(folder, "close.jsonl")
+        start = time.perf_counter()
+        store = jsonlstore.JsonlStore(path)
+        indexed = time.perf_counter() - start
+        store.close()
+        os.remove(jsonlstore.index_path(path))
+        start = time.perf_counter()
+        store = jsonlstore.JsonlStore(path)
+        scanned = time.perf_counter() - start
+        print("\nopen with index {:.0f} ms, rebuilding it {:.0f} ms ({} MB)".format(
+            indexed * 1000, scanned * 1000, os.path.getsize(path) // 1000000))
+
+        wanted = ["req-{:08d}".format(random.randrange(args.records)) for _ in range(args.reads)]
+        latencies = []
+        for ident in wanted:
+            start = time.perf_counter()
+            assert store.get(ident)["id"] == ident
+            latencies.append(time.perf_counter() - start)
+        print("get by id     p50 {:7.1f} us  p99 {:7.1f} us  mean {:7.1f} us".format(
+            percentile(latencies, 0.5) * 1e6, percentile(latencies, 0.99) * 1e6,
+            statistics.mean(latencies) * 1e6))
+
+        scans = []
+        for ident in wanted[:5]:
+            start = time.perf_counter()
+            with open(path, "rb") as file:
+                next(line for line in file if json.loads(line)["id"] == ident)
+            scans.append(time.perf_counter() - start)
+        print("scan for id   mean {:7.1f} ms over {} lookups".format(statistics.mean(scans) * 1000, len(scans)))
+
+        for number in random.sample(range(args.records), args.records // 4):
+            store.append(dict(records[number], seconds=1.0))
+        before = os.path.getsize(path)
+        start = time.perf_counter()
+        saved = store.compact()
+        print("\ncompact after rewriting 25%: {:.2f}s, {} of {} MB saved".format(
+            time.perf_counter() - start, saved // 1000000, before // 1000000))
+        store.close()
+    finally:
+        shutil.rmtree(folder)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Time to first token and UI updates of streamed answers
+
+Starts the mock chat completions server in-process with a known delay
+before the first token, streams a few answers through LLMClient and
+reports the time to first token the client sees on top of that delay,
+and how many UI updates the batching made of the tokens. Then asks again
+through a completion cache, once in turn and several times at once.
+
+Usage: python benchmarks/llm_stream.py [-n REQUESTS] [--tokens N] [--delay S]
+"""
+
+import os
+import sys
+import shutil
+import asyncio
+import tempfile
+import argparse
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import llm  # noqa: E402
+import llmcache  # noqa: E402
+import mockllm  # noqa: E402
+
+
+SERVER_TTFT = 0.1
+
+
+def ask(client, question, count=1):
+    """Send question count times at once; return [(stats, error)]."""
+    done = threading.Semaphore(0)
+    results = []
+
+    def onDone(stats, error):
+        results.append((stats, error))
+        done.release()
+
+    for _ in range(count):
+        client.submit([{"role": "user", "content": question}], lambda text: None, onDone)
+    for _ in range(count):
+        done.acquire(timeout=60)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--requests", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--delay", type=float, default=0.002, help="seconds between tokens")
+    args = parser.parse_args(argv)
+
+    server = mockllm.MockServer(SERVER_TTFT, args.delay, args.tokens)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    url = asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+
+    client = llm.LLMClient(apiBase=url, cache=False)
+    for number in range(args.requests):
+        stats, error = ask(client, "question {}".format(number))[0]
+        if error:
+            print("request failed:", error)
+            return 1
+        print("request {}  ttft {:6.1f} ms (+{:5.1f} ms client)  total {:6.0f} ms  "
+              "{} tokens in {} updates".format(
+                  number + 1, stats.ttft * 1000, (stats.ttft - SERVER_TTFT) * 1000,
+                  stats.seconds * 1000, stats.tokens, stats.updates))
+    client.stop()
+
+    folder = tempfile.mkdtemp(prefix="littera-completions-")
+    cache = llmcache.CompletionCache(os.path.join(folder, "completions.sqlite"))
+    client = llm.LLMClient(apiBase=url, cache=cache)
+    before = server.requests
+    for label, count in (("miss", 1), ("hit", 1), ("4 at once", 4)):
+        question = "cached question" if label != "4 at once" else "shared question"
+        results = ask(client, question, count)
+        print("{:10} ttft {}".format(label, "  ".join("{:6.1f} ms".format(stats.ttft * 1000)
+                                                     for stats, error in results)))
+    print("upstream calls: {} for 6 requests, cache hit rate {:.0%}, {} joined in flight".format(
+        server.requests - before, cache.hit_rate(), client.shared))
+    client.stop()
+    shutil.rmtree(folder)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
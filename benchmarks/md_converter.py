@@ -0,0 +1,73 @@
+"""
+Per-call cost of markdown.markdown() against a reused converter
+
+Converts small documents both ways, then renders the medium corpus cold
+through the block cache, which converts once per block.
+
+Usage: python benchmarks/md_converter.py [-n CALLS]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import markdown
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+import export  # noqa: E402
+import mdcache  # noqa: E402
+import converter  # noqa: E402
+
+
+SMALL = "# Note\n\nA *short* \"note\" -- with **bold** text, `code` and a [link](https://example.com).\n\n" \
+        "- one\n- two\n\n| a | b |\n|---|---|\n| 1 | 2 |\n"
+
+
+def per_call(function, text, count):
+    function(text)
+    start = time.perf_counter()
+    for _ in range(count):
+        function(text)
+    return (time.perf_counter() - start) / count
+
+
+def fresh(text, extensions=export.MD_EXTENSIONS):
+    return markdown.markdown(text, extensions=list(extensions))
+
+
+def pooled(text, extensions=export.MD_EXTENSIONS):
+    return converter.convert(text, extensions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--calls", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    for label, text in (("one line", "Hello, *world*..."), ("small note", SMALL)):
+        assert fresh(text) == pooled(text)
+        before = per_call(fresh, text, args.calls)
+        after = per_call(pooled, text, args.calls)
+        print("{:10}  markdown.markdown {:7.1f} us   reused {:6.1f} us   {:4.1f}x".format(
+            label, before * 1e6, after * 1e6, before / after))
+
+    md = corpus.document(corpus.SIZES["medium"])
+    blocks = len(mdcache.split_blocks(md))
+    timings = []
+    for function in (fresh, pooled):
+        mdcache.convert = function
+        start = time.perf_counter()
+        html = mdcache.BlockCache().render(md, export.MD_EXTENSIONS)
+        timings.append((time.perf_counter() - start, html))
+    assert timings[0][1] == timings[1][1]
+    print("cold preview of {} blocks: {:.0f} ms -> {:.0f} ms".format(
+        blocks, timings[0][0] * 1000, timings[1][0] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput of find and replace across many files
+
+Writes a folder of generated notes, previews a literal and a regex replace
+with one and with several workers, then applies and undoes one of them.
+
+Usage: python benchmarks/multi_replace.py [-n FILES] [--size CHARS] [-j WORKERS]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+import multireplace  # noqa: E402
+
+
+QUERIES = [multireplace.Query("dolore", "pain", False, False, False),
+           multireplace.Query(r"\*\*(\w+)\*\*", r"__\1__", False, False, True)]
+
+
+def write_files(folder, count, size):
+    for number in range(count):
+        subfolder = os.path.join(folder, "folder{}".format(number % 50))
+        os.makedirs(subfolder, exist_ok=True)
+        with open(os.path.join(subfolder, "note{}.md".format(number)), "w", encoding="utf-8") as file:
+            file.write(corpus.document(size, seed=number))
+
+
+def report(label, totals):
+    print("{:34} {:7.0f} ms  {:7} hits in {:5} files  {:6.1f} MiB/s".format(
+        label, totals.seconds * 1000, totals.hits, totals.matched,
+        totals.bytes / 1024 / 1024 / max(totals.seconds, 1e-9)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--files", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=16 * 1024)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix="littera-replace-")
+    data = tempfile.mkdtemp(prefix="littera-changesets-")
+    multireplace.FOLDER = data
+    try:
+        write_files(folder, args.files, args.size)
+        for query in QUERIES:
+            for workers in sorted({1, args.workers}):
+                found = multireplace.preview(folder, query, workers)
+                report("preview {!r} -j {}".format(query.text, workers), found.totals())
+
+        start = time.perf_counter()
+        changes = multireplace.apply(found, args.workers)
+        print("apply:  {:.0f} ms for {} files".format((time.perf_counter() - start) * 1000,
+                                                      len(changes.changed)))
+        start = time.perf_counter()
+        failed = changes.undo(args.workers)
+        print("undo:   {:.0f} ms, {} failed".format((time.perf_counter() - start) * 1000, len(failed)))
+    finally:
+        shutil.rmtree(folder)
+        shutil.rmtree(data)
+
+
+if __name__ == "__main__":
+    main()
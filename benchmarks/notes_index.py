@@ -0,0 +1,88 @@
+"""
+Build, refresh and query times of the notes index
+
+Writes a folder of generated notes, indexes it from scratch, refreshes it
+with nothing changed and with a few notes edited, then times queries.
+
+Usage: python benchmarks/notes_index.py [-n NOTES] [--size CHARS] [--keep DIR]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+import notes  # noqa: E402
+
+
+QUERIES = ["lorem", "topic17", '"magna aliqua"', "chapter AND topic3", "cons*", "topic1 OR topic2 NOT dolor"]
+
+
+def write_notes(folder, count, size):
+    for number in range(count):
+        subfolder = os.path.join(folder, "folder{}".format(number % 100))
+        os.makedirs(subfolder, exist_ok=True)
+        text = corpus.document(size, seed=number)
+        # Words that only some notes contain, so queries are selective
+        text += "\nTags: topic{} note{}\n".format(number % 500, number)
+        with open(os.path.join(subfolder, "note{}.md".format(number)), "w", encoding="utf-8") as file:
+            file.write(text)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--notes", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--keep", default=None, help="reuse or keep the notes in this folder")
+    args = parser.parse_args(argv)
+
+    folder = args.keep or tempfile.mkdtemp(prefix="littera-notes-")
+    try:
+        if not os.listdir(folder):
+            _, seconds = timed(write_notes, folder, args.notes, args.size)
+            print("wrote {} notes in {:.1f} s".format(args.notes, seconds))
+
+        database = os.path.join(tempfile.mkdtemp(prefix="littera-index-"), "notes.sqlite")
+        index = notes.NotesIndex(folder, database)
+        changes, seconds = timed(index.refresh)
+        print("build:            {:8.0f} ms  {}".format(seconds * 1000, changes))
+        changes, seconds = timed(index.refresh)
+        print("refresh, no-op:   {:8.0f} ms  {}".format(seconds * 1000, changes))
+
+        edited = sorted(os.path.join(root, name) for root, dirs, files in os.walk(folder)
+                        for name in files)[:10]
+        for path in edited:
+            with open(path, "a", encoding="utf-8") as file:
+                file.write("\nEdited again.\n")
+        changes, seconds = timed(index.refresh)
+        print("refresh, 10 edits:{:8.0f} ms  {}".format(seconds * 1000, changes))
+
+        for query in QUERIES:
+            index.search(query)
+            start = time.perf_counter()
+            for _ in range(20):
+                hits = index.search(query)
+            seconds = (time.perf_counter() - start) / 20
+            print("{:30} {:7.2f} ms  {} hits".format(query, seconds * 1000, len(hits)))
+        index.close()
+        shutil.rmtree(os.path.dirname(database))
+    finally:
+        if args.keep is None:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
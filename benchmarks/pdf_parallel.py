@@ -0,0 +1,77 @@
+"""
+Serial vs chapter-parallel PDF export
+
+Usage: python benchmarks/pdf_parallel.py [-c CHAPTERS] [-s SECTIONS] [-j WORKERS] [-r REPEAT]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export  # noqa: E402
+import chapters  # noqa: E402
+
+
+PARAGRAPH = "Lorem ipsum \"dolor\" sit amet -- consectetur adipiscing elit, sed do eiusmod... " * 8
+
+
+def synthetic_document(count, sections):
+    parts = []
+    for chapter in range(1, count + 1):
+        parts.append("# Chapter {}\n\n".format(chapter))
+        for section in range(1, sections + 1):
+            parts.append("## Section {}.{}\n\n".format(chapter, section))
+            parts.append((PARAGRAPH + "\n\n") * 4)
+            parts.append("| Key | Value |\n|-----|-------|\n| a | 1 |\n| b | 2 |\n\n")
+            parts.append("```\nfor item in items:\n\n    print(item)\n```\n\n")
+            parts.append("1. first\n2. second\n\n")
+    return "".join(parts)
+
+
+def pages(path):
+    from PyPDF2 import PdfFileReader
+    with open(path, "rb") as file:
+        return PdfFileReader(file).getNumPages()
+
+
+def best(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-c", "--chapters", type=int, default=16)
+    parser.add_argument("-s", "--sections", type=int, default=6)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-r", "--repeat", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    content = export.md2html(synthetic_document(args.chapters, args.sections))
+    with tempfile.TemporaryDirectory(prefix="littera-bench-") as folder:
+        serial = os.path.join(folder, "serial.pdf")
+        parallel = os.path.join(folder, "parallel.pdf")
+
+        serialTime = best(lambda: export.html2pdf(
+            export.build_source(content), serial), args.repeat)
+        parallelTime = best(lambda: chapters.html2pdf_parallel(
+            content, parallel, workers=args.workers, minimum=0), args.repeat)
+
+        print("document: {} chapters, {:.0f} KiB of HTML, {} CPU(s)".format(
+            args.chapters, len(content) / 1024, os.cpu_count()))
+        print("serial:   {:7.2f}s  {:4d} pages".format(serialTime, pages(serial)))
+        print("parallel: {:7.2f}s  {:4d} pages  ({} workers)".format(
+            parallelTime, pages(parallel), args.workers))
+    print("speedup:  {:7.2f}x".format(serialTime / parallelTime))
+
+
+if __name__ == "__main__":
+    main()
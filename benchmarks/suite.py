@@ -0,0 +1,233 @@
+"""
+Benchmark suite for the editor's hot paths
+
+Runs headless (no wx) on synthetic corpora of several sizes and times:
+
+    md2html        export.md2html, as used by export and batch conversion
+    preview-cold   the block cache rendering a document it has not seen
+    preview-edit   the block cache re-rendering after a one-character edit
+    find-first     indexing a buffer and searching it, as the first onFind
+    find-edit      searching again after a one-character edit
+    open / save    detecting the encoding and reading a file (chunked when
+                   large), and the atomic save used by the editor
+    pdf            html2pdf through options/pdf_options.html
+
+Each benchmark reports the best and median time, Markdown throughput and the
+peak of traced Python allocations. Results can be written as JSON and are
+compared with a stored baseline; a benchmark more than --tolerance slower
+(best time) or bigger (peak memory) than the baseline fails the run, and
+so does a missing baseline, since timings differ too much between machines
+to ship one: store one first with --save-baseline.
+
+Usage: python benchmarks/suite.py [-s SIZE ...] [-k PATTERN] [-r REPEAT] [-o FILE]
+                                  [--baseline FILE] [--save-baseline] [--tolerance T] [--no-pdf]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+import export  # noqa: E402
+import autosave  # noqa: E402
+import largefile  # noqa: E402
+from mdcache import BlockCache  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+
+BASELINE = os.path.join(HERE, "baseline.json")
+
+# PDF export is slow; by default only the smaller corpora are exported
+PDF_SIZES = ("small", "medium")
+
+# Slowdowns smaller than this are timer noise, whatever the ratio
+NOISE_S = 0.0005
+
+
+def edited(text):
+    middle = len(text) // 2
+    return text[:middle] + "x" + text[middle:]
+
+
+def benchmarks(md, size, folder, pdf=True):
+    """Yield (name, setup, run) for one corpus. setup() is not timed and
+    returns the argument passed to run()."""
+    extensions = export.MD_EXTENSIONS
+
+    yield "md2html", lambda: md, lambda text: export.md2html(text, extensions)
+
+    yield "preview-cold", BlockCache, lambda cache: cache.render(md, extensions)
+
+    def warmCache():
+        cache = BlockCache()
+        cache.render(md, extensions)
+        return cache
+    yield "preview-edit", warmCache, lambda cache: cache.render(edited(md), extensions)
+
+    def find(index, text=md):
+        index.update(text)
+        return index.find("dolor", word=True)
+    yield "find-first", SearchIndex, find
+
+    def warmIndex():
+        index = SearchIndex()
+        find(index)
+        return index
+    yield "find-edit", warmIndex, lambda index: find(index, edited(md))
+
+    path = os.path.join(folder, size + ".md")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(md)
+
+    def openFile(path):
+        encoding = largefile.detect_encoding(path)
+        if largefile.is_large(path):
+            loader = largefile.ChunkedLoader(path, encoding)
+            return "".join(loader)
+        with open(path, "r", encoding=encoding) as file:
+            return file.read()
+    yield "open", lambda: path, openFile
+
+    target = os.path.join(folder, size + "-saved.md")
+    yield "save", lambda: target, lambda target: autosave.atomic_write(target, md.encode("utf-8"))
+
+    if pdf:
+        source = export.build_source(export.md2html(md, extensions))
+        yield "pdf", io.BytesIO, lambda output: export.html2pdf(source, output)
+
+
+def measure(setup, run, repeat):
+    # One untimed run first: imports, template and font registration
+    run(setup())
+
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def run_suite(sizes, pattern=None, repeat=5, pdf=True):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="littera-bench-") as folder:
+        for size in sizes:
+            md = corpus.document(corpus.SIZES[size])
+            for name, setup, run in benchmarks(md, size, folder, pdf and size in PDF_SIZES):
+                key = name + "/" + size
+                if pattern and pattern not in key:
+                    continue
+
+                times, peak = measure(setup, run, 1 if name == "pdf" else repeat)
+                best = min(times)
+                results[key] = {"bytes": len(md.encode("utf-8")), "repeat": len(times),
+                                "best_s": best, "median_s": statistics.median(times),
+                                "mb_per_s": len(md.encode("utf-8")) / best / 1e6,
+                                "peak_kib": peak / 1024}
+                print_result(key, results[key])
+    return results
+
+
+def print_result(key, result):
+    print("{:22} {:10.2f} ms {:10.2f} ms {:9.2f} MB/s {:10.0f} KiB".format(
+        key, result["best_s"] * 1000, result["median_s"] * 1000,
+        result["mb_per_s"], result["peak_kib"]))
+
+
+def compare(results, baseline, tolerance):
+    """Return the keys that regressed against baseline, printing a table."""
+    regressions = []
+    print("\n{:22} {:>13} {:>13} {:>9}".format("vs baseline", "best", "peak", ""))
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            print("{:22} {:>13}".format(key, "new"))
+            continue
+
+        speed = result["best_s"] / before["best_s"]
+        memory = result["peak_kib"] / before["peak_kib"] if before["peak_kib"] else 1.0
+        slower = speed > 1 + tolerance and result["best_s"] - before["best_s"] > NOISE_S
+        failed = slower or memory > 1 + tolerance
+        if failed:
+            regressions.append(key)
+        print("{:22} {:>12.2f}x {:>12.2f}x {:>9}".format(
+            key, speed, memory, "REGRESSED" if failed else "ok"))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-s", "--sizes", nargs="+", choices=sorted(corpus.SIZES),
+                        default=["small", "medium", "large"])
+    parser.add_argument("-k", "--pattern", help="run only benchmarks whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="baseline JSON to compare with (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown or memory growth, as a fraction (default: 0.25)")
+    parser.add_argument("--no-pdf", action="store_true", help="skip the PDF export benchmarks")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger("xhtml2pdf").setLevel(logging.ERROR)
+
+    print("{:22} {:>13} {:>13} {:>14} {:>14}".format(
+        "benchmark", "best", "median", "throughput", "peak memory"))
+    results = run_suite(args.sizes, args.pattern, args.repeat, not args.no_pdf)
+
+    report = {"python": platform.python_version(), "platform": platform.platform(),
+              "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print("\nbaseline saved to", args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nno baseline at {}; run with --save-baseline to store one".format(args.baseline),
+              file=sys.stderr)
+        return 1
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n{} benchmark(s) regressed by more than {:.0%}: {}".format(
+            len(regressions), args.tolerance, ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Cost of editing and reading a buffer held as one string or as a TextModel
+
+Replays random single-character edits on a large document and compares
+what the editor did per keystroke before (a full copy of the buffer, and a
+prefix copy to find the current line) with the piece table.
+
+Usage: python benchmarks/text_model.py [--size NAME] [-n EDITS]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+import textmodel  # noqa: E402
+
+
+def edits(length, count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        position = rng.randrange(length)
+        if rng.random() < 0.8:
+            yield position, position, rng.choice("abc \n")
+            length += 1
+        else:
+            yield position, min(length, position + 1), ""
+            length -= min(length, position + 1) - position
+
+
+def as_string(text, changes):
+    lines = 0
+    for start, end, replacement in changes:
+        text = text[:start] + replacement + text[end:]
+        copy = "".join([text, ""])
+        lines += copy[:start].count("\n")
+    return text
+
+
+def as_model(text, changes):
+    model = textmodel.TextModel(text)
+    lines = 0
+    for start, end, replacement in changes:
+        model.replace(start, end, replacement)
+        snapshot = model.snapshot()
+        lines += snapshot.line_of(start)
+    return str(model.snapshot())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=sorted(corpus.SIZES), default="large")
+    parser.add_argument("-n", "--edits", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    text = corpus.document(corpus.SIZES[args.size])
+    changes = list(edits(len(text), args.edits))
+
+    results = []
+    for label, function in (("str copy", as_string), ("TextModel", as_model)):
+        start = time.perf_counter()
+        results.append(function(text, changes))
+        seconds = time.perf_counter() - start
+        print("{:10} {:8.1f} us per edit".format(label, seconds / args.edits * 1e6))
+    assert results[0] == results[1]
+
+    model = textmodel.TextModel(text)
+    for start, end, replacement in changes:
+        model.replace(start, end, replacement)
+    snapshot = model.snapshot()
+    for label, function in (("slice 4K", lambda: snapshot.slice(len(snapshot) // 2, len(snapshot) // 2 + 4096)),
+                            ("full text", lambda: str(snapshot))):
+        start = time.perf_counter()
+        for _ in range(100):
+            function()
+        print("{:10} {:8.1f} us".format(label, (time.perf_counter() - start) / 100 * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Headless bulk generation
+
+Reads prompts from a JSONL file and sends them to the chat completions API
+with a bounded number of requests in flight over one pooled HTTP session,
+keeping under requests- and tokens-per-minute limits. Answers are appended
+to the output, a JsonlStore, as they complete, so the output is also the
+checkpoint: running again with the same output skips every prompt already
+answered and retries the ones that failed.
+
+Each input line is a JSON object with "messages", or with "prompt" or
+"body" (then "title", if present, goes first); its id is "id" or
+"request_id", else its line number.
+
+A 429 or a server error is retried with exponential backoff, or after
+its Retry-After. A 429 with Retry-After pauses the limiter for that long,
+for every request, and it starts again at the configured rate; one
+without it halves the rate, at most once a second so a burst of them
+counts once, and each success brings back a quarter of the rate it is at.
+
+Usage: python -m bulkgen PROMPTS -o OUTPUT [-c CONCURRENCY] [--rpm N] [--tpm N]
+                         [--model NAME] [--api-base URL] [--max-tokens N]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import llm
+from jsonlstore import JsonlStore
+
+
+MAX_ATTEMPTS = 6
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+# The limiter slows to this fraction on a 429 without Retry-After, at most
+# once per SLOWDOWN_INTERVAL seconds, and grows by this factor per success
+SLOWDOWN = 0.5
+SLOWDOWN_INTERVAL = 1.0
+RECOVERY = 1.25
+MIN_RATE = 0.05
+# Answers written and fsynced together; a crash loses at most one batch
+OUTPUT_BATCH = 16
+
+
+def estimate_tokens(messages, maxTokens):
+    # About four characters a token; counted in full until usage comes back
+    return sum(len(message.get("content") or "") for message in messages) // 4 + maxTokens
+
+
+def read_prompts(path):
+    """Yield (id, messages) of every prompt in a JSONL file."""
+    with open(path, "r", encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            ident = str(item.get("id", item.get("request_id", number)))
+            messages = item.get("messages")
+            if messages is None:
+                text = item.get("prompt") or item.get("body") or ""
+                if item.get("title"):
+                    text = item["title"] + "\n\n" + text
+                messages = [{"role": "user", "content": text}]
+            yield ident, messages
+
+
+def answered(store):
+    """Return the ids whose latest record in store is an answer."""
+    return {record["id"] for record in store.records(latest=True) if record.get("error") is None}
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, with a rate that
+    shrinks on rate-limit errors and grows back on success, and a pause for
+    when the server says how long to wait."""
+
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.scale = 1.0
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.resumeAt = 0.0
+        self.slowed = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        # Nothing builds up while paused, so the end of a pause is no burst
+        now = time.monotonic()
+        elapsed = max(0.0, now - max(self.updated, self.resumeAt))
+        self.updated = now
+        if self.rpm:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm * self.scale / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm * self.scale / 60)
+
+    async def acquire(self, tokens):
+        # One waiter at a time, so requests go out in the order they asked
+        async with self.lock:
+            while True:
+                self._refill()
+                wait = self.resumeAt - time.monotonic()
+                if self.rpm and self.requests < 1:
+                    wait = (1 - self.requests) * 60 / (self.rpm * self.scale)
+                # A request larger than the whole bucket goes once it is full
+                need = min(tokens, self.tpm)
+                if self.tpm and self.tokens < need:
+                    wait = max(wait, (need - self.tokens) * 60 / (self.tpm * self.scale))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self.requests -= 1
+            if self.tpm:
+                self.tokens -= tokens
+
+    def settle(self, estimated, actual):
+        """Give back tokens that were reserved but not used, or take more."""
+        if self.tpm:
+            self.tokens += estimated - actual
+
+    def pause(self, seconds):
+        """Send nothing for seconds; the rate is left as it is."""
+        self._refill()
+        self.resumeAt = max(self.resumeAt, time.monotonic() + seconds)
+        self.requests = min(self.requests, 0.0)
+
+    def slow_down(self):
+        now = time.monotonic()
+        if now - self.slowed >= SLOWDOWN_INTERVAL:
+            self.slowed = now
+            self.scale = max(MIN_RATE, self.scale * SLOWDOWN)
+
+    def speed_up(self):
+        self.scale = min(1.0, self.scale * RECOVERY)
+
+
+def retry_after(error):
+    """Return the seconds error's Retry-After header asks for, or None."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return min(MAX_BACKOFF, max(0.0, float(headers.get("retry-after") or headers.get("Retry-After"))))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(error, attempt):
+    delay = retry_after(error)
+    if delay is None:
+        # Full jitter, so retries from many workers do not line up
+        delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
+    return delay
+
+
+class Scheduler:
+    def __init__(self, output, concurrency=8, rpm=0, tpm=0, model=llm.MODEL,
+                 apiBase=llm.API_BASE, apiKey=None, maxTokens=512, params=None):
+        self.output = output
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rpm, tpm)
+        self.model = model
+        self.apiBase = apiBase
+        self.apiKey = apiKey or os.environ.get("OPENAI_API_KEY") or ("mock" if apiBase else None)
+        self.maxTokens = maxTokens
+        self.params = params or {}
+
+        self.done = 0
+        self.failed = 0
+        self.retries = 0
+        self.usedTokens = 0
+
+    async def request(self, messages):
+        import openai
+
+        estimated = estimate_tokens(messages, self.maxTokens)
+        for attempt in range(MAX_ATTEMPTS):
+            await self.limiter.acquire(estimated)
+            try:
+                response = await openai.ChatCompletion.acreate(
+                    model=self.model, messages=messages, max_tokens=self.maxTokens,
+                    api_key=self.apiKey, api_base=self.apiBase, request_timeout=llm.TIMEOUT, **self.params)
+            except (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                    openai.error.APIConnectionError, openai.error.Timeout, openai.error.TryAgain,
+                    openai.error.APIError) as error:
+                self.limiter.settle(estimated, 0)
+                status = getattr(error, "http_status", None)
+                if isinstance(error, openai.error.APIError) and status is not None and status < 500 \
+                        and not isinstance(error, openai.error.RateLimitError):
+                    raise
+                if isinstance(error, openai.error.RateLimitError):
+                    # Paced by Retry-After when the server gives one
+                    if retry_after(error) is not None:
+                        self.limiter.pause(retry_after(error))
+                    else:
+                        self.limiter.slow_down()
+                if attempt + 1 == MAX_ATTEMPTS:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(retry_delay(error, attempt))
+                continue
+
+            usage = response.get("usage") or {}
+            used = usage.get("total_tokens", estimated)
+            self.limiter.settle(estimated, used)
+            self.limiter.speed_up()
+            self.usedTokens += used
+            return response["choices"][0]["message"]["content"], usage
+        raise RuntimeError("unreachable")
+
+    async def worker(self, queue, write):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            ident, messages = item
+            start = time.perf_counter()
+            record = {"id": ident}
+            try:
+                record["answer"], record["usage"] = await self.request(messages)
+                record["error"] = None
+                self.done += 1
+            except Exception as error:
+                record["error"] = str(error) or type(error).__name__
+                self.failed += 1
+            record["seconds"] = round(time.perf_counter() - start, 3)
+            write(record)
+
+    async def run(self, prompts):
+        import openai
+        import aiohttp
+
+        with JsonlStore(self.output, sync="flush", batch=OUTPUT_BATCH) as store:
+            skip = answered(store)
+            todo = [(ident, messages) for ident, messages in prompts if ident not in skip]
+
+            # One pooled session: connections are kept open and reused
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                openai.aiosession.set(session)
+
+                def write(record):
+                    # In completion order
+                    store.append(record)
+                    print("{:8.3f}s  {}  ({})".format(
+                        record["seconds"], record["id"], "ok" if record["error"] is None else record["error"]))
+
+                queue = asyncio.Queue()
+                for item in todo:
+                    queue.put_nowait(item)
+                workers = [asyncio.ensure_future(self.worker(queue, write))
+                           for _ in range(max(1, min(self.concurrency, len(todo))))]
+                for _ in workers:
+                    queue.put_nowait(None)
+                await asyncio.gather(*workers)
+        return len(skip), len(todo)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m bulkgen", description="Send a JSONL file of prompts to the chat completions API.")
+    parser.add_argument("prompts", help="JSONL file with one prompt per line")
+    parser.add_argument("-o", "--output", required=True,
+                        help="JSONL file the answers are appended to; also the checkpoint")
+    parser.add_argument("-c", "--concurrency", type=int, default=8,
+                        help="requests in flight at once (default: 8)")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute (default: no limit)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute (default: no limit)")
+    parser.add_argument("--model", default=llm.MODEL)
+    parser.add_argument("--api-base", default=llm.API_BASE,
+                        help="API base URL, e.g. of mockllm (default: LITTERA_LLM_BASE or the OpenAI API)")
+    parser.add_argument("--max-tokens", type=int, default=512, help="answer length limit (default: 512)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scheduler = Scheduler(args.output, args.concurrency, args.rpm, args.tpm, args.model,
+                          args.api_base, maxTokens=args.max_tokens)
+
+    start = time.perf_counter()
+    skipped, total = asyncio.run(scheduler.run(read_prompts(args.prompts)))
+    elapsed = time.perf_counter() - start
+    print("{} answered, {} failed, {} already done; {} retries; {:.2f}s: {:.1f} requests/min, "
+          "{:.0f} tokens/min".format(scheduler.done, scheduler.failed, skipped, scheduler.retries, elapsed,
+                                     scheduler.done / elapsed * 60, scheduler.usedTokens / elapsed * 60))
+    return 1 if scheduler.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Chapter-parallel PDF rendering
+
+xhtml2pdf renders on a single core and slows down more than linearly on long
+documents. Here the HTML is split at its top-level headings, the chunks are
+rendered in parallel processes and merged with PyPDF2. Page numbers are
+stamped onto the merged document and the table of contents is rebuilt from
+the headings each chunk reported, so both follow the final page order.
+Each chunk starts on a new page.
+"""
+
+import io
+import os
+import re
+import html
+import multiprocessing
+
+from PyPDF2 import PdfFileMerger, PdfFileReader
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+from reportlab.pdfgen import canvas
+
+import export
+import fonts
+
+
+# Below this size the serial path is faster than starting a pool
+PARALLEL_MIN = 200000
+
+HEADING_RE = re.compile(r"<h([1-6])[\s>]")
+CONTAINER_RE = re.compile(
+    r"<(/?)(blockquote|ul|ol|dl|div|table|pre)[\s>]", re.IGNORECASE)
+
+FOOTER_FONT = ("Noto Serif", os.path.join(
+    fonts.FONT_DIR, "serif", "NotoSerif-Regular.ttf"))
+FOOTER_SIZE = 12
+
+
+def split_chapters(content):
+    """Split rendered HTML before each top-level heading outside containers."""
+    levels = [int(m.group(1)) for m in HEADING_RE.finditer(content)]
+    if not levels:
+        return [content]
+    top = "<h" + str(min(levels))
+
+    cuts = []
+    depth = 0
+    tags = sorted([(m.start(), m) for m in CONTAINER_RE.finditer(content)] +
+                  [(m.start(), None) for m in HEADING_RE.finditer(content)
+                   if content.startswith(top, m.start())], key=lambda t: t[0])
+    for position, match in tags:
+        if match is None:
+            if depth == 0 and position > 0:
+                cuts.append(position)
+        elif match.group(1):
+            depth = max(0, depth - 1)
+        else:
+            depth += 1
+
+    bounds = [0] + cuts + [len(content)]
+    return [content[a:b] for a, b in zip(bounds, bounds[1:]) if content[a:b].strip()]
+
+
+def group_chapters(chapters, parts):
+    """Join consecutive chapters into at most `parts` chunks of similar size."""
+    if len(chapters) <= parts:
+        return chapters
+
+    target = sum(map(len, chapters)) / parts
+    chunks = []
+    current = []
+    size = 0
+    for chapter in chapters:
+        current.append(chapter)
+        size += len(chapter)
+        if size >= target and len(chunks) < parts - 1:
+            chunks.append("".join(current))
+            current = []
+            size = 0
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def render_chunk(chunk, template):
+    """Render one chunk; returns (pdf bytes, toc entries, pisa errors)."""
+    toc = []
+    out = io.BytesIO()
+    err = export.html2pdf(export.get_template(template).chunk(chunk),
+                          out, template, toc=toc)
+    return out.getvalue(), toc, err
+
+
+def toc_html(entries):
+    rows = []
+    for level, text, page in entries:
+        rows.append('<tr><td style="padding-left: {}pt;">{}</td>'
+                    '<td style="text-align: right; width: 48pt;">{}</td></tr>'.format(
+                        12 * level, html.escape(text), page))
+    return "<div><table>" + "".join(rows) + "</table></div>"
+
+
+def footer_position(template, height):
+    left, top = export.get_template(template).footer
+    return left, height - top - FOOTER_SIZE * 1.07
+
+
+def page_numbers(sizes, template):
+    """Return a pdf with only a page number in the footer of each page."""
+    font = fonts.register_face(*FOOTER_FONT)
+
+    out = io.BytesIO()
+    stamp = canvas.Canvas(out)
+    for number, (width, height) in enumerate(sizes, 1):
+        stamp.setPageSize((width, height))
+        stamp.setFont(font, FOOTER_SIZE)
+        stamp.drawString(*footer_position(template, height), str(number))
+        stamp.showPage()
+    stamp.save()
+    out.seek(0)
+    return out
+
+
+def stamp_page(page, stamp, name):
+    """Draw the stamp page over page as a form xobject.
+
+    PyPDF2's mergePage re-parses both content streams, which dominates the
+    merge time on long documents; wrapping the original content in q/Q and
+    appending a Do operator does not need to look at it at all.
+    """
+    form = DecodedStreamObject()
+    form.setData(stamp.getContents().getData())
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): stamp.mediaBox,
+        NameObject("/Resources"): stamp["/Resources"],
+    })
+
+    # Resources can be shared between pages, so each page gets its own copy
+    resources = DictionaryObject(page["/Resources"].getObject())
+    xobjects = DictionaryObject(resources["/XObject"].getObject()
+                                if "/XObject" in resources else {})
+    xobjects[NameObject(name)] = form
+    resources[NameObject("/XObject")] = xobjects
+    page[NameObject("/Resources")] = resources
+
+    before = DecodedStreamObject()
+    before.setData(b"q\n")
+    after = DecodedStreamObject()
+    after.setData(("\nQ q " + name + " Do Q\n").encode("ascii"))
+
+    contents = page.raw_get("/Contents")
+    if isinstance(contents.getObject(), ArrayObject):
+        contents = list(contents.getObject())
+    else:
+        contents = [contents]
+    page[NameObject("/Contents")] = ArrayObject([before] + contents + [after])
+
+
+def page_count(data):
+    return PdfFileReader(io.BytesIO(data)).getNumPages()
+
+
+def render_chunks(chunks, template, workers, progress=None, cache=None):
+    """Render chunks, reusing cached fragments; returns one
+    (pdf bytes, toc entries, pisa errors) tuple per chunk."""
+    keys = [cache.key(chunk, template) if cache else None for chunk in chunks]
+    results = [cache.get(key) if cache else None for key in keys]
+    missing = [index for index, result in enumerate(results) if result is None]
+
+    pages = sum(page_count(result[0]) for result in results if result)
+    if progress and pages:
+        progress("PAGE", pages)
+
+    def store(index, result):
+        results[index] = result
+        if cache:
+            cache.put(keys[index], *result)
+        if progress:
+            progress("PAGE", pages + page_count(result[0]))
+        return page_count(result[0])
+
+    if len(missing) > 1 and workers > 1:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(min(workers, len(missing))) as pool:
+            pending = [(index, pool.apply_async(render_chunk, (chunks[index], template)))
+                       for index in missing]
+            for index, result in pending:
+                pages += store(index, result.get())
+    else:
+        for index in missing:
+            pages += store(index, render_chunk(chunks[index], template))
+
+    return results
+
+
+def html2pdf_parallel(content, output, template=export.TEMPLATE, workers=None,
+                      progress=None, minimum=PARALLEL_MIN, cache=None):
+    """Render content with the template across a process pool; returns the
+    pisa error count like export.html2pdf.
+
+    With a pdfcache.FragmentCache every chapter is its own chunk, so that
+    unchanged chapters are taken from the cache on the next export.
+    """
+    workers = workers or os.cpu_count() or 1
+    if cache is None:
+        chunks = group_chapters(split_chapters(content), workers * 2)
+    else:
+        chunks = split_chapters(content)
+
+    if len(chunks) < 2 or len(content) < minimum or (workers < 2 and cache is None):
+        return export.html2pdf(export.build_source(content, template), output, template, progress)
+
+    results = render_chunks(chunks, template, workers, progress, cache)
+
+    err = 0
+    entries = []
+    pages = 0
+    for data, toc, chunkErr in results:
+        entries += [(level, text, page + pages) for level, text, page in toc]
+        pages += page_count(data)
+        err += chunkErr
+
+    # The table of contents goes last, as in the serial layout, so the
+    # pages it lists are already final
+    results += render_chunks([toc_html(entries) + export.CREDIT], template, 1, cache=cache)
+    err += results[-1][2]
+
+    merger = PdfFileMerger(strict=False)
+    for data, _, _ in results:
+        merger.append(io.BytesIO(data), import_bookmarks=True)
+
+    pages = [merged.pagedata for merged in merger.pages]
+    numbers = PdfFileReader(page_numbers(
+        [(float(page.mediaBox.getWidth()), float(page.mediaBox.getHeight())) for page in pages], template))
+    for number, page in enumerate(pages):
+        stamp_page(page, numbers.getPage(number), "/LitteraPageNumber")
+
+    if isinstance(output, str):
+        with open(output, "w+b") as file:
+            merger.write(file)
+    else:
+        merger.write(output)
+    merger.close()
+    return err
@@ -1,6 +1,40 @@
+import time
+
 import wx
 import wx.xrc
 
+import llm
+from chatstore import MessageStore
+
+# Messages shown around the selected one, and sent along with a question
+WINDOW = 40
+CONTEXT = 20
+PREVIEW = 200
+
+
+class MessageList(wx.ListCtrl):
+    """Virtual list of the messages in a MessageStore; rows are read from
+    the store only as they come into view."""
+
+    def __init__(self, parent, store):
+        super().__init__(parent, wx.ID_ANY, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL)
+        self.store = store
+        self.InsertColumn(0, "Role", width=70)
+        self.InsertColumn(1, "Message", width=300)
+        self.SetItemCount(len(store))
+
+    def OnGetItemText(self, item, column):
+        message = self.store[item]
+        if column == 0:
+            return message.role
+        return message.content[:PREVIEW].replace("\n", " ")
+
+    def refresh(self):
+        self.SetItemCount(len(self.store))
+        if len(self.store):
+            self.RefreshItem(len(self.store) - 1)
+
+
 class ChatInterface(wx.Frame):
     def __init__(self, parent):
         wx.Frame.__init__(self, parent, id=wx.ID_ANY, title="Chat Interface", pos=wx.DefaultPosition,
@@ -10,8 +44,10 @@ class ChatInterface(wx.Frame):
 
         bSizer1 = wx.BoxSizer(wx.HORIZONTAL)
 
-        self.chat_list_ctrl = wx.ListCtrl(self, wx.ID_ANY, wx.DefaultPosition, wx.DefaultSize,
-                                          wx.LC_REPORT)
+        # The history lives on disk; the list and the transcript hold only
+        # what is on screen
+        self.store = MessageStore()
+        self.chat_list_ctrl = MessageList(self, self.store)
         bSizer1.Add(self.chat_list_ctrl, 1, wx.ALL | wx.EXPAND, 5)
 
         bSizer2 = wx.BoxSizer(wx.VERTICAL)
@@ -27,13 +63,28 @@ class ChatInterface(wx.Frame):
         bSizer1.Add(bSizer2, 1, wx.EXPAND, 5)
 
         self.SetSizer(bSizer1)
+        self.statusbar = self.CreateStatusBar()
         self.Layout()
 
+        # Questions sent from this window carry the conversation since it
+        # opened, up to CONTEXT messages
+        self.sessionStart = len(self.store)
+        # Index of the first message in the transcript; it follows the end
+        # of the history unless a message is selected
+        self.windowStart = 0
+        self.following = True
+        self.llm = llm.LLMClient()
+        self.request = None
+        self.answer = []
+        self.start = 0.0
+        self.showWindow(len(self.store) - 1)
+
         self.Centre(wx.BOTH)
 
         # Event Handlers
         self.Bind(wx.EVT_CLOSE, self.OnClose)
         self.question_text_ctrl.Bind(wx.EVT_TEXT_ENTER, self.OnEnter)
+        self.chat_list_ctrl.Bind(wx.EVT_LIST_ITEM_SELECTED, self.OnSelect)
 
     def __del__(self):
         pass
@@ -46,15 +97,88 @@ class ChatInterface(wx.Frame):
         result = dlg.ShowModal()
         dlg.Destroy()
         if result == wx.ID_OK:
+            if self.request is not None:
+                self.request.cancel()
+            self.llm.stop()
+            self.store.close()
             self.Destroy()
 
+    def showWindow(self, index):
+        """Fill the transcript with the messages around index."""
+        self.windowStart = max(0, min(index - WINDOW // 2, len(self.store) - WINDOW))
+        messages = self.store.window(self.windowStart, self.windowStart + WINDOW)
+        self.chat_text_ctrl.SetValue("".join(message.content + "\n" for message in messages))
+        if 0 <= index - self.windowStart < len(messages):
+            position = sum(len(message.content) + 1 for message in messages[:index - self.windowStart])
+            self.chat_text_ctrl.ShowPosition(position)
+
+    def OnSelect(self, event):
+        index = event.GetIndex()
+        self.following = index == len(self.store) - 1
+        self.showWindow(index)
+        if self.following and self.request is not None:
+            # The answer streaming in is not in the store yet
+            self.chat_text_ctrl.AppendText("".join(self.answer))
+
+    def addMessage(self, role, content):
+        index = self.store.append(role, content)
+        self.chat_list_ctrl.refresh()
+        if self.following:
+            self.chat_list_ctrl.EnsureVisible(index)
+        return index
+
     def OnEnter(self, event):
-        # This is where you can use the GPT model to process the entered text
-        # For now we just add it to the chat list and the text control
         question = self.question_text_ctrl.GetValue()
-        self.chat_list_ctrl.InsertItem(self.chat_list_ctrl.GetItemCount(), question)
-        self.chat_text_ctrl.AppendText(question + '\n')
+        if not question.strip() or self.request is not None:
+            return
         self.question_text_ctrl.Clear()
+        index = self.addMessage("user", question)
+
+        # Asking goes back to the end of the history
+        if not self.following or index - self.windowStart >= WINDOW:
+            self.following = True
+            self.showWindow(index)
+        else:
+            self.chat_text_ctrl.AppendText(question + '\n')
+
+        messages = [{"role": message.role, "content": message.content}
+                    for message in self.store.window(max(self.sessionStart, index + 1 - CONTEXT), index + 1)]
+        self.answer = []
+        self.start = time.perf_counter()
+        self.statusbar.SetStatusText("Waiting for the answer...")
+        self.request = self.llm.submit(
+            messages,
+            lambda text: wx.CallAfter(self.OnAnswerText, text),
+            lambda stats, error: wx.CallAfter(self.OnAnswerDone, stats, error))
+
+    def OnAnswerText(self, text):
+        if not self:
+            return
+        if not self.answer:
+            self.statusbar.SetStatusText("First token after {:.0f} ms".format(
+                (time.perf_counter() - self.start) * 1000))
+        self.answer.append(text)
+        if self.following:
+            self.chat_text_ctrl.AppendText(text)
+
+    def OnAnswerDone(self, stats, error):
+        if not self:
+            return
+        self.request = None
+        if error is not None:
+            if self.following:
+                self.chat_text_ctrl.AppendText('\n')
+            self.statusbar.SetStatusText("Answer failed: " + error)
+            return
+        index = self.addMessage("assistant", "".join(self.answer))
+        if self.following:
+            if index - self.windowStart >= WINDOW:
+                self.showWindow(index)
+            else:
+                self.chat_text_ctrl.AppendText('\n')
+        self.statusbar.SetStatusText("{} tokens{}, first after {:.0f} ms, {:.0f} tokens/s, cache hit rate {:.0%}".format(
+            stats.tokens, " from cache" if stats.cached else "", (stats.ttft or 0) * 1000,
+            stats.tokens / max(stats.seconds, 1e-9), self.llm.cache.hit_rate()))
 
 
 app = wx.App(False)
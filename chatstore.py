@@ -0,0 +1,97 @@
+"""
+On-disk store of chat messages
+
+Messages are rows of a SQLite table numbered from 0 in the order they were
+added, so the row behind a list item is found through the primary key
+whatever the length of the history. Rows are read a page at a time and the
+last few pages are kept, which is what a virtual list asks for while it
+scrolls: the same handful of neighbouring rows, over and over.
+"""
+
+import os
+import time
+import sqlite3
+import collections
+
+import appdirs
+
+
+PATH = os.path.join(appdirs.user_data_dir("Littera"), "chat.sqlite")
+PAGE = 200
+PAGES = 8
+
+Message = collections.namedtuple("Message", "index role content created")
+
+
+class MessageStore:
+    def __init__(self, path=PATH, page=PAGE, pages=PAGES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY,"
+                        " role TEXT, content TEXT, created REAL)")
+        self.page = page
+        self.pages = pages
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.count = self.db.execute("SELECT coalesce(max(id) + 1, 0) FROM messages").fetchone()[0]
+
+    def __len__(self):
+        return self.count
+
+    def append(self, role, content):
+        """Add a message; returns its index."""
+        index = self.count
+        with self.db:
+            self.db.execute("INSERT INTO messages VALUES (?, ?, ?, ?)", (index, role, content, time.time()))
+        self.count += 1
+        # The last page is cached short; it is read again when next wanted
+        self.cache.pop(index // self.page, None)
+        return index
+
+    def extend(self, messages):
+        """Add (role, content) pairs in one transaction."""
+        now = time.time()
+        start = self.count
+        rows = [(start + offset, role, content, now) for offset, (role, content) in enumerate(messages)]
+        with self.db:
+            self.db.executemany("INSERT INTO messages VALUES (?, ?, ?, ?)", rows)
+        self.count += len(rows)
+        self.cache.pop(start // self.page, None)
+
+    def _page(self, number):
+        page = self.cache.get(number)
+        if page is not None:
+            self.hits += 1
+            self.cache.move_to_end(number)
+            return page
+        self.misses += 1
+        start = number * self.page
+        page = [Message(*row) for row in self.db.execute(
+            "SELECT id, role, content, created FROM messages WHERE id >= ? AND id < ? ORDER BY id",
+            (start, start + self.page))]
+        self.cache[number] = page
+        if len(self.cache) > self.pages:
+            self.cache.popitem(last=False)
+        return page
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self._page(index // self.page)[index % self.page]
+
+    def window(self, start, end):
+        """Return the messages from start up to end."""
+        start = max(0, start)
+        end = min(end, self.count)
+        messages = []
+        for number in range(start // self.page, (end - 1) // self.page + 1 if end > start else 0):
+            first = number * self.page
+            messages.extend(self._page(number)[max(start - first, 0):end - first])
+        return messages
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,43 @@
+"""
+Reusable Markdown converters
+
+markdown.markdown() builds a new Markdown object, and with it every
+extension, for each call. The preview renders a document block by block, so
+that setup cost is paid once per block. Here each thread (and so each
+export or batch process) keeps one prepared Markdown instance per extension
+set and resets it between documents.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+# Extension sets kept per thread; the editor uses one, batch runs a few
+MAX_CONVERTERS = 8
+
+local = threading.local()
+
+
+def get_converter(extensions=()):
+    """Return this thread's Markdown instance for extensions."""
+    import markdown
+
+    key = tuple(extensions)
+    converters = getattr(local, "converters", None)
+    if converters is None:
+        converters = local.converters = OrderedDict()
+
+    converter = converters.get(key)
+    if converter is None:
+        converter = converters[key] = markdown.Markdown(extensions=list(extensions))
+        if len(converters) > MAX_CONVERTERS:
+            converters.popitem(last=False)
+    else:
+        converters.move_to_end(key)
+    return converter
+
+
+def convert(text, extensions=()):
+    """Same result as markdown.markdown(text, extensions=extensions)."""
+    # Reset first, so a conversion that raised leaves no state behind
+    return get_converter(extensions).reset().convert(text)
@@ -0,0 +1,277 @@
+"""
+Markdown to HTML and PDF conversion
+
+Shared by the editor and the headless batch converter, so this module must
+not import wx. markdown, xhtml2pdf and reportlab are imported on first use,
+which keeps them out of the editor's startup.
+"""
+
+import os
+import re
+import html
+import sys
+import queue
+import signal
+import threading
+import contextlib
+import multiprocessing
+
+import converter
+
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE = os.path.join(BASEDIR, "options", "pdf_options.html")
+
+MD_EXTENSIONS = ['tables', 'sane_lists', 'fenced_code', 'smarty']
+
+TOC = "<div><pdf:toc/></div>"
+CREDIT = "<div><pdf:spacer height=""20pt""><hr><p>Made with <span style=""font-weight:bold;"">Littera Note-taking App</span></p></div>"
+FOOTER = "<pdf:nextpage/>" + TOC + CREDIT
+
+FONT_FACE_RE = re.compile(r"@font-face\s*{([^}]*)}", re.IGNORECASE)
+PAGENUMBER_RE = re.compile(r"<pdf:pagenumber\s*/?>(\s*</pdf:pagenumber>)?")
+FRAME_RE = re.compile(r"@frame\s+footer_frame\s*{([^}]*)}")
+
+HTML_PAGE = "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"UTF-8\">\n" \
+            "<title>{title}</title>\n</head>\n<body>\n{content}\n</body>\n</html>\n"
+
+
+def md2html(md, extensions=MD_EXTENSIONS):
+    return converter.convert(md, extensions)
+
+
+class Template:
+    """The PDF template, read and prepared once per process.
+
+    @font-face rules are taken out of the markup and their fonts registered
+    with reportlab here, so xhtml2pdf does not load them for every document.
+    """
+
+    def __init__(self, path=TEMPLATE):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as options:
+            self.text = options.read()
+
+        resolve = link_callback(path)
+        self.faces = []
+        for rule in FONT_FACE_RE.findall(self.text):
+            props = dict((name.strip().lower(), value.strip().strip("\"'"))
+                         for name, _, value in (item.partition(":") for item in rule.split(";"))
+                         if value.strip())
+            src = re.search(r"url\([\"']?([^\"')]+)", props.get("src", ""))
+            if "font-family" in props and src:
+                self.faces.append((props["font-family"], resolve(src.group(1), None),
+                                   int(props.get("font-weight", "") == "bold"),
+                                   int(props.get("font-style", "") == "italic")))
+
+        if all(os.path.exists(face[1]) for face in self.faces):
+            self.head = FONT_FACE_RE.sub("", self.text)
+        else:
+            # Let xhtml2pdf report the missing files as it always has
+            self.faces = []
+            self.head = self.text
+
+        # Chunks of a chapter-parallel export get their page numbers later
+        self.chunkHead = PAGENUMBER_RE.sub("", self.head)
+
+        self.footer = [56.693, 772.0]
+        frame = FRAME_RE.search(self.text)
+        if frame:
+            for name, value in re.findall(r"(left|top)\s*:\s*([\d.]+)pt", frame.group(1)):
+                self.footer[name == "top"] = float(value)
+
+        self.registered = False
+
+    def register_fonts(self):
+        if not self.registered:
+            import fonts
+
+            for family, path, bold, italic in self.faces:
+                fonts.register_face(family, path, bold, italic)
+            self.registered = True
+
+    def source(self, content):
+        return self.head + content + FOOTER + "</body></html>"
+
+    def chunk(self, content):
+        return self.chunkHead + content + "</body></html>"
+
+
+templates = {}
+
+
+def get_template(path=TEMPLATE):
+    # Re-read only when the file changes on disk
+    template = templates.get(path)
+    if template is None or template.mtime != os.stat(path).st_mtime_ns:
+        template = templates[path] = Template(path)
+    return template
+
+
+def build_source(content, template=TEMPLATE):
+    return get_template(template).source(content)
+
+
+def html_page(content, title=""):
+    return HTML_PAGE.format(title=html.escape(title), content=content)
+
+
+def link_callback(template=TEMPLATE):
+    # Relative urls in the template (fonts) resolve against the template itself
+    def resolve(uri, rel):
+        if "://" in uri or os.path.isabs(uri):
+            return uri
+        path = os.path.normpath(os.path.join(os.path.dirname(template), uri))
+        return path if os.path.exists(path) else uri
+    return resolve
+
+
+@contextlib.contextmanager
+def document_hook(progress=None, toc=None):
+    """Report reportlab build progress ('PASS', 'PAGE', ...) to progress and
+    table of contents entries (level, text, page) to toc, and make the fonts
+    registered in fonts.py known to the document.
+
+    Patches the classes xhtml2pdf builds with, so it is meant for a process
+    that renders one document at a time, such as an export worker.
+    """
+    from xhtml2pdf import document
+
+    import fonts
+
+    base = document.PmlBaseDoc
+    baseContext = document.pisaContext
+
+    class HookedContext(baseContext):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            fonts.register_context(self)
+
+    class HookedDoc(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if progress:
+                self.setProgressCallBack(progress)
+
+        def notify(self, kind, stuff):
+            if toc is not None and kind.startswith("TOCEntry"):
+                toc.append(tuple(stuff[:3]))
+            super().notify(kind, stuff)
+
+    document.PmlBaseDoc = HookedDoc
+    document.pisaContext = HookedContext
+    try:
+        yield
+    finally:
+        document.PmlBaseDoc = base
+        document.pisaContext = baseContext
+
+
+def html2pdf(source, output, template=TEMPLATE, progress=None, toc=None):
+    if isinstance(output, str):
+        with open(output, "w+b") as file:
+            return html2pdf(source, file, template, progress, toc)
+
+    from xhtml2pdf import pisa
+
+    get_template(template).register_fonts()
+    with document_hook(progress, toc):
+        pdf = pisa.CreatePDF(source, dest=output, path=os.path.join(BASEDIR, "export.html"),
+                             link_callback=link_callback(template))
+    return pdf.err
+
+
+def run_export(md, output, extensions, template, workers, cache, events):
+    # Runs in the export process; the pdf is written next to the target and
+    # only moved into place once it is complete.
+    import chapters
+    import pdfcache
+
+    # Exit cleanly when cancelled so the chapter pool is torn down too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+    def progress(kind, value):
+        if kind in ("PASS", "PAGE"):
+            events.put((kind, value))
+
+    partial = output + ".part"
+    try:
+        content = md2html(md, extensions)
+        err = chapters.html2pdf_parallel(
+            content, partial, template, workers, progress,
+            cache=pdfcache.FragmentCache() if cache else None)
+        os.replace(partial, output)
+        events.put(("DONE", err))
+    except Exception as error:
+        events.put(("ERROR", str(error)))
+
+
+class ExportJob:
+    """Export a Markdown document to PDF in a separate process.
+
+    onProgress(kind, value) receives 'PASS' and 'PAGE' events and
+    onDone(result, value) is called once with result 'DONE' (value is the
+    pisa error count), 'ERROR' (value is a message) or 'CANCELLED'. Both are
+    called from a monitor thread.
+    """
+
+    def __init__(self, md, output, extensions=MD_EXTENSIONS, template=TEMPLATE,
+                 workers=None, cache=True, onProgress=None, onDone=None):
+        self.output = output
+        self.onProgress = onProgress or (lambda kind, value: None)
+        self.onDone = onDone or (lambda result, value: None)
+        self.cancelled = False
+
+        # spawn, not fork: the parent may be a GUI process with live threads
+        context = multiprocessing.get_context("spawn")
+        self.events = context.Queue()
+        self.process = context.Process(target=run_export,
+                                       args=(md, output, list(extensions), template, workers, cache, self.events))
+        self.process.start()
+
+        self.monitor = threading.Thread(
+            target=self.watch, name="ExportJob", daemon=True)
+        self.monitor.start()
+
+    def running(self):
+        return self.monitor.is_alive()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def watch(self):
+        while True:
+            try:
+                kind, value = self.events.get(timeout=0.2)
+            except queue.Empty:
+                if self.process.is_alive():
+                    continue
+                kind, value = self.lastEvent()
+
+            if kind in ("PASS", "PAGE"):
+                if not self.cancelled:
+                    self.onProgress(kind, value)
+                continue
+
+            self.process.join()
+            with contextlib.suppress(OSError):
+                os.remove(self.output + ".part")
+            self.onDone(kind, value)
+            return
+
+    def lastEvent(self):
+        # The result may have been sent just before the process exited,
+        # after the last read timed out
+        while True:
+            try:
+                kind, value = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind in ("DONE", "ERROR"):
+                return kind, value
+        if self.cancelled:
+            return "CANCELLED", None
+        return "ERROR", "export process exited with code " + str(self.process.exitcode)
@@ -0,0 +1,42 @@
+"""
+One-time font registration for PDF export
+
+xhtml2pdf loads every @font-face of a document from disk and registers it
+with reportlab again for each export. Here each face is registered once per
+process, under the names xhtml2pdf itself would use, and then made known to
+every new xhtml2pdf context.
+"""
+
+import os
+
+from reportlab.lib.fonts import addMapping
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# family -> {(bold, italic): reportlab font name}
+registered = {}
+
+
+def register_face(family, path, bold=0, italic=0):
+    """Register a TrueType face once and return its reportlab name."""
+    family = family.lower()
+    name = "%s_%d%d" % (family, bold, italic)
+    if name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(name, path))
+
+    faces = registered.setdefault(family, {})
+    faces[(bold, italic)] = name
+
+    # Styles the family lacks fall back to its regular face
+    for b in (0, 1):
+        for i in (0, 1):
+            addMapping(family, b, i, faces.get((b, i), faces.get((0, 0), name)))
+    return name
+
+
+def register_context(context):
+    for family, faces in registered.items():
+        context.registerFont(family, [family, *faces.values()])
@@ -0,0 +1,341 @@
+"""
+Append-only JSONL record store
+
+Records are JSON objects, one per line. Appends are buffered and written
+in batches; how often the file is fsynced is the store's policy:
+
+    "flush"   after every batch written
+    "close"   once, when the store is closed (the default)
+    "never"   left to the operating system
+
+A sidecar index, PATH.idx, keeps the byte offset and length of the latest
+record for each id, so get() is a dict lookup and one read. Index lines
+are appended along with the records; on open, any records the index has
+not caught up with (after a crash, say) are scanned from the end of what
+it covers, and a torn last record is cut off. Reading everything goes
+through a generator that holds one line at a time.
+
+Writing a record again under the same id supersedes it; compact()
+rewrites the file with only the latest record of each id.
+
+Usage: python -m jsonlstore PATH [--key FIELD] count | get ID... | cat | compact | reindex
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+
+SYNC_POLICIES = ("flush", "close", "never")
+INDEX_MAGIC = "jsonlstore-index 1"
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class JsonlStore:
+    def __init__(self, path, key="id", sync="close", batch=256, delay=1.0):
+        if sync not in SYNC_POLICIES:
+            raise ValueError("sync must be one of " + ", ".join(SYNC_POLICIES))
+        self.path = path
+        self.key = key
+        self.sync = sync
+        # A batch is written once it has this many records, or its oldest
+        # record has waited delay seconds
+        self.batch = batch
+        self.delay = delay
+        self.lock = threading.Lock()
+
+        self.pending = []
+        self.pendingKeys = {}
+        self.pendingSince = 0.0
+        self.offsets = {}
+        self.file = None
+        self.indexFile = None
+        self._open()
+
+    def _open(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        self.file = open(self.path, "ab+")
+        self.size = self._truncateTorn()
+        self.offsets, covered = self._loadIndex()
+        for offset, length, ident in self._scan(covered):
+            self.offsets[ident] = (offset, length)
+            self._writeIndex(ident, offset, length)
+        self.indexFile.flush()
+
+    def _truncateTorn(self):
+        # A record is complete only with its newline; a crash mid-write
+        # leaves a partial line that no reader should see
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        if size == 0:
+            return 0
+        self.file.seek(size - 1)
+        if self.file.read(1) == b"\n":
+            return size
+        position = size
+        while position > 0:
+            step = min(64 * 1024, position)
+            self.file.seek(position - step)
+            chunk = self.file.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        self.file.truncate(position)
+        return position
+
+    def _loadIndex(self):
+        """Read the sidecar index; return ({id: (offset, length)}, bytes covered)."""
+        path = index_path(self.path)
+        identity = str(os.fstat(self.file.fileno()).st_ino)
+        offsets = {}
+        covered = 0
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                if file.readline().split() == INDEX_MAGIC.split() + [identity]:
+                    for line in file:
+                        if not line.endswith("\n"):
+                            break
+                        offset, length, ident = line.rstrip("\n").split("\t", 2)
+                        offset, length = int(offset), int(length)
+                        # The index can run ahead of records lost in a crash
+                        if offset + length > self.size:
+                            break
+                        offsets[json.loads(ident)] = (offset, length)
+                        covered = max(covered, offset + length)
+                    else:
+                        self.indexFile = open(path, "a", encoding="utf-8")
+                        return offsets, covered
+        except (OSError, ValueError):
+            pass
+
+        # Missing, stale or damaged: start it again and scan the whole file
+        self.indexFile = open(path, "w", encoding="utf-8")
+        self.indexFile.write("{} {}\n".format(INDEX_MAGIC, identity))
+        return {}, 0
+
+    def _writeIndex(self, ident, offset, length):
+        self.indexFile.write("{}\t{}\t{}\n".format(offset, length, json.dumps(ident, ensure_ascii=False)))
+
+    def _scan(self, start=0):
+        """Yield (offset, length, id) of the records from byte start on."""
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            offset = start
+            for line in file:
+                if offset + len(line) > self.size:
+                    return
+                if line.strip():
+                    try:
+                        ident = json.loads(line).get(self.key)
+                    except (ValueError, AttributeError):
+                        ident = None
+                    if ident is not None:
+                        yield offset, len(line), ident
+                offset += len(line)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.offsets) + sum(1 for ident in self.pendingKeys if ident not in self.offsets)
+
+    def __contains__(self, ident):
+        return ident in self.pendingKeys or ident in self.offsets
+
+    def append(self, record):
+        """Add a record; it is written with the next batch."""
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            if not self.pending:
+                self.pendingSince = time.monotonic()
+            ident = record.get(self.key)
+            if ident is not None:
+                self.pendingKeys[ident] = record
+            self.pending.append((ident, line))
+            if len(self.pending) >= self.batch or time.monotonic() - self.pendingSince >= self.delay:
+                self._flush()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        # One write for the batch; the index follows the records, never
+        # the other way round
+        offset = self.size
+        self.file.write(b"".join(line for _, line in self.pending))
+        self.file.flush()
+        if self.sync == "flush":
+            os.fsync(self.file.fileno())
+        for ident, line in self.pending:
+            if ident is not None:
+                self.offsets[ident] = (offset, len(line))
+                self._writeIndex(ident, offset, len(line))
+            offset += len(line)
+        self.indexFile.flush()
+        self.size = offset
+        self.pending = []
+        self.pendingKeys = {}
+
+    def get(self, ident, default=None):
+        """Return the latest record written under ident."""
+        with self.lock:
+            if ident in self.pendingKeys:
+                return self.pendingKeys[ident]
+            entry = self.offsets.get(ident)
+            if entry is None:
+                return default
+            offset, length = entry
+            self.file.seek(offset)
+            return json.loads(self.file.read(length))
+
+    def ids(self):
+        with self.lock:
+            return list(self.offsets) + [ident for ident in self.pendingKeys if ident not in self.offsets]
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, latest=False):
+        """Yield every record in the order written, without reading the
+        file whole. With latest, superseded records are skipped."""
+        self.flush()
+        with open(self.path, "rb") as file:
+            offset = 0
+            for line in file:
+                # Only what was complete when iteration began
+                if offset + len(line) > self.size:
+                    return
+                if line.strip():
+                    record = json.loads(line)
+                    if not latest or self.offsets.get(record.get(self.key), (offset,))[0] == offset:
+                        yield record
+                offset += len(line)
+
+    def compact(self, keep=None):
+        """Rewrite the file with the latest record of each id, and records
+        without one, dropping those keep(record) rejects. Returns the bytes
+        saved."""
+        with self.lock:
+            self._flush()
+            before = self.size
+            temp = self.path + ".compact"
+            latest = {offset for offset, _ in self.offsets.values()}
+            with open(temp, "wb") as output:
+                with open(self.path, "rb") as file:
+                    offset = 0
+                    for line in file:
+                        if offset + len(line) > self.size:
+                            break
+                        start = offset
+                        offset += len(line)
+                        if not line.strip():
+                            continue
+                        # Only lines that are not some id's latest record
+                        # need parsing, to find those without an id
+                        if start not in latest or keep is not None:
+                            record = json.loads(line)
+                            if start not in latest and record.get(self.key) is not None:
+                                continue
+                            if keep is not None and not keep(record):
+                                continue
+                        output.write(line)
+                output.flush()
+                os.fsync(output.fileno())
+
+            self.file.close()
+            self.indexFile.close()
+            os.replace(temp, self.path)
+            # The new file has a new identity, so its index is rebuilt
+            self._open()
+            return before - self.size
+
+    def reindex(self):
+        with self.lock:
+            self._flush()
+            self.file.close()
+            self.indexFile.close()
+            os.remove(index_path(self.path))
+            self._open()
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            self._flush()
+            if self.sync != "never":
+                os.fsync(self.file.fileno())
+            self.file.close()
+            self.indexFile.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m jsonlstore", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="JSONL file")
+    parser.add_argument("--key", default="id", help="field records are looked up by (default: id)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("count", help="number of ids")
+    get = commands.add_parser("get", help="print the latest record of each id")
+    get.add_argument("ids", nargs="+")
+    cat = commands.add_parser("cat", help="print every record")
+    cat.add_argument("--latest", action="store_true", help="skip superseded records")
+    commands.add_parser("compact", help="drop superseded records")
+    commands.add_parser("reindex", help="rebuild the index from the records")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command in ("get", "cat", "count") and not os.path.exists(args.path):
+        print("no such file:", args.path, file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    with JsonlStore(args.path, args.key) as store:
+        if args.command == "count":
+            print(len(store))
+        elif args.command == "get":
+            missing = 0
+            for ident in args.ids:
+                record = store.get(ident)
+                if record is None:
+                    print("no record:", ident, file=sys.stderr)
+                    missing += 1
+                else:
+                    print(json.dumps(record, ensure_ascii=False))
+            return 1 if missing else 0
+        elif args.command == "cat":
+            for record in store.records(args.latest):
+                print(json.dumps(record, ensure_ascii=False))
+        elif args.command == "compact":
+            saved = store.compact()
+            print("{} records, {} bytes saved in {:.2f}s".format(
+                len(store), saved, time.perf_counter() - start))
+        else:
+            store.reindex()
+            print("{} records indexed in {:.2f}s".format(len(store), time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Large-file support
+
+Files above THRESHOLD are memory-mapped and handed to the editor in decoded
+chunks instead of being read into one string, and the preview of such a file
+only renders the Markdown blocks around the visible part of the editor.
+Encoding detection streams through the file as well; for a large file it
+runs, with the decoding, on the loader's worker thread.
+"""
+
+import os
+import re
+import mmap
+import queue
+import codecs
+import threading
+
+
+THRESHOLD = 8 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+# Characters of source the preview renders around the first visible position
+WINDOW = 64 * 1024
+
+BOMS = [(codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16")]
+
+# What a file that is not UTF-8 may be in: the editor is for Latin and
+# Cyrillic text. Single-byte encodings decode almost any bytes, so the
+# choice between them is left to a detector.
+CANDIDATES = ["cp1252", "cp1251", "koi8_r", "latin_1"]
+# Bytes of non-ASCII lines the detector is given
+SAMPLE = 256 * 1024
+NON_ASCII_LINE_RE = re.compile(rb"[^\n]*[\x80-\xff][^\n]*")
+# Latin and Cyrillic letters within one word: a sign of the wrong code page
+MIXED_SCRIPTS_RE = re.compile("[A-Za-z][\u0400-\u04ff]|[\u0400-\u04ff][A-Za-z]")
+
+# Decoded chunks the loader's worker may run ahead of the editor
+READ_AHEAD = 4
+
+
+def is_large(path):
+    return os.path.getsize(path) >= THRESHOLD
+
+
+def detect_encoding(path, chunkSize=CHUNK_SIZE):
+    """Return the encoding of a file, reading it once, in chunks."""
+    with open(path, "rb") as file:
+        return chunks_encoding(iter(lambda: file.read(chunkSize), b""))
+
+
+def data_encoding(data):
+    """Return the encoding of bytes already read."""
+    return chunks_encoding([data])
+
+
+def chunks_encoding(chunks):
+    """Return the encoding of the bytes in chunks. A BOM or valid UTF-8
+    settles it; otherwise the non-ASCII lines go to charset_normalizer,
+    limited to CANDIDATES."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    utf8 = True
+    sample = []
+    sampled = 0
+    head = b""
+    for chunk in chunks:
+        if len(head) < 4:
+            head += chunk[:4 - len(head)]
+            if len(head) == 4 and bom_encoding(head):
+                return bom_encoding(head)
+        if utf8:
+            try:
+                decoder.decode(chunk)
+            except UnicodeDecodeError:
+                utf8 = False
+        # Sampled from the first chunk that is not UTF-8 on
+        if not utf8 and sampled < SAMPLE:
+            for line in NON_ASCII_LINE_RE.findall(chunk):
+                sample.append(line)
+                sampled += len(line) + 1
+                if sampled >= SAMPLE:
+                    break
+        if sampled >= SAMPLE:
+            break
+
+    if bom_encoding(head):
+        return bom_encoding(head)
+    if utf8:
+        try:
+            decoder.decode(b"", final=True)
+            return "utf-8"
+        except UnicodeDecodeError:
+            pass
+    return guess_encoding(b"\n".join(sample))
+
+
+def bom_encoding(head):
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def guess_encoding(data):
+    from charset_normalizer import from_bytes
+
+    matches = list(from_bytes(data, cp_isolation=CANDIDATES))
+    # Short samples can decode cleanly in several code pages; the one that
+    # does not mix scripts within a word is the likely one
+    for match in matches:
+        if not MIXED_SCRIPTS_RE.search(str(match)):
+            return codecs.lookup(match.encoding).name
+    return codecs.lookup(matches[0].encoding).name if matches else "latin-1"
+
+
+class ChunkedLoader:
+    """Decode a memory-mapped file chunk by chunk, with universal newlines.
+
+    read() decodes on the calling thread. After start(), a worker thread
+    detects the encoding (unless one was given) and decodes ahead, and the
+    text is fetched with poll() instead."""
+
+    def __init__(self, path, encoding=None, chunkSize=CHUNK_SIZE):
+        self.path = path
+        self.encoding = encoding
+        self.chunkSize = chunkSize
+        self.decoder = None
+
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if self.size else None
+        self.offset = 0
+        self.carry = ""
+
+        self.worker = None
+        self.chunks = None
+        self.error = None
+        self.cancelled = False
+
+    def progress(self):
+        return self.offset / self.size if self.size else 1.0
+
+    def done(self):
+        return self.map is None or self.offset >= self.size
+
+    def read(self):
+        """Return the next piece of text, or None once the file is exhausted."""
+        if self.decoder is None:
+            if self.encoding is None:
+                self.encoding = detect_encoding(self.path, self.chunkSize)
+            self.decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+
+        if self.done():
+            if self.carry or self.file is not None:
+                text = self.carry + self.decoder.decode(b"", final=True)
+                self.carry = ""
+                self._close()
+                return text.replace("\r\n", "\n").replace("\r", "\n") or None
+            return None
+
+        data = self.map[self.offset:self.offset + self.chunkSize]
+        self.offset += len(data)
+        text = self.carry + self.decoder.decode(data)
+
+        # A "\r" at the end may be the first half of a "\r\n"
+        self.carry = ""
+        if text.endswith("\r"):
+            text, self.carry = text[:-1], "\r"
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def __iter__(self):
+        while True:
+            text = self.read()
+            if text is None:
+                return
+            yield text
+
+    def start(self):
+        self.chunks = queue.Queue(maxsize=READ_AHEAD)
+        self.worker = threading.Thread(target=self._run, name="ChunkedLoader", daemon=True)
+        self.worker.start()
+
+    def _run(self):
+        try:
+            while not self.cancelled:
+                text = self.read()
+                self._put(text)
+                if text is None:
+                    return
+        except (OSError, ValueError, LookupError) as exc:
+            self.error = exc
+            self._put(None)
+        finally:
+            self._close()
+
+    def _put(self, text):
+        # Waits while the editor is behind, but not past close()
+        while not self.cancelled:
+            try:
+                self.chunks.put(text, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def poll(self):
+        """Return the next piece of text decoded by the worker, "" if none
+        is ready yet, or None once the file is exhausted."""
+        try:
+            text = self.chunks.get_nowait()
+        except queue.Empty:
+            return ""
+        if text is None and self.error is not None:
+            raise self.error
+        return text
+
+    def close(self):
+        if self.worker is not None:
+            # The worker owns the file; it closes it when it sees this
+            self.cancelled = True
+            return
+        self._close()
+
+    def _close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def trim_blocks(text, trimStart, trimEnd):
+    """Cut a slice of Markdown back to whole blocks (blank-line separated)."""
+    if trimStart:
+        cut = text.find("\n\n")
+        text = text[cut + 2:] if cut != -1 else text
+    if trimEnd:
+        cut = text.rfind("\n\n")
+        text = text[:cut] if cut != -1 else text
+    return text
@@ -0,0 +1,233 @@
+"""
+Streaming chat completions on a background event loop
+
+One asyncio loop runs on a daemon thread and serves every request, reusing
+a single HTTP session so later requests skip the connection setup. Tokens
+are collected as they stream in and handed to the caller in batches: the
+first token at once, so it shows as soon as it arrives, then whatever came
+in during each following FLUSH_INTERVAL. Callbacks run on the loop thread;
+the editor wraps them in wx.CallAfter.
+
+Finished answers go to the completion cache in llmcache.py and are
+answered from there the next time. A request identical to one still
+streaming joins it instead of calling the API again: it gets what was
+streamed so far at once, then the rest as it comes.
+
+The endpoint is the OpenAI API unless LITTERA_LLM_BASE points elsewhere,
+such as the local mock server in mockllm.py. Given a history path, the
+client keeps a record of each question and answer there, in a JsonlStore
+opened and written on the loop thread. Once the file reaches
+HISTORY_LIMIT bytes it is moved aside to PATH.1 (replacing the one before)
+and a new one is started, so the history, and the index loaded on open,
+stay bounded.
+"""
+
+import os
+import time
+import asyncio
+import threading
+import collections
+
+import appdirs
+
+import llmcache
+import jsonlstore
+
+
+FLUSH_INTERVAL = 0.05
+MODEL = os.environ.get("LITTERA_LLM_MODEL", "gpt-3.5-turbo")
+API_BASE = os.environ.get("LITTERA_LLM_BASE")
+TIMEOUT = 60
+HISTORY = os.path.join(appdirs.user_data_dir("Littera"), "answers.jsonl")
+HISTORY_LIMIT = 16 * 1024 * 1024
+
+# ttft and seconds in seconds; updates is the number of batches delivered
+Stats = collections.namedtuple("Stats", "ttft seconds tokens updates cached", defaults=(False,))
+
+
+class LLMClient(threading.Thread):
+    def __init__(self, apiBase=API_BASE, apiKey=None, model=MODEL, interval=FLUSH_INTERVAL, cache=True,
+                 history=None):
+        super().__init__(name="LLMClient", daemon=True)
+
+        self.apiBase = apiBase
+        self.apiKey = apiKey or os.environ.get("OPENAI_API_KEY") or ("mock" if apiBase else None)
+        self.model = model
+        self.interval = interval
+        self.session = None
+        self.loop = asyncio.new_event_loop()
+
+        # Used on the loop thread only; cache=False turns it off
+        self.cache = llmcache.CompletionCache() if cache is True else (cache or None)
+        self.inflight = {}
+        self.shared = 0
+        # Also loop thread only, opened on the first record()
+        self.history = history
+        self.historyStore = None
+
+        self.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, messages, onText, onDone, **params):
+        """Stream an answer to messages. onText(text) gets each batch of
+        tokens, then onDone(stats, error) is called once; error is None,
+        "cancelled" or a message. Returns a future whose cancel() stops the
+        stream."""
+        return asyncio.run_coroutine_threadsafe(
+            self.stream(messages, onText, onDone, **params), self.loop)
+
+    def stop(self):
+        if self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(5)
+        if self.cache is not None:
+            self.loop.call_soon_threadsafe(self.cache.close)
+        self.loop.call_soon_threadsafe(self._closeHistory)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+
+    def record(self, record):
+        """Add record to the history, if one is kept. Returns at once; the
+        record is written on the loop thread."""
+        if self.history is not None:
+            self.loop.call_soon_threadsafe(self._record, record)
+
+    def _record(self, record):
+        try:
+            if self.historyStore is None:
+                if os.path.exists(self.history) and os.path.getsize(self.history) >= HISTORY_LIMIT:
+                    rotate_history(self.history)
+                # Answers come one at a time: write each as it comes
+                self.historyStore = jsonlstore.JsonlStore(self.history, batch=1)
+            self.historyStore.append(record)
+            if self.historyStore.size >= HISTORY_LIMIT:
+                self._closeHistory()
+                rotate_history(self.history)
+        except OSError as exc:
+            print("cannot write answer history:", exc)
+
+    def _closeHistory(self):
+        if self.historyStore is not None:
+            self.historyStore.close()
+            self.historyStore = None
+
+    async def stream(self, messages, onText, onDone, **params):
+        start = time.perf_counter()
+        key = llmcache.cache_key(self.apiBase, self.model, messages, params)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                # Delivered whole: there is nothing to wait for between tokens
+                answer, tokens = cached
+                onText(answer)
+                seconds = time.perf_counter() - start
+                onDone(Stats(seconds, seconds, tokens, 1, True), None)
+                return
+
+        # Identical requests in flight share one upstream call
+        upstream = self.inflight.get(key)
+        if upstream is None:
+            upstream = self.inflight[key] = Upstream()
+            upstream.task = self.loop.create_task(self.fetch(upstream, key, messages, params))
+        else:
+            self.shared += 1
+
+        queue = asyncio.Queue()
+        if upstream.text:
+            queue.put_nowait("".join(upstream.text))
+        upstream.listeners.append(queue)
+
+        ttft = None
+        updates = 0
+        try:
+            while True:
+                text = await queue.get()
+                if text is None:
+                    break
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                updates += 1
+                onText(text)
+            error = upstream.error
+        except asyncio.CancelledError:
+            error = "cancelled"
+            upstream.listeners.remove(queue)
+            if not upstream.listeners:
+                # Nobody is waiting any more; a new request starts afresh
+                if self.inflight.get(key) is upstream:
+                    del self.inflight[key]
+                upstream.task.cancel()
+        onDone(Stats(ttft, time.perf_counter() - start, upstream.tokens, updates), error)
+
+    async def fetch(self, upstream, key, messages, params):
+        import openai
+        import aiohttp
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        openai.aiosession.set(self.session)
+
+        pending = []
+        flush = None
+
+        def deliver():
+            nonlocal flush
+            flush = None
+            if pending:
+                upstream.publish("".join(pending))
+                pending.clear()
+
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model=self.model, messages=messages, stream=True, api_key=self.apiKey,
+                api_base=self.apiBase, request_timeout=TIMEOUT, **params)
+            async for chunk in response:
+                text = chunk["choices"][0]["delta"].get("content")
+                if not text:
+                    continue
+                upstream.tokens += 1
+                pending.append(text)
+                if not upstream.text:
+                    deliver()
+                elif flush is None:
+                    flush = self.loop.call_later(self.interval, deliver)
+        except asyncio.CancelledError:
+            upstream.error = "cancelled"
+        except Exception as exc:
+            upstream.error = str(exc) or type(exc).__name__
+
+        if flush is not None:
+            flush.cancel()
+        deliver()
+        if self.inflight.get(key) is upstream:
+            del self.inflight[key]
+        if upstream.error is None and self.cache is not None:
+            self.cache.put(key, "".join(upstream.text), upstream.tokens)
+        upstream.publish(None)
+
+
+def rotate_history(path):
+    """Move the history at path, and its index, to PATH.1."""
+    os.replace(path, path + ".1")
+    if os.path.exists(jsonlstore.index_path(path)):
+        os.replace(jsonlstore.index_path(path), jsonlstore.index_path(path + ".1"))
+
+
+class Upstream:
+    """One streaming call and the requests waiting on its tokens."""
+
+    def __init__(self):
+        self.task = None
+        self.text = []
+        self.tokens = 0
+        self.error = None
+        self.listeners = []
+
+    def publish(self, text):
+        # None marks the end of the stream
+        if text is not None:
+            self.text.append(text)
+        for queue in self.listeners:
+            queue.put_nowait(text)
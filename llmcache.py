@@ -0,0 +1,110 @@
+"""
+On-disk cache of LLM completions
+
+Answers are stored in SQLite under the user cache dir, keyed by a hash of
+the endpoint, model, parameters and normalized messages. Normalizing
+drops what does not change a prompt's meaning: line endings, trailing
+spaces and surrounding blank lines. Entries expire after a TTL, and the
+least recently used ones are evicted once the cache is over its size.
+
+The cache is used from the LLMClient loop thread only, which opens the
+database on first use.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+import appdirs
+
+
+PATH = os.path.join(appdirs.user_cache_dir("Littera"), "completions.sqlite")
+TTL = 7 * 24 * 3600
+# Approximate bytes of a row besides its answer
+ROW_OVERHEAD = 100
+
+
+def normalize(messages):
+    normalized = []
+    for message in messages:
+        content = message.get("content") or ""
+        content = "\n".join(line.rstrip() for line in content.replace("\r\n", "\n").split("\n"))
+        normalized.append({"role": message.get("role", "user"), "content": content.strip()})
+    return normalized
+
+
+def cache_key(apiBase, model, messages, params):
+    data = json.dumps([apiBase, model, normalize(messages), params],
+                      sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, path=PATH, ttl=TTL, maxbytes=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.db = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.db = sqlite3.connect(self.path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY,"
+                            " answer TEXT, tokens INTEGER, created REAL, used REAL, size INTEGER)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS completions_used ON completions (used)")
+            self.bytes = self.db.execute("SELECT coalesce(sum(size), 0) FROM completions").fetchone()[0]
+        return self.db
+
+    def get(self, key):
+        """Return (answer, tokens) or None."""
+        db = self._connect()
+        row = db.execute("SELECT answer, tokens, created FROM completions WHERE key=?", (key,)).fetchone()
+        now = time.time()
+        if row is None or row[2] + self.ttl < now:
+            self.misses += 1
+            return None
+        with db:
+            db.execute("UPDATE completions SET used=? WHERE key=?", (now, key))
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, key, answer, tokens):
+        db = self._connect()
+        now = time.time()
+        size = len(answer.encode("utf-8")) + ROW_OVERHEAD
+        with db:
+            old = db.execute("SELECT size FROM completions WHERE key=?", (key,)).fetchone()
+            if old is not None:
+                self.bytes -= old[0]
+            db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?)",
+                       (key, answer, tokens, now, now, size))
+            self.bytes += size
+            self.bytes -= db.execute("SELECT coalesce(sum(size), 0) FROM completions WHERE created < ?",
+                                     (now - self.ttl,)).fetchone()[0]
+            db.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+
+            while self.bytes > self.maxbytes:
+                rows = db.execute("SELECT key, size FROM completions WHERE key != ?"
+                                  " ORDER BY used LIMIT 64", (key,)).fetchall()
+                if not rows:
+                    break
+                for oldKey, oldSize in rows:
+                    db.execute("DELETE FROM completions WHERE key=?", (oldKey,))
+                    self.bytes -= oldSize
+                    if self.bytes <= self.maxbytes:
+                        break
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
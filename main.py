@@ -6,16 +6,27 @@ Website: github.com/programmingdesigner/littera
 Last modified: august 2022
 """
 
+import startup
+
 import os
-import itertools
+import re
+import threading
+import multiprocessing
 import webbrowser
 
 import wx
 import wx.richtext as rt
 import wx.html as html
-import wx.adv
-import markdown
-from xhtml2pdf import pisa
+
+import autosave
+import export
+import largefile
+import perf
+from mdcache import BlockCache
+from preview import PreviewRenderer, VirtualPreview
+from workspace import Document, Workspace
+
+startup.mark("imports")
 
 
 wildcard = "Markdown (*.md)|*.md|" \
@@ -32,9 +43,15 @@ def png_to_icon(png_path):
     return wx.Icon(bitmap)
 
 
+def document_field(name):
+    # Per-tab state lives on the active workspace.Document
+    return property(lambda self: getattr(self.document, name),
+                    lambda self, value: setattr(self.document, name, value))
+
+
 class findDlg(wx.Dialog):
     def __init__(self, parent):
-        super().__init__(parent, title="Find", size=(300, 140))
+        super().__init__(parent, title="Find", size=(300, 175))
 
         self.parent = parent
 
@@ -50,7 +67,16 @@ class findDlg(wx.Dialog):
         hBox.Add(label, flag=wx.RIGHT | wx.ALIGN_CENTER_VERTICAL, border=10)
         hBox.Add(self.textEntry, proportion=1)
 
+        optBox = wx.BoxSizer(wx.HORIZONTAL)
+        self.caseCheck = wx.CheckBox(panel, label="Match case")
+        self.wordCheck = wx.CheckBox(panel, label="Whole word")
+        self.regexCheck = wx.CheckBox(panel, label="Regex")
+        optBox.Add(self.caseCheck)
+        optBox.Add(self.wordCheck, flag=wx.LEFT, border=8)
+        optBox.Add(self.regexCheck, flag=wx.LEFT, border=8)
+
         vBox.Add(hBox, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=16)
+        vBox.Add(optBox, flag=wx.LEFT | wx.RIGHT | wx.TOP, border=16)
         vBox.Add((-1, 10))
 
         findBtn = wx.Button(panel, wx.ID_OK, label="Find", size=(75, 25))
@@ -78,22 +104,339 @@ class findDlg(wx.Dialog):
         print("findDlg destroyed")
 
     def onFindNext(self, e):
-        self.parent.textCtrl.SetInsertionPoint(next(self.parent.iterators))
-        self.parent.textCtrl.ScrollIntoView(
-            self.parent.textCtrl.GetInsertionPoint(), 13)
-        self.parent.textCtrl.Update()
-        self.parent.textCtrl.Refresh()
-        self.parent.textCtrl.SetFocus()
+        if self.parent.searchResults:
+            self.parent.showMatch(self.parent.searchResults.next())
+
+
+class perfDlg(wx.Dialog):
+    def __init__(self, parent):
+        super().__init__(parent, title="Performance", size=(420, 280),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+
+        self.parent = parent
+
+        # Instrumentation stays on only while the panel is open, unless it
+        # was switched on at startup
+        self.wasEnabled = perf.enabled
+        perf.enable()
+
+        panel = wx.Panel(self)
+        vBox = wx.BoxSizer(wx.VERTICAL)
+
+        self.list = wx.ListCtrl(panel, style=wx.LC_REPORT | wx.BORDER_SUNKEN)
+        for column, (label, width) in enumerate([("Operation", 140), ("Count", 60),
+                                                 ("Last (ms)", 80), ("p95 (ms)", 80)]):
+            self.list.InsertColumn(column, label, width=width)
+
+        logLabel = wx.StaticText(panel, label="Log: " + perf.LOG_FILE)
+
+        vBox.Add(self.list, proportion=1, flag=wx.EXPAND | wx.ALL, border=10)
+        vBox.Add(logLabel, flag=wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
+        panel.SetSizer(vBox)
+
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.onRefresh, self.timer)
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+        self.timer.Start(1000)
+        self.onRefresh(None)
+
+    def onRefresh(self, e):
+        self.list.DeleteAllItems()
+        for row, (name, (count, last, p95)) in enumerate(sorted(perf.stats().items())):
+            self.list.InsertItem(row, name)
+            self.list.SetItem(row, 1, str(count))
+            self.list.SetItem(row, 2, "{:.1f}".format(last * 1000))
+            self.list.SetItem(row, 3, "{:.1f}".format(p95 * 1000))
+
+    def onClose(self, e):
+        self.timer.Stop()
+        if not self.wasEnabled:
+            perf.disable()
+        self.Destroy()
+        self.parent.perfDlg = None
+        print("perfDlg destroyed")
+
+
+class notesDlg(wx.Dialog):
+    def __init__(self, parent):
+        super().__init__(parent, title="Find in Notes", size=(560, 400),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+
+        import notes
+
+        self.parent = parent
+        self.root = os.path.abspath(parent.dirname)
+        self.index = notes.NotesIndex(self.root)
+        self.hits = []
+        self.closed = False
+
+        panel = wx.Panel(self)
+        vBox = wx.BoxSizer(wx.VERTICAL)
+
+        self.textEntry = wx.TextCtrl(panel, style=wx.TE_PROCESS_ENTER)
+        self.textEntry.SetHint('words, "a phrase", prefix*, OR, NOT')
+
+        self.list = wx.ListCtrl(panel, style=wx.LC_REPORT | wx.LC_SINGLE_SEL | wx.BORDER_SUNKEN)
+        for column, (label, width) in enumerate([("Note", 160), ("Folder", 120), ("Match", 260)]):
+            self.list.InsertColumn(column, label, width=width)
+
+        self.statusLabel = wx.StaticText(panel, label="Indexing " + self.root + "...")
+
+        vBox.Add(self.textEntry, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
+        vBox.Add(self.list, proportion=1, flag=wx.EXPAND | wx.ALL, border=10)
+        vBox.Add(self.statusLabel, flag=wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
+        panel.SetSizer(vBox)
+
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+        self.textEntry.Bind(wx.EVT_TEXT, self.onSearch)
+        self.textEntry.Bind(wx.EVT_TEXT_ENTER, self.onOpenHit)
+        self.list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.onOpenHit)
+
+        # Only files changed since the last time are read again
+        threading.Thread(target=self.indexNotes, name="NotesIndex", daemon=True).start()
+
+        self.Centre()
+
+    def indexNotes(self):
+        import notes
+
+        index = notes.NotesIndex(self.root)
+        try:
+            with perf.span("notesRefresh", root=self.root):
+                changes = index.refresh(cancelled=lambda: self.closed)
+            count = len(index)
+        finally:
+            index.close()
+        wx.CallAfter(self.onIndexed, changes, count)
+
+    def onIndexed(self, changes, count):
+        if self.closed:
+            return
+        self.statusLabel.SetLabel("{} notes in {} ({} added, {} updated, {} removed)".format(
+            count, self.root, *changes))
+        self.onSearch(None)
+
+    def onSearch(self, e):
+        query = self.textEntry.GetValue()
+        with perf.span("notesSearch", query=query):
+            self.hits = self.index.search(query)
+
+        self.list.DeleteAllItems()
+        for row, hit in enumerate(self.hits):
+            self.list.InsertItem(row, hit.title)
+            self.list.SetItem(row, 1, os.path.relpath(os.path.dirname(hit.path), self.root))
+            self.list.SetItem(row, 2, hit.snippet)
+        if self.hits:
+            self.list.Select(0)
+
+    def onOpenHit(self, e):
+        row = self.list.GetFirstSelected()
+        if 0 <= row < len(self.hits):
+            self.parent.openFile(self.hits[row].path)
+
+    def onClose(self, e):
+        self.closed = True
+        self.index.close()
+        self.Destroy()
+        self.parent.notesDlg = None
+        print("notesDlg destroyed")
+
+
+class replaceDlg(wx.Dialog):
+    def __init__(self, parent):
+        super().__init__(parent, title="Replace in Files", size=(640, 520),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+
+        self.parent = parent
+        self.root = os.path.abspath(parent.dirname)
+        self.found = None
+        self.busy = False
+
+        panel = wx.Panel(self)
+        vBox = wx.BoxSizer(wx.VERTICAL)
+
+        grid = wx.FlexGridSizer(2, 2, 8, 10)
+        grid.AddGrowableCol(1)
+        self.findEntry = wx.TextCtrl(panel)
+        self.replaceEntry = wx.TextCtrl(panel)
+        grid.Add(wx.StaticText(panel, label="Find"), flag=wx.ALIGN_CENTER_VERTICAL)
+        grid.Add(self.findEntry, flag=wx.EXPAND)
+        grid.Add(wx.StaticText(panel, label="Replace with"), flag=wx.ALIGN_CENTER_VERTICAL)
+        grid.Add(self.replaceEntry, flag=wx.EXPAND)
+
+        optBox = wx.BoxSizer(wx.HORIZONTAL)
+        self.caseCheck = wx.CheckBox(panel, label="Match case")
+        self.wordCheck = wx.CheckBox(panel, label="Whole word")
+        self.regexCheck = wx.CheckBox(panel, label="Regex")
+        optBox.Add(self.caseCheck)
+        optBox.Add(self.wordCheck, flag=wx.LEFT, border=8)
+        optBox.Add(self.regexCheck, flag=wx.LEFT, border=8)
+
+        self.list = wx.ListCtrl(panel, style=wx.LC_REPORT | wx.LC_SINGLE_SEL | wx.BORDER_SUNKEN)
+        self.list.InsertColumn(0, "File", width=440)
+        self.list.InsertColumn(1, "Hits", width=70)
+        self.hitsText = wx.TextCtrl(panel, style=wx.TE_MULTILINE | wx.TE_READONLY | wx.TE_DONTWRAP)
+        self.statusLabel = wx.StaticText(panel, label="Files in " + self.root)
+
+        btnBox = wx.BoxSizer(wx.HORIZONTAL)
+        self.previewBtn = wx.Button(panel, label="Preview", size=(75, 25))
+        self.applyBtn = wx.Button(panel, label="Replace All", size=(90, 25))
+        self.undoBtn = wx.Button(panel, label="Undo Last", size=(90, 25))
+        self.previewBtn.SetDefault()
+        self.applyBtn.Enable(False)
+        btnBox.Add(self.undoBtn)
+        btnBox.Add(self.previewBtn, flag=wx.LEFT, border=8)
+        btnBox.Add(self.applyBtn, flag=wx.LEFT, border=8)
+
+        vBox.Add(grid, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=16)
+        vBox.Add(optBox, flag=wx.LEFT | wx.RIGHT | wx.TOP, border=16)
+        vBox.Add(self.list, proportion=2, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=16)
+        vBox.Add(self.hitsText, proportion=1, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=16)
+        vBox.Add(self.statusLabel, flag=wx.LEFT | wx.RIGHT | wx.TOP, border=16)
+        vBox.Add(btnBox, flag=wx.ALIGN_RIGHT | wx.ALL, border=16)
+        panel.SetSizer(vBox)
+
+        self.Bind(wx.EVT_CLOSE, self.onClose)
+        self.previewBtn.Bind(wx.EVT_BUTTON, self.onPreview)
+        self.applyBtn.Bind(wx.EVT_BUTTON, self.onApply)
+        self.undoBtn.Bind(wx.EVT_BUTTON, self.onUndo)
+        self.list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.onSelect)
+
+        self.Centre()
+
+    def run(self, work, done):
+        # Files are matched and written in worker processes; this thread
+        # only waits for them, so the editor stays responsive
+        self.busy = True
+        for button in (self.previewBtn, self.applyBtn, self.undoBtn):
+            button.Enable(False)
+
+        def target():
+            result = work()
+            wx.CallAfter(self.onDone, done, result)
+        threading.Thread(target=target, name="ReplaceInFiles", daemon=True).start()
+
+    def onDone(self, done, result):
+        self.busy = False
+        self.previewBtn.Enable(True)
+        self.undoBtn.Enable(True)
+        done(result)
+
+    def onPreview(self, e):
+        import multireplace
+
+        query = multireplace.Query(self.findEntry.GetValue(), self.replaceEntry.GetValue(),
+                                   self.caseCheck.GetValue(), self.wordCheck.GetValue(),
+                                   self.regexCheck.GetValue())
+        if not query.text or self.busy:
+            return
+        try:
+            multireplace.compile_query(query)
+        except re.error as error:
+            self.statusLabel.SetLabel("Invalid pattern: " + str(error))
+            return
+
+        def progress(found, result):
+            if found.scanned % 200 == 0:
+                wx.CallAfter(self.statusLabel.SetLabel, "Searched {} files...".format(found.scanned))
+
+        self.found = None
+        self.list.DeleteAllItems()
+        self.hitsText.Clear()
+        self.run(lambda: multireplace.preview(self.root, query, progress=progress), self.onPreviewed)
+
+    def onPreviewed(self, found):
+        self.found = found
+        for row, result in enumerate(found.results):
+            self.list.InsertItem(row, os.path.relpath(result.path, self.root))
+            self.list.SetItem(row, 1, str(result.count) if not result.error else "error")
+
+        totals = found.totals()
+        self.statusLabel.SetLabel("{} hits in {} of {} files, {:.1f} MiB in {:.2f} s ({:.1f} MiB/s)".format(
+            totals.hits, totals.matched, totals.files, totals.bytes / 1024 / 1024, totals.seconds,
+            totals.bytes / 1024 / 1024 / max(totals.seconds, 1e-9)))
+        perf.record("replacePreview", totals.seconds, files=totals.files, hits=totals.hits)
+        self.applyBtn.Enable(totals.hits > 0)
+
+    def onSelect(self, e):
+        result = self.found.results[e.GetIndex()]
+        if result.error:
+            self.hitsText.SetValue(result.error)
+            return
+        lines = []
+        for hit in result.hits:
+            lines += ["{:>6}  - {}".format(hit.line, hit.before), "        + " + hit.after]
+        if result.count > len(result.hits):
+            lines.append("        ... and {} more".format(result.count - len(result.hits)))
+        self.hitsText.SetValue("\n".join(lines))
+
+    def onApply(self, e):
+        import multireplace
+
+        if self.found is None or self.busy:
+            return
+        # Tabs with unsaved changes would overwrite the result when saved
+        skip = self.parent.unsavedPaths()
+        found = self.found
+        self.found = None
+        self.run(lambda: multireplace.apply(found, skip=skip), self.onApplied)
+
+    def onApplied(self, changes):
+        self.parent.reloadFiles([entry[0] for entry in changes.changed])
+        skipped = len(changes.files) - len(changes.changed)
+        self.statusLabel.SetLabel("Changed {} files{}".format(
+            len(changes.changed), ", skipped {}".format(skipped) if skipped else ""))
+
+    def onUndo(self, e):
+        import multireplace
+
+        changes = multireplace.ChangeSet.latest()
+        if changes is None or self.busy:
+            self.statusLabel.SetLabel("Nothing to undo")
+            return
+        paths = [entry[0] for entry in changes.changed]
+        self.run(lambda: (paths, changes.undo()), self.onUndone)
+
+    def onUndone(self, result):
+        paths, failed = result
+        self.parent.reloadFiles(paths)
+        self.statusLabel.SetLabel("Restored {} files{}".format(
+            len(paths) - len(failed), ", {} changed since and kept".format(len(failed)) if failed else ""))
+
+    def onClose(self, e):
+        # Open tabs are reloaded when the job is done
+        if self.busy:
+            self.statusLabel.SetLabel("Waiting for the files to be written...")
+            return
+        self.Destroy()
+        self.parent.replaceDlg = None
+        print("replaceDlg destroyed")
 
 
 class textEditor(wx.Frame):
+    dirname = document_field("dirname")
+    filename = document_field("filename")
+    encoding = document_field("encoding")
+    modify = document_field("modify")
+    largeFile = document_field("largeFile")
+    loader = document_field("loader")
+    loadTimer = document_field("loadTimer")
+    searchIndex = document_field("searchIndex")
+    searchResults = document_field("searchResults")
+    sourceMap = document_field("sourceMap")
+    autosaver = document_field("autosaver")
+    textCtrl = document_field("editor")
+    model = document_field("model")
+
     def __init__(self, filename="untitled"):
         super(textEditor, self).__init__(None, size=(960, 540))
 
         # Properties
-        self.dirname = "."
-        self.filename = filename
-        self.modify = False
+        self.workspace = Workspace()
+        self.document = None
+        self.textAttr = None
+        # Off while the editor is filled programmatically, see setEditorText
+        self.mirroring = True
 
         self.pos = 0
         self.size = 0
@@ -101,17 +444,12 @@ class textEditor(wx.Frame):
         self.appname = "ReqGen"
         self.appversion = "v1.0b"
 
-        # icon = wx.Icon("favicon.png", type=wx.BITMAP_TYPE_ICO)
-        icon = png_to_icon("logo.png")
-
         self.findDlg = None
-
-        # Fonts
-        wx.Font.AddPrivateFont("fonts/sans/NotoSans-Regular.ttf")
-        font = wx.Font(16, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL,
-                       underline=False, faceName="Noto Sans", encoding=wx.FONTENCODING_DEFAULT)
-        labels = wx.Font(12, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL,
-                         underline=False, faceName="Noto Sans", encoding=wx.FONTENCODING_DEFAULT)
+        self.perfDlg = None
+        self.notesDlg = None
+        self.replaceDlg = None
+        self.exportJob = None
+        self.exportPass = 1
 
         # Ui
         self.splitter = wx.SplitterWindow(
@@ -130,43 +468,43 @@ class textEditor(wx.Frame):
         rSizer = wx.BoxSizer(wx.VERTICAL)
 
         # Ui -- lPanel
-        lLabel = wx.StaticText(lPanel, label="Text Editor")
-        lLabel.SetFont(labels)
-        lLabel.SetForegroundColour("#9598A1")
+        self.lLabel = wx.StaticText(lPanel, label="Text Editor")
+        self.lLabel.SetForegroundColour("#9598A1")
 
-        # Ui -- textCtrl
-        self.textCtrl = rt.RichTextCtrl(lPanel, -1, style=rt.RE_MULTILINE | wx.TE_RICH2 |
-                                        wx.TE_NO_VSCROLL | wx.TE_WORDWRAP | wx.TE_AUTO_URL | wx.TE_PROCESS_TAB | wx.BORDER_NONE)
-        self.textCtrl.SetEditable(True)
+        # Ui -- notebook, a tab with its own textCtrl per document
+        self.notebook = wx.Notebook(lPanel)
+        self.notebook.SetBackgroundColour("#F4F9F9")
 
-        textAttr = rt.RichTextAttr()
-        textAttr.SetFont(font)
-        textAttr.SetTextColour("#3C4245")
-        textAttr.SetLineSpacing(12)
-        textAttr.SetLeftIndent(60)
-        textAttr.SetRightIndent(80)
+        self.mdExtensions = list(export.MD_EXTENSIONS)
+        self.mdCache = BlockCache()
 
-        self.textCtrl.SetBasicStyle(textAttr)
-        self.textCtrl.SetBackgroundColour("#F4F9F9")
+        # Preview is rendered off the UI thread, debounced while typing
+        self.previewDelay = 300
+        self.preview = PreviewRenderer(self.renderMarkdown, self.onPreviewReady)
+        self.previewTimer = wx.Timer(self)
 
-        self.mdExtensions = ['tables', 'sane_lists', 'fenced_code', 'smarty']
+        # Edits are journaled in the background once typing pauses
+        self.autosaveDelay = 2000
+        self.autosaveTimer = wx.Timer(self)
+
+        # Milliseconds between checks on a large file decoded in the background
+        self.loadPollDelay = 20
 
         # Ui -- rPanel
-        rLabel = wx.StaticText(rPanel, label="HTML Preview")
-        rLabel.SetFont(labels)
-        rLabel.SetForegroundColour("#9598A1")
+        self.rLabel = wx.StaticText(rPanel, label="HTML Preview")
+        self.rLabel.SetForegroundColour("#9598A1")
 
         # Ui -- htmlPrev
         self.htmlPrev = html.HtmlWindow(rPanel)
-        self.htmlPrev.SetStandardFonts(16, "Noto Sans")
+        self.virtualPreview = VirtualPreview(self.htmlPrev)
 
         # Ui -- Config
-        lSizer.Add(lLabel, flag=wx.LEFT | wx.TOP, border=24)
+        lSizer.Add(self.lLabel, flag=wx.LEFT | wx.TOP, border=24)
         lSizer.Add((-1, 20))
-        lSizer.Add(self.textCtrl, proportion=1, flag=wx.EXPAND)
+        lSizer.Add(self.notebook, proportion=1, flag=wx.EXPAND)
         lPanel.SetSizer(lSizer)
 
-        rSizer.Add(rLabel, flag=wx.LEFT | wx.TOP, border=24)
+        rSizer.Add(self.rLabel, flag=wx.LEFT | wx.TOP, border=24)
         rSizer.Add((-1, 20))
         rSizer.Add(self.htmlPrev, proportion=1, flag=wx.EXPAND)
         rPanel.SetSizer(rSizer)
@@ -175,18 +513,243 @@ class textEditor(wx.Frame):
         sizer.Add(self.splitter, 1, flag=wx.EXPAND)
         self.SetSizer(sizer)
 
-        self.SetIcon(icon)
         self.Centre()
 
         # Functions
-        self.setTitle()
         self.createMenu()
         self.setStatusBar()
         self.bindEvents()
         self.assignHotkeys()
+        self.newDocument(filename)
+
+        # Fonts, icon and recovery wait until the window has been painted
+        self.textCtrl.Bind(wx.EVT_PAINT, self.onFirstPaint)
+
+    def onFirstPaint(self, e):
+        e.GetEventObject().Unbind(wx.EVT_PAINT, handler=self.onFirstPaint)
+        startup.mark("first paint")
+        wx.CallAfter(self.loadResources)
+        e.Skip()
+
+    def loadResources(self):
+        wx.Font.AddPrivateFont("fonts/sans/NotoSans-Regular.ttf")
+        font = wx.Font(16, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL,
+                       underline=False, faceName="Noto Sans", encoding=wx.FONTENCODING_DEFAULT)
+        labels = wx.Font(12, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL,
+                         underline=False, faceName="Noto Sans", encoding=wx.FONTENCODING_DEFAULT)
+
+        textAttr = rt.RichTextAttr()
+        textAttr.SetFont(font)
+        textAttr.SetTextColour("#3C4245")
+        textAttr.SetLineSpacing(12)
+        textAttr.SetLeftIndent(60)
+        textAttr.SetRightIndent(80)
+
+        self.textAttr = textAttr
+        for document in self.workspace:
+            if document.editor is not None:
+                document.editor.SetBasicStyle(textAttr)
+        self.lLabel.SetFont(labels)
+        self.rLabel.SetFont(labels)
+        self.htmlPrev.SetStandardFonts(16, "Noto Sans")
+        self.Layout()
+
+        # icon = wx.Icon("favicon.png", type=wx.BITMAP_TYPE_ICO)
+        self.SetIcon(png_to_icon("logo.png"))
+        startup.mark("resources")
+
+        if startup.report_path():
+            startup.write_marks(startup.report_path())
+            self.onQuit(None)
+            return
+
+        self.autosaver.recover(
+            lambda found: wx.CallAfter(self.onRecover, found))
 
     def setTitle(self):
         super(textEditor, self).SetTitle(self.filename + " - " + self.appname)
+        index = self.notebook.FindPage(self.document.page)
+        if index != wx.NOT_FOUND:
+            self.notebook.SetPageText(index, self.filename)
+
+    def newDocument(self, filename="untitled"):
+        document = Document(filename=filename)
+        document.page = wx.Panel(self.notebook)
+        document.page.SetSizer(wx.BoxSizer(wx.VERTICAL))
+        document.autosaver = autosave.Autosaver()
+        document.autosaver.begin(None, document.encoding, "")
+        self.createEditor(document)
+
+        self.workspace.add(document)
+        self.notebook.AddPage(document.page, filename)
+        self.selectDocument(document)
+        return document
+
+    def createEditor(self, document):
+        textCtrl = rt.RichTextCtrl(document.page, -1, style=rt.RE_MULTILINE | wx.TE_RICH2 |
+                                   wx.TE_NO_VSCROLL | wx.TE_WORDWRAP | wx.TE_AUTO_URL | wx.TE_PROCESS_TAB | wx.BORDER_NONE)
+        textCtrl.SetEditable(True)
+        textCtrl.SetBackgroundColour("#F4F9F9")
+        if self.textAttr is not None:
+            textCtrl.SetBasicStyle(self.textAttr)
+
+        textCtrl.Bind(wx.EVT_LEFT_UP, self.onCursorPos)
+        textCtrl.Bind(wx.EVT_TEXT, self.onTextChange)
+        textCtrl.Bind(wx.EVT_SCROLLWIN, self.onEditorScroll)
+        textCtrl.Bind(wx.EVT_MOUSEWHEEL, self.onEditorScroll)
+        textCtrl.Bind(rt.EVT_RICHTEXT_CONTENT_INSERTED, lambda e: self.onContentInserted(e, document))
+        textCtrl.Bind(rt.EVT_RICHTEXT_CONTENT_DELETED, lambda e: self.onContentDeleted(e, document))
+
+        document.page.GetSizer().Add(textCtrl, proportion=1, flag=wx.EXPAND)
+        document.page.Layout()
+        document.editor = textCtrl
+
+    def documentAt(self, index):
+        page = self.notebook.GetPage(index)
+        return next((document for document in self.workspace if document.page is page), None)
+
+    def selectDocument(self, document):
+        self.notebook.ChangeSelection(self.notebook.FindPage(document.page))
+        self.activateDocument(document)
+
+    def onTabChanged(self, e):
+        document = self.documentAt(e.GetSelection())
+        if document is not None:
+            self.activateDocument(document)
+        e.Skip()
+
+    def activateDocument(self, document):
+        if document is self.document:
+            return
+        if self.document is not None:
+            self.deactivateDocument()
+
+        self.document = document
+        self.workspace.touch(document)
+        if self.textCtrl is None:
+            self.restoreEditor(document)
+        self.setTitle()
+
+        # A tab keeps its last render; only a compacted one renders again
+        if self.viewMenu_prev.IsChecked():
+            if self.sourceMap is not None:
+                self.virtualPreview.setBlocks(self.sourceMap.blocks, document.previewPosition or (0, 0))
+            else:
+                self.virtualPreview.clear()
+                self.md2html()
+
+        # Loading pauses while the tab is in the background
+        if self.loader is not None:
+            wx.CallAfter(self.loadChunk, self.loader)
+        self.trimWorkspace()
+
+    def deactivateDocument(self):
+        document = self.document
+        self.previewTimer.Stop()
+        self.preview.cancel()
+        self.autosaveTimer.Stop()
+        if self.modify:
+            self.autosaver.record(self.model.snapshot())
+
+        document.length = self.textCtrl.GetLastPosition()
+        document.insertion = self.textCtrl.GetInsertionPoint()
+        document.previewPosition = self.virtualPreview.position()
+
+    def trimWorkspace(self):
+        for document in self.workspace.trim(self.document):
+            self.evictEditor(document)
+
+    def evictEditor(self, document):
+        # Unsaved and read-only text is kept; anything else is on disk
+        textCtrl = document.editor
+        document.readOnly = not textCtrl.IsEditable()
+        document.text = document.model.text() if document.modify or document.readOnly else None
+        document.model.set("")
+        document.editor = None
+        textCtrl.Destroy()
+
+    def restoreEditor(self, document):
+        self.createEditor(document)
+        if document.text is not None:
+            self.setEditorText(document, document.text, change=True)
+            document.text = None
+        elif document.largeFile:
+            self.openLarge(document.path, encoding=document.encoding)
+            return
+        elif document.filename != "untitled" and os.path.exists(document.path):
+            with open(document.path, "r", encoding=document.encoding) as file:
+                self.setEditorText(document, file.read(), change=True)
+
+        self.textCtrl.SetEditable(not document.readOnly)
+        self.textCtrl.SetInsertionPoint(document.insertion)
+        self.textCtrl.ShowPosition(document.insertion)
+
+    def setEditorText(self, document, text, change=False):
+        # The model takes the text whole instead of from the editor's
+        # content events, which would copy it back out of the control
+        self.mirroring = False
+        try:
+            if change:
+                document.editor.ChangeValue(text)
+            else:
+                document.editor.SetValue(text)
+        finally:
+            self.mirroring = True
+        document.model.set(text)
+
+    def onContentInserted(self, e, document):
+        # Ranges are inclusive
+        if self.mirroring:
+            start, end = e.GetRange().GetStart(), e.GetRange().GetEnd() + 1
+            document.model.insert(start, document.editor.GetRange(start, end))
+        e.Skip()
+
+    def onContentDeleted(self, e, document):
+        if self.mirroring:
+            document.model.delete(e.GetRange().GetStart(), e.GetRange().GetEnd() + 1)
+        e.Skip()
+
+    def syncModel(self, full=False):
+        # Clear() and a few other calls change the text without a content
+        # event. Edits compare the length and the text at the start and
+        # around the caret; full compares everything, as before a save
+        if full:
+            text = self.textCtrl.GetValue()
+            if text == self.model.text():
+                return
+        elif self.model.matches(self.textCtrl.GetLastPosition(), self.textCtrl.GetRange,
+                                (0, self.textCtrl.GetInsertionPoint())):
+            return
+        else:
+            text = self.textCtrl.GetValue()
+        print("model out of sync, rebuilt")
+        self.model.set(text)
+
+    def freshTab(self):
+        return self.filename == "untitled" and not self.modify and self.textCtrl.IsEmpty()
+
+    def onCloseTab(self, e):
+        document = self.document
+        self.deactivateDocument()
+        self.document = None
+        self.closeDocument(document)
+
+        if not len(self.workspace):
+            self.newDocument()
+        else:
+            self.selectDocument(self.documentAt(self.notebook.GetSelection()))
+
+    def releaseDocument(self, document):
+        # Unsaved work stays in the journal and is offered again on startup
+        if document.loader is not None:
+            document.loader.close()
+            document.loader = None
+        document.autosaver.stop(keep=document.modify)
+
+    def closeDocument(self, document):
+        self.releaseDocument(document)
+        self.workspace.remove(document)
+        self.notebook.DeletePage(self.notebook.FindPage(document.page))
 
     def createMenu(self):
         menuBar = wx.MenuBar()
@@ -200,6 +763,8 @@ class textEditor(wx.Frame):
             wx.ID_NEW, "&New\tCtrl+N")
         self.fileMenu_open = fileMenu.Append(
             wx.ID_OPEN, "&Open\tCtrl+O")
+        self.fileMenu_closeTab = fileMenu.Append(
+            wx.ID_CLOSE, "&Close Tab\tCtrl+W")
         fileMenu.AppendSeparator()
         self.fileMenu_save = fileMenu.Append(
             wx.ID_SAVE, "&Save\tCtrl+S")
@@ -208,16 +773,25 @@ class textEditor(wx.Frame):
         fileMenu.AppendSeparator()
         self.fileMenu_exportPdf = fileMenu.Append(
             wx.ID_ANY, "&Export as PDF (.pdf)\tCtrl+Shift+E")
+        self.fileMenu_cancelExport = fileMenu.Append(
+            wx.ID_ANY, "&Cancel Export")
+        self.fileMenu_cancelExport.Enable(False)
         fileMenu.AppendSeparator()
         self.fileMenu_quit = fileMenu.Append(
             wx.ID_EXIT, "&Quit\tCtrl+Q")
 
         self.editMenu_find = editMenu.Append(
             wx.ID_FIND, "&Find\tCtrl+F")
+        self.editMenu_findNotes = editMenu.Append(
+            wx.ID_ANY, "Find in &Notes\tCtrl+Shift+F")
+        self.editMenu_replaceFiles = editMenu.Append(
+            wx.ID_ANY, "&Replace in Files\tCtrl+Shift+H")
 
         self.viewMenu_prev = viewMenu.AppendCheckItem(
             wx.ID_ANY, "Show HTML Preview")
         viewMenu.Check(self.viewMenu_prev.GetId(), True)
+        self.viewMenu_perf = viewMenu.Append(
+            wx.ID_ANY, "&Performance")
 
         self.helpMenu_reference = helpMenu.Append(
             wx.ID_ANY, "&Reference\tCtrl+R")
@@ -249,12 +823,18 @@ class textEditor(wx.Frame):
     def bindEvents(self):
         self.Bind(wx.EVT_MENU, self.onNew, self.fileMenu_new)
         self.Bind(wx.EVT_MENU, self.onOpen, self.fileMenu_open)
+        self.Bind(wx.EVT_MENU, self.onCloseTab, self.fileMenu_closeTab)
         self.Bind(wx.EVT_MENU, self.onSave, self.fileMenu_save)
         self.Bind(wx.EVT_MENU, self.onSaveAs, self.fileMenu_saveAs)
         self.Bind(wx.EVT_MENU, self.onQuit, self.fileMenu_quit)
+        # The window's close button cleans up the same way as File > Quit
+        self.Bind(wx.EVT_CLOSE, self.onQuit)
         self.Bind(wx.EVT_MENU, self.onExport, self.fileMenu_exportPdf)
+        self.Bind(wx.EVT_MENU, self.onCancelExport,
+                  self.fileMenu_cancelExport)
 
         self.Bind(wx.EVT_MENU, self.togglePrev, self.viewMenu_prev)
+        self.Bind(wx.EVT_MENU, self.onPerfDlg, self.viewMenu_perf)
 
         self.Bind(wx.EVT_MENU, self.onCredits, self.helpMenu_credits)
         self.Bind(wx.EVT_MENU, self.onReference, self.helpMenu_reference)
@@ -264,13 +844,17 @@ class textEditor(wx.Frame):
 
         self.Bind(wx.EVT_FIND, self.onFindDlg)
         self.Bind(wx.EVT_MENU, self.onFindDlg, self.editMenu_find)
+        self.Bind(wx.EVT_MENU, self.onNotesDlg, self.editMenu_findNotes)
+        self.Bind(wx.EVT_MENU, self.onReplaceDlg, self.editMenu_replaceFiles)
 
         self.htmlPrev.Bind(html.EVT_HTML_LINK_CLICKED, self.onURL)
 
-        self.textCtrl.Bind(wx.EVT_LEFT_UP, self.onCursorPos)
+        self.notebook.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.onTabChanged)
+        self.Bind(wx.EVT_TIMER, self.onPreviewTimer, self.previewTimer)
+        self.Bind(wx.EVT_TIMER, self.onAutosaveTimer, self.autosaveTimer)
 
     def assignHotkeys(self):
-        accelEntries = [wx.AcceleratorEntry() for i in range(7)]
+        accelEntries = [wx.AcceleratorEntry() for i in range(10)]
 
         accelEntries[0].Set(wx.ACCEL_CTRL, ord('N'), wx.ID_NEW)
         accelEntries[1].Set(wx.ACCEL_CTRL, ord('O'), wx.ID_OPEN)
@@ -281,22 +865,116 @@ class textEditor(wx.Frame):
         accelEntries[5].Set(wx.ACCEL_CTRL, ord('F'), wx.ID_FIND)
         accelEntries[6].Set(wx.ACCEL_CTRL, ord(
             'R'), self.helpMenu_reference.GetId())
+        accelEntries[7].Set(wx.ACCEL_CTRL, ord('W'), wx.ID_CLOSE)
+        accelEntries[8].Set(wx.ACCEL_CTRL | wx.ACCEL_SHIFT, ord('F'),
+                            self.editMenu_findNotes.GetId())
+        accelEntries[9].Set(wx.ACCEL_CTRL | wx.ACCEL_SHIFT, ord('H'),
+                            self.editMenu_replaceFiles.GetId())
 
         accelTable = wx.AcceleratorTable(accelEntries)
         self.SetAcceleratorTable(accelTable)
 
     def md2html(self):
-        md = self.textCtrl.GetValue()
-        html = markdown.markdown(
-            md, extensions=self.mdExtensions)
-        self.htmlPrev.SetPage(html)
+        self.previewTimer.Stop()
+        if self.largeFile:
+            self.preview.submit(self.visibleText())
+        else:
+            self.preview.submit(self.model.snapshot())
+
+    def visibleText(self):
+        # Whole Markdown blocks around the first visible position
+        first = self.textCtrl.GetFirstVisiblePosition()
+        last = self.textCtrl.GetLastPosition()
+        start = max(0, first - largefile.WINDOW // 4)
+        end = min(last, first + largefile.WINDOW)
+        return largefile.trim_blocks(self.textCtrl.GetRange(start, end), start > 0, end < last)
+
+    def renderMarkdown(self, md):
+        # Runs on the preview thread, which also builds the text of a snapshot
+        md = str(md)
+        with perf.span("md2html", chars=len(md)):
+            return self.mdCache.render_map(md, self.mdExtensions)
+
+    def onPreviewReady(self, revision, sourceMap):
+        if self.preview.isCurrent(revision):
+            self.sourceMap = sourceMap
+            # Only timed when the page was actually laid out again
+            timer = perf.begin("SetPage", blocks=len(sourceMap))
+            if self.virtualPreview.setBlocks(sourceMap.blocks):
+                timer.end()
+
+    def onTextChange(self, e):
+        if self.loader is None:
+            self.syncModel()
+            self.modify = True
+            self.autosaveTimer.StartOnce(self.autosaveDelay)
+            if self.viewMenu_prev.IsChecked():
+                self.previewTimer.StartOnce(self.previewDelay)
+        e.Skip()
+
+    def onPreviewTimer(self, e):
+        self.md2html()
+
+    def onAutosaveTimer(self, e):
+        if self.modify:
+            self.autosaver.record(self.model.snapshot())
+
+    def beginDocument(self, path):
+        # Called after the buffer was replaced: nothing is unsaved yet
+        self.modify = False
+        self.autosaveTimer.Stop()
+        self.autosaver.begin(path, self.encoding, self.model.snapshot())
+
+    def onRecover(self, found):
+        if not found:
+            return
+
+        names = ", ".join(os.path.basename(recovery.path) if recovery.path else "untitled"
+                          for recovery in found)
+        dlg = wx.MessageDialog(self, "Unsaved changes to " + names + " were found from an earlier session.\n"
+                               "Restore them?", "Recover", style=wx.YES_NO | wx.ICON_QUESTION)
+        restore = dlg.ShowModal() == wx.ID_YES
+        dlg.Destroy()
+
+        if not restore:
+            for recovery in found:
+                self.autosaver.forget(recovery.key)
+            return
+
+        # One tab per recovered document
+        for recovery in found:
+            if not self.freshTab():
+                self.newDocument()
+            if recovery.path:
+                self.dirname, self.filename = os.path.split(recovery.path)
+                self.setTitle()
+            else:
+                self.autosaver.forget(recovery.key)
+            self.encoding = recovery.encoding
+            self.setEditorText(self.document, recovery.text)
+            self.beginDocument(recovery.path)
+            self.modify = True
+            self.md2html()
+        self.statusbar.SetStatusText("Recovered unsaved changes to " + names)
+
+    def onEditorScroll(self, e):
+        if self.largeFile and self.viewMenu_prev.IsChecked():
+            self.previewTimer.StartOnce(self.previewDelay)
+        elif self.viewMenu_prev.IsChecked():
+            # The editor has not scrolled yet while the event is handled
+            wx.CallAfter(self.syncPreview)
+        e.Skip()
+
+    def syncPreview(self):
+        # Large files preview the visible text only, which is already in sync
+        if self.sourceMap is None or self.largeFile:
+            return
+        position = self.textCtrl.GetFirstVisiblePosition()
+        line = self.model.line_of(position)
+        self.virtualPreview.scrollTo(*self.sourceMap.locate(line))
 
     def onNew(self, e):
-        self.textCtrl.SetValue("")
-        self.textCtrl.SetEditable(True)
-        print("read-only mode deactivated")
-        self.filename = "untitled"
-        self.setTitle()
+        self.newDocument()
 
     def onFileDlg(self):
         return dict(message="Choose a file", defaultDir=self.dirname)
@@ -318,44 +996,175 @@ class textEditor(wx.Frame):
         return userFilename
 
     def onOpen(self, e):
+        dirname, filename = self.dirname, self.filename
         if self.askFilename(style=wx.FD_OPEN, **self.onFileDlg(), wildcard=wildcard):
-            file = open(os.path.join(self.dirname, self.filename),
-                        "r", encoding="utf-8")
-            self.textCtrl.SetValue(file.read())
-            file.close()
-            self.md2html()
-            print("read-only mode deactivated")
+            path = os.path.join(self.dirname, self.filename)
+            self.dirname, self.filename = dirname, filename
+            self.openFile(path)
+
+    def openFile(self, path):
+        document = self.workspace.find(path)
+        if document is not None:
+            # Already open: switching to its tab is all it takes
+            self.selectDocument(document)
+            return
+
+        if not self.freshTab():
+            self.newDocument()
+        self.dirname, self.filename = os.path.split(path)
+        self.setTitle()
+
+        timer = perf.begin("onOpen", path=path)
+        self.cancelLoad()
+
+        if largefile.is_large(path):
+            self.openLarge(path, timer)
+            return
+
+        self.largeFile = False
+        self.encoding = largefile.detect_encoding(path)
+        with open(path, "r", encoding=self.encoding) as file:
+            self.setEditorText(self.document, file.read())
+        timer.end()
+        self.beginDocument(path)
+        self.md2html()
+        print("read-only mode deactivated")
+        self.textCtrl.SetEditable(True)
+
+    def openLarge(self, path, timer=perf.NULL, encoding=None):
+        # Unless known, the encoding is detected on the loader's thread
+        self.largeFile = True
+        self.loader = largefile.ChunkedLoader(path, encoding)
+        self.loader.start()
+        self.loadTimer = timer
+        self.textCtrl.SetEditable(False)
+        self.textCtrl.Clear()
+        self.model.set("")
+        print("large-file mode activated")
+        self.loadChunk(self.loader)
+
+    def loadChunk(self, loader):
+        # One chunk per event loop turn, so the window keeps painting
+        if loader is not self.loader:
+            return
+
+        try:
+            text = loader.poll()
+        except (OSError, ValueError, LookupError) as error:
+            # What was read so far stays, editable, as after a load
+            self.loader = None
+            self.loadTimer.end(large=True, error=str(error))
+            self.syncModel(full=True)
+            self.textCtrl.SetEditable(True)
+            self.statusbar.SetStatusText("Load failed: " + str(error))
+            print("load failed:", error)
+            return
+        if text is None:
+            self.loader = None
+            self.encoding = loader.encoding
+            self.loadTimer.end(large=True)
+            self.syncModel(full=True)
+            self.beginDocument(loader.path)
+            self.textCtrl.SetInsertionPoint(0)
             self.textCtrl.SetEditable(True)
+            self.statusbar.SetStatusText("")
+            self.md2html()
+            return
+
+        if not text:
+            # The worker is still detecting or decoding
+            wx.CallLater(self.loadPollDelay, self.loadChunk, loader)
+            return
+        self.textCtrl.AppendText(text)
+        self.statusbar.SetStatusText(
+            "Loading file... {:.0%}".format(loader.progress()))
+        wx.CallAfter(self.loadChunk, loader)
+
+    def cancelLoad(self):
+        if self.loader is not None:
+            self.loader.close()
+            self.loader = None
 
     def onSave(self, e):
-        with open(os.path.join(self.dirname, self.filename), "w", encoding="utf-8") as file:
-            file.write(self.textCtrl.GetValue())
-            self.md2html()
+        path = os.path.join(self.dirname, self.filename)
+        if not self.modify and os.path.exists(path):
+            self.statusbar.SetStatusText("No changes to save")
+            return
+        self.saveFile(path)
 
     def onSaveAs(self, e):
         if self.askFilename(defaultFile=self.filename, style=wx.FD_SAVE, **self.onFileDlg(), wildcard=wildcard):
-            self.onSave(e)
+            self.saveFile(os.path.join(self.dirname, self.filename))
+
+    def saveFile(self, path):
+        # Written atomically on the autosave thread; typing goes on meanwhile
+        self.modify = False
+        self.autosaveTimer.Stop()
+        self.statusbar.SetStatusText("Saving...")
+        timer = perf.begin("onSave", path=path)
+        self.syncModel(full=True)
+        self.autosaver.save(path, self.model.snapshot(), self.encoding,
+                            lambda path, error: wx.CallAfter(self.onSaved, path, error, timer))
+
+    def onSaved(self, path, error, timer=perf.NULL):
+        timer.end(error=error)
+        if error is None:
+            self.statusbar.SetStatusText("Saved " + os.path.basename(path))
+        else:
+            self.modify = True
+            self.statusbar.SetStatusText("Save failed: " + str(error))
+            print("save failed:", error)
 
     def onExport(self, e):
+        if self.exportJob is not None:
+            self.statusbar.SetStatusText("An export is already running")
+            return
+
         if self.askFilename(defaultDir=self.dirname, defaultFile=self.filename, style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT, wildcard="PDF (*.pdf)|*.pdf"):
 
-            content = markdown.markdown(
-                self.textCtrl.GetValue(), extensions=self.mdExtensions)
             output = self.filename
 
-            with open("options/pdf_options.html", "r", encoding="utf-8") as options:
-                source = options.read() + content + \
-                    "<pdf:nextpage/><div><pdf:toc/></div><div><pdf:spacer height=""20pt""><hr><p>Made with <span style=""font-weight:bold;"">Littera Note-taking App</span></p></div>" + "</body></html>"
-
-            def html2pdf(source, output):
-                with open(os.path.join(self.dirname, output), "w+b") as file:
-                    pdf = pisa.CreatePDF(
-                        source, dest=file)
-                    return pdf.err
             self.statusbar.SetStatusText("Exporting file...")
 
-            html2pdf(source, output)
-        self.statusbar.SetStatusText("")
+            # Conversion runs in a separate process; the editor stays usable
+            timer = perf.begin("onExport", path=output)
+            self.exportJob = export.ExportJob(
+                self.model.text(), os.path.join(self.dirname, output), self.mdExtensions,
+                onProgress=lambda kind, value: wx.CallAfter(
+                    self.onExportProgress, kind, value),
+                onDone=lambda result, value: wx.CallAfter(self.onExportDone, output, result, value, timer))
+            self.fileMenu_cancelExport.Enable(True)
+
+    def onExportProgress(self, kind, value):
+        if kind == "PASS":
+            self.exportPass = value
+        elif kind == "PAGE":
+            text = "Exporting file... page " + str(value)
+            if self.exportPass > 1:
+                text += " (pass " + str(self.exportPass) + ")"
+            self.statusbar.SetStatusText(text)
+
+    def onExportDone(self, output, result, value, timer=perf.NULL):
+        timer.end(result=result)
+        self.exportJob = None
+        self.exportPass = 1
+        self.fileMenu_cancelExport.Enable(False)
+
+        if result == "DONE" and not value:
+            text = "Exported " + output
+        elif result == "DONE":
+            text = "Exported " + output + " with " + str(value) + " error(s)"
+        elif result == "CANCELLED":
+            text = "Export cancelled"
+        else:
+            text = "Export failed: " + str(value)
+        self.statusbar.SetStatusText(text)
+        print(text)
+
+    def onCancelExport(self, e):
+        if self.exportJob is not None:
+            self.statusbar.SetStatusText("Cancelling export...")
+            self.exportJob.cancel()
 
     def onFindDlg(self, e):
         if self.findDlg == None:
@@ -365,44 +1174,88 @@ class textEditor(wx.Frame):
             self.findDlg.Show()
 
     def onFind(self, e):
-        word = self.findDlg.textEntry.GetValue().lower()
-        content = self.textCtrl.GetValue().lower()
-
-        index = 0
-
-        if word in content:
-            count = content.count(word)
-            results = []
-
-            while index < len(content):
-                index = content.find(word, index)
-
-                if index == -1:
-                    break
-                index += 1
-                results.append((index-1))
-
-            self.iterators = itertools.cycle(results)
-
-            i = 0
-
-            for i in results:
-                self.textCtrl.SetInsertionPoint(next(self.iterators))
-                self.textCtrl.ScrollIntoView(
-                    self.textCtrl.GetInsertionPoint(), 13)
-                self.textCtrl.Update()
-                self.textCtrl.Refresh()
-                self.textCtrl.SetFocus()
+        word = self.findDlg.textEntry.GetValue()
+
+        try:
+            with perf.span("onFind", query=word):
+                # Kept up to date by the model's changes once it is built
+                if not self.searchIndex.blocks:
+                    self.searchIndex.update(self.model.text())
+                self.searchResults = self.searchIndex.find(
+                    word, case=self.findDlg.caseCheck.GetValue(),
+                    word=self.findDlg.wordCheck.GetValue(), regex=self.findDlg.regexCheck.GetValue())
+        except re.error as error:
+            self.statusbar.SetStatusText("Invalid pattern: " + str(error))
+            return
+
+        if self.searchResults:
+            self.showMatch(self.searchResults.after(
+                self.textCtrl.GetInsertionPoint()))
+            count = len(self.searchResults)
             self.statusbar.SetStatusText(
                 "Found " + str(count) + " instance(s) of " + word)
-            print(word, "found", str(count), "times at", str(results))
+            print(word, "found", str(count), "times")
         else:
+            self.statusbar.SetStatusText(word + " not found")
             print(word, "not found")
 
+    def showMatch(self, span):
+        start, end = span
+        self.textCtrl.SetSelection(start, end)
+        self.textCtrl.ShowPosition(start)
+        self.textCtrl.SetFocus()
+
+    def onNotesDlg(self, e):
+        if self.notesDlg is None:
+            print("notesDlg opened")
+            # Loaded here, not at startup: it brings in sqlite3
+            import notes  # noqa: F401
+
+            self.notesDlg = notesDlg(self)
+            self.notesDlg.Show()
+
+    def onReplaceDlg(self, e):
+        if self.replaceDlg is None:
+            print("replaceDlg opened")
+            # Loaded here, not at startup: it brings in concurrent.futures
+            import multireplace  # noqa: F401
+
+            self.replaceDlg = replaceDlg(self)
+            self.replaceDlg.Show()
+
+    def unsavedPaths(self):
+        return set(os.path.abspath(document.path) for document in self.workspace
+                   if document.modify and document.filename != "untitled")
+
+    def reloadFiles(self, paths):
+        # Open tabs follow files changed on disk; their edits were never
+        # touched, see unsavedPaths
+        paths = set(os.path.abspath(path) for path in paths)
+        for document in self.workspace:
+            if document.modify or document.largeFile or os.path.abspath(document.path) not in paths:
+                continue
+            document.compact()
+            if document.editor is None:
+                continue
+            with open(document.path, "r", encoding=document.encoding) as file:
+                text = file.read()
+            self.setEditorText(document, text, change=True)
+            document.autosaver.begin(document.path, document.encoding, text)
+            if document is self.document:
+                self.md2html()
+
+    def onPerfDlg(self, e):
+        if self.perfDlg is None:
+            print("perfDlg opened")
+
+            self.perfDlg = perfDlg(self)
+            self.perfDlg.Show()
+
     def togglePrev(self, e):
         if self.viewMenu_prev.IsChecked():
             self.splitter.SetMinimumPaneSize(460)
             self.statusbar.SetStatusText("HTML Preview shown")
+            self.md2html()
             print("HTML Preview shown")
         else:
             self.splitter.SetMinimumPaneSize(1)
@@ -415,8 +1268,13 @@ class textEditor(wx.Frame):
         return
 
     def onReadOnly(self, filename):
+        self.cancelLoad()
+        self.largeFile = False
         with open(filename, "r", encoding="utf-8") as file:
-            self.textCtrl.SetValue(file.read())
+            self.setEditorText(self.document, file.read())
+            self.modify = False
+            self.autosaveTimer.Stop()
+            self.autosaver.discard()
             self.md2html()
             self.textCtrl.SetEditable(False)
             print("read-only mode activated")
@@ -435,6 +1293,8 @@ class textEditor(wx.Frame):
             "https://github.com/programmingdesigner/littera/blob/main/LICENSE")
 
     def onAbout(self, e):
+        import wx.adv
+
         info = wx.adv.AboutDialogInfo()
         info.SetName(self.appname)
         info.SetVersion(self.appversion)
@@ -449,16 +1309,26 @@ class textEditor(wx.Frame):
         e.Skip()
 
     def onQuit(self, e):
+        self.deactivateDocument()
+        if self.exportJob is not None:
+            self.exportJob.cancel()
+        self.previewTimer.Stop()
+        self.preview.stop()
+
+        for document in self.workspace:
+            self.releaseDocument(document)
         self.Destroy()
 
 
 def main():
     app = wx.App()
+    startup.mark("app")
     frame = textEditor()
+    startup.mark("frame")
     frame.Show()
     app.MainLoop()
-    pisa.showLogging()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,280 @@
+"""
+Block-level Markdown render cache
+
+Splits a document into top-level Markdown blocks and renders only the blocks
+whose source changed since the last call. Rendered blocks are kept in a
+bounded LRU keyed by a hash of the block source and the active extensions.
+"""
+
+import re
+import bisect
+import hashlib
+from collections import OrderedDict
+
+from converter import convert
+
+
+# Extensions whose output depends on the whole document (numbering,
+# collected definitions). When one is active the document is rendered in one
+# piece and cached as a single block.
+GLOBAL_EXTENSIONS = {"footnotes", "toc", "abbr", "wikilinks", "meta"}
+
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+LIST_RE = re.compile(r"^ {0,3}([*+-]|\d+[.)])[ \t]")
+REFERENCE_RE = re.compile(
+    r"^ {0,3}\[([^\]^][^\]]*)\]:[ \t]*\S.*(?:\n[ \t]+[\"'(].*)?$", re.MULTILINE)
+SETEXT_RE = re.compile(r"^[=-]+[ ]*$")
+HTML_OPEN_RE = re.compile(r"^ {0,3}<(!--|[a-zA-Z][a-zA-Z0-9]*)(?=[\s/>]|$)")
+
+# Tags that start a raw HTML block, as Python-Markdown's
+# block_level_elements, less the void ones, which have nothing to close
+HTML_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "body", "canvas", "colgroup", "dd", "details",
+    "div", "dl", "dt", "fieldset", "figcaption", "figure", "footer", "form", "group", "h1", "h2",
+    "h3", "h4", "h5", "h6", "header", "hgroup", "html", "iframe", "legend", "li", "main", "map",
+    "math", "menu", "nav", "noscript", "object", "ol", "option", "output", "p", "pre", "progress",
+    "script", "section", "style", "summary", "table", "tbody", "td", "textarea", "tfoot", "th",
+    "thead", "tr", "ul", "video"}
+
+
+def extension_name(extension):
+    if not isinstance(extension, str):
+        extension = type(extension).__module__
+    return extension.split(":")[0].rsplit(".", 1)[-1]
+
+
+def html_depth(tag, line, depth):
+    """Return how many tag elements are open after line."""
+    if tag == "!--":
+        return 0 if "-->" in line else depth
+    line = line.lower()
+    opened = len(re.findall(r"<" + tag + r"(?=[\s/>]|$)", line))
+    return depth + opened - line.count("</" + tag + ">")
+
+
+def line_kinds(lines, fences=True):
+    """Return, for each line, None for Markdown, "open" for the first line
+    of a fenced code (if fences) or raw HTML block (an element or a
+    comment), and "inside" for the lines after it up to the one that
+    closes it."""
+    kinds = []
+    fence = None
+    tag = None
+    depth = 0
+    for line in lines:
+        if fence is not None:
+            kinds.append("inside")
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        if tag is not None:
+            kinds.append("inside")
+            depth = html_depth(tag, line, depth)
+            if depth <= 0:
+                tag = None
+            continue
+
+        match = FENCE_RE.match(line) if fences else None
+        if match:
+            fence = match.group(1)
+            kinds.append("open")
+            continue
+        match = HTML_OPEN_RE.match(line)
+        if match and (match.group(1) == "!--" or match.group(1).lower() in HTML_BLOCK_TAGS):
+            tag = match.group(1).lower()
+            # The opening tag counts once; a comment opened on this line
+            # may close on it too
+            depth = html_depth(tag, line[match.end():] if tag == "!--" else line, 1 if tag == "!--" else 0)
+            kinds.append("open")
+            if depth <= 0:
+                tag = None
+            continue
+        kinds.append(None)
+    return kinds
+
+
+def split_blocks(text):
+    """Return a list of (first_line, source) tuples, one per top-level block.
+    Blank lines inside fenced code and raw HTML do not end a block."""
+    blocks = []
+    lines = text.split("\n")
+    current = []
+    start = 0
+    blank = False
+    # Whether the block has a list item or quote line yet: a loose list or
+    # quote goes on past a blank line, even after a heading
+    listed = quoted = False
+
+    def flush():
+        if current:
+            blocks.append((start, "\n".join(current)))
+
+    for number, (line, kind) in enumerate(zip(lines, line_kinds(lines))):
+        if kind == "inside":
+            current.append(line)
+            continue
+
+        if not line.strip():
+            if current:
+                current.append(line)
+            blank = True
+            continue
+
+        opens_block = blank and current and not line[0] in " \t"
+        if opens_block and LIST_RE.match(line) and listed:
+            opens_block = False
+        if opens_block and line.startswith(">") and quoted:
+            opens_block = False
+
+        if opens_block or not current:
+            while current and not current[-1].strip():
+                current.pop()
+            flush()
+            current = []
+            start = number
+            listed = quoted = False
+
+        current.append(line)
+        listed = listed or bool(LIST_RE.match(line))
+        quoted = quoted or line.startswith(">")
+        blank = False
+
+    while current and not current[-1].strip():
+        current.pop()
+    flush()
+    return blocks
+
+
+def collect_references(text, fences=True):
+    """Return the reference definitions of text, one per line, leaving out
+    look-alikes in raw HTML, if fences in fenced code, and at the start of a
+    block above a setext underline, where they are heading text."""
+    lines = text.split("\n")
+    kinds = line_kinds(lines, fences)
+    lines = [line if kind is None else "" for line, kind in zip(lines, kinds)]
+    for number in range(len(lines) - 1):
+        if SETEXT_RE.match(lines[number + 1]) and (number == 0 or not lines[number - 1].strip()):
+            lines[number] = ""
+    markdown = "\n".join(lines)
+    return "\n".join(match.group(0) for match in REFERENCE_RE.finditer(markdown))
+
+
+class SourceMap:
+    """The rendered blocks of one document and the source line each block
+    starts on, so editor positions can be matched to preview blocks."""
+
+    def __init__(self, lines, blocks, total):
+        self.lines = lines
+        self.blocks = blocks
+        self.total = total
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def block_at(self, line):
+        return max(0, bisect.bisect_right(self.lines, line) - 1)
+
+    def locate(self, line):
+        """Return (block index, fraction of the block above line)."""
+        if not self.blocks:
+            return 0, 0.0
+        index = self.block_at(line)
+        first = self.lines[index]
+        last = self.lines[index + 1] if index + 1 < len(self.lines) else self.total
+        return index, min(1.0, max(0.0, (line - first) / max(1, last - first)))
+
+
+# Approximate bytes of a cache entry besides its HTML: key, dict slot
+ENTRY_OVERHEAD = 200
+
+
+class BlockCache:
+    """LRU of rendered Markdown blocks, bounded in entries and in bytes.
+
+    One cache can serve any number of documents: blocks are keyed by their
+    source, so text shared between documents is rendered once."""
+
+    def __init__(self, maxsize=65536, maxbytes=64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.blocks = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def clear(self):
+        self.blocks.clear()
+        self.bytes = 0
+
+    def _key(self, *parts):
+        digest = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            digest.update(part.encode("utf-8", "surrogatepass"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _get(self, key):
+        html = self.blocks.get(key)
+        if html is not None:
+            self.blocks.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return html
+
+    def _put(self, key, html):
+        old = self.blocks.get(key)
+        if old is not None:
+            self.bytes -= len(old) + ENTRY_OVERHEAD
+        self.blocks[key] = html
+        self.blocks.move_to_end(key)
+        self.bytes += len(html) + ENTRY_OVERHEAD
+        while len(self.blocks) > self.maxsize or \
+                (self.bytes > self.maxbytes and len(self.blocks) > 1):
+            _, evicted = self.blocks.popitem(last=False)
+            self.bytes -= len(evicted) + ENTRY_OVERHEAD
+
+    def render(self, text, extensions=()):
+        return "\n".join(self.render_map(text, extensions).blocks)
+
+    def render_blocks(self, text, extensions=()):
+        """Return the rendered HTML of each non-empty top-level block."""
+        return self.render_map(text, extensions).blocks
+
+    def render_map(self, text, extensions=()):
+        """Render text and return the blocks as a SourceMap."""
+        total = text.count("\n") + 1
+        extensions = list(extensions)
+        extKey = ",".join(extension_name(ext) for ext in extensions)
+
+        if GLOBAL_EXTENSIONS.intersection(map(extension_name, extensions)):
+            key = self._key(extKey, text)
+            html = self._get(key)
+            if html is None:
+                html = convert(text, extensions)
+                self._put(key, html)
+            return SourceMap([0], [html], total) if html else SourceMap([], [], total)
+
+        # Reference definitions may be used from any block, so every block
+        # that could contain a link is rendered together with all of them.
+        references = collect_references(text, "fenced_code" in map(extension_name, extensions))
+
+        lines = []
+        parts = []
+        for line, source in split_blocks(text):
+            linked = references and "[" in source
+            key = self._key(extKey, references if linked else "", source)
+            html = self._get(key)
+            if html is None:
+                if linked:
+                    html = convert(source + "\n\n" + references, extensions)
+                else:
+                    html = convert(source, extensions)
+                self._put(key, html)
+            if html:
+                lines.append(line)
+                parts.append(html)
+        return SourceMap(lines, parts, total)
@@ -0,0 +1,173 @@
+"""
+Local stand-in for the chat completions API
+
+Answers POST /v1/chat/completions the way the OpenAI API does, as one JSON
+object or, with "stream": true, as server-sent events carrying one
+chat.completion.chunk per token and a final "data: [DONE]". The answer
+repeats the last user message, padded with filler words, so the streaming
+path of the editor can be tried and timed offline.
+
+With --rpm it also enforces a requests-per-minute limit the way the API
+does, answering 429 with a Retry-After header, and --errors makes that
+fraction of requests fail with a 503, for trying retries and backoff.
+
+Usage: python -m mockllm [--port 8765] [--ttft 0.3] [--delay 0.02] [--tokens 200]
+                         [--rpm N] [--errors FRACTION]
+
+Then point the editor at it with LITTERA_LLM_BASE=http://127.0.0.1:8765/v1
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+import collections
+
+
+REASONS = {200: b"OK", 404: b"Not Found", 429: b"Too Many Requests", 503: b"Service Unavailable"}
+
+FILLER = ("Here is a longer answer so that the stream has something to carry. "
+          "Each word arrives as a token of its own, a little while after the last one.").split()
+
+
+class MockServer:
+    def __init__(self, ttft=0.3, delay=0.02, tokens=200, rpm=0, errors=0.0, seed=0):
+        self.ttft = ttft
+        self.delay = delay
+        self.tokens = tokens
+        self.rpm = rpm
+        self.errors = errors
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rejected = 0
+        self.recent = collections.deque()
+
+    def answer(self, messages):
+        question = next((message.get("content", "") for message in reversed(messages)
+                         if message.get("role") == "user"), "")
+        words = ("You asked: " + question).split()
+        while len(words) < self.tokens:
+            words += FILLER
+        return [word + " " for word in words[:self.tokens]]
+
+    async def handle(self, reader, writer):
+        # Keep-alive: requests on one connection are answered in turn
+        try:
+            while await self.respond(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, reader, writer):
+        request = await reader.readline()
+        if not request:
+            return False
+        method, path, _ = request.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        if method != "POST" or not path.endswith("/chat/completions"):
+            await self.send(writer, 404, {"error": {"message": "not found: " + path, "type": "invalid_request_error"}})
+            return True
+
+        now = time.monotonic()
+        while self.recent and self.recent[0] <= now - 60:
+            self.recent.popleft()
+        if self.rpm and len(self.recent) >= self.rpm:
+            self.rejected += 1
+            await self.send(writer, 429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                            {"Retry-After": "{:.3f}".format(self.recent[0] + 60 - now)})
+            return True
+        if self.errors and self.random.random() < self.errors:
+            self.rejected += 1
+            await self.send(writer, 503, {"error": {"message": "The server is overloaded", "type": "server_error"}})
+            return True
+        self.recent.append(now)
+
+        self.requests += 1
+        params = json.loads(body or b"{}")
+        ident = "chatcmpl-mock{}".format(self.requests)
+        model = params.get("model", "mock")
+        tokens = self.answer(params.get("messages", []))
+        await asyncio.sleep(self.ttft)
+
+        if not params.get("stream"):
+            await asyncio.sleep(self.delay * len(tokens))
+            await self.send(writer, 200, {
+                "id": ident, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": len(body) // 4, "completion_tokens": len(tokens),
+                          "total_tokens": len(body) // 4 + len(tokens)}})
+            return True
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n")
+        deltas = [{"role": "assistant"}] + [{"content": token} for token in tokens] + [{}]
+        for index, delta in enumerate(deltas):
+            chunk = {"id": ident, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta,
+                                                  "finish_reason": "stop" if not delta else None}]}
+            self.chunk(writer, "data: " + json.dumps(chunk) + "\n\n")
+            await writer.drain()
+            if 0 < index < len(deltas) - 2:
+                await asyncio.sleep(self.delay)
+        self.chunk(writer, "data: [DONE]\n\n")
+        self.chunk(writer, "")
+        await writer.drain()
+        return True
+
+    def chunk(self, writer, text):
+        data = text.encode("utf-8")
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    async def send(self, writer, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        extra = "".join("{}: {}\r\n".format(name, value) for name, value in (headers or {}).items())
+        writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n%s\r\n%s" % (
+            status, REASONS.get(status, b"Error"), len(data), extra.encode("latin-1"), data))
+        await writer.drain()
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening and return the API base URL."""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return "http://{}:{}/v1".format(host, port)
+
+    def close(self):
+        self.server.close()
+
+
+async def serve(args):
+    server = MockServer(args.ttft, args.delay, args.tokens, args.rpm, args.errors)
+    print("mock chat completions API at", await server.start(args.host, args.port))
+    await server.server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mockllm", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per answer")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (default: no limit)")
+    parser.add_argument("--errors", type=float, default=0.0, help="fraction of requests failing with 503")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Find and replace across a folder of notes
+
+Files are matched in a process pool and streamed back one result at a time,
+each with its hit count and a few preview lines; nothing is written until
+the preview is applied. Applying writes every file atomically and records
+the originals as one change set on disk, which undo() restores in one go.
+A file that changed since it was previewed is left alone, and so is a file
+that changed again since the change set was applied.
+
+Usage: python -m multireplace ROOT FIND REPLACE [--regex] [--case] [--word]
+                              [--apply] [-j WORKERS]
+       python -m multireplace --undo [ID]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import appdirs
+
+import autosave
+import largefile
+import notes
+from search import compile_pattern
+
+
+FOLDER = os.path.join(appdirs.user_data_dir("Littera"), "changesets")
+PREVIEW_LINES = 5
+PREVIEW_WIDTH = 120
+
+Query = collections.namedtuple("Query", "text replacement case word regex")
+Hit = collections.namedtuple("Hit", "line before after")
+FileResult = collections.namedtuple("FileResult", "path encoding count size digest hits error")
+Totals = collections.namedtuple("Totals", "files matched hits bytes seconds")
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def compile_query(query):
+    return compile_pattern(query.text, query.case, query.word, query.regex)
+
+
+def expander(query):
+    # A literal replacement is inserted as typed, backslashes and all
+    if query.regex:
+        return lambda match: match.expand(query.replacement)
+    return lambda match: query.replacement
+
+
+def clip(line):
+    line = line.strip()
+    return line if len(line) <= PREVIEW_WIDTH else line[:PREVIEW_WIDTH - 3] + "..."
+
+
+def read(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    encoding = largefile.data_encoding(data)
+    # Decoded without newline translation, so line endings survive a write
+    return data, encoding, data.decode(encoding)
+
+
+def scan_file(path, query):
+    """Count the matches in one file; runs in a worker process."""
+    try:
+        data, encoding, text = read(path)
+    except (OSError, UnicodeDecodeError) as error:
+        return FileResult(path, None, 0, 0, None, [], str(error))
+
+    pattern = compile_query(query)
+    replace = expander(query)
+    count = 0
+    hits = []
+    for match in pattern.finditer(text):
+        if match.end() == match.start():
+            continue
+        count += 1
+        if len(hits) < PREVIEW_LINES:
+            start = text.rfind("\n", 0, match.start()) + 1
+            end = text.find("\n", match.end())
+            end = len(text) if end == -1 else end
+            line = text.count("\n", 0, match.start()) + 1
+            hits.append(Hit(line, clip(text[start:end]),
+                            clip(text[start:match.start()] + replace(match) + text[match.end():end])))
+    return FileResult(path, encoding, count, len(data), digest(data), hits, None)
+
+
+def replace_file(path, query, expected, backup):
+    """Apply query to one file if it still is as previewed; returns
+    (path, digest after, error)."""
+    try:
+        data, encoding, text = read(path)
+        if digest(data) != expected:
+            return path, None, "changed since the preview"
+        # Empty matches are skipped, as in the preview
+        replace = expander(query)
+        text = compile_query(query).sub(
+            lambda match: replace(match) if match.end() > match.start() else "", text)
+        after = text.encode(encoding)
+        autosave.atomic_write(backup, data)
+        autosave.atomic_write(path, after)
+    except (OSError, UnicodeError) as error:
+        return path, None, str(error)
+    return path, digest(after), None
+
+
+def restore_file(path, backup, expected):
+    try:
+        with open(path, "rb") as file:
+            if digest(file.read()) != expected:
+                return path, "changed since the replace"
+        with open(backup, "rb") as file:
+            autosave.atomic_write(path, file.read())
+    except OSError as error:
+        return path, str(error)
+    return path, None
+
+
+def pool_map(function, jobs, workers):
+    """Yield function(*job) for every job, in order, from a process pool
+    unless a single worker was asked for."""
+    if workers <= 1 or not jobs:
+        for job in jobs:
+            yield function(*job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(function, *zip(*jobs), chunksize=16)
+
+
+def scan(paths, query, workers=os.cpu_count() or 1):
+    """Yield a FileResult per path, as the pool gets through them."""
+    yield from pool_map(scan_file, [(path, query) for path in paths], workers)
+
+
+def find_files(root):
+    return sorted(os.path.join(root, path) for path, stat in notes.note_files(root))
+
+
+class Preview:
+    """Results of a scan; what apply() will change."""
+
+    def __init__(self, root, query):
+        self.root = os.path.abspath(root)
+        self.query = query
+        self.results = []
+        self.scanned = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+    def add(self, result):
+        self.scanned += 1
+        self.bytes += result.size
+        if result.count or result.error:
+            self.results.append(result)
+        self.seconds = time.perf_counter() - self.start
+
+    @property
+    def matched(self):
+        return [result for result in self.results if result.count]
+
+    def totals(self):
+        matched = self.matched
+        return Totals(self.scanned, len(matched), sum(result.count for result in matched),
+                      self.bytes, self.seconds)
+
+
+def preview(root, query, workers=os.cpu_count() or 1, progress=None):
+    found = Preview(root, query)
+    for result in scan(find_files(found.root), query, workers):
+        found.add(result)
+        if progress is not None:
+            progress(found, result)
+    return found
+
+
+class ChangeSet:
+    """Files changed by one apply(), with their originals kept for undo."""
+
+    def __init__(self, ident, root, query, files):
+        self.ident = ident
+        self.root = root
+        self.query = query
+        # [path, backup, digest after, error]
+        self.files = files
+
+    @property
+    def folder(self):
+        return os.path.join(FOLDER, self.ident)
+
+    def save(self):
+        manifest = dict(root=self.root, query=self.query._asdict(), files=self.files)
+        autosave.atomic_write(os.path.join(self.folder, "manifest.json"),
+                              json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+
+    @staticmethod
+    def load(ident):
+        with open(os.path.join(FOLDER, ident, "manifest.json"), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        return ChangeSet(ident, manifest["root"], Query(**manifest["query"]), manifest["files"])
+
+    @staticmethod
+    def latest():
+        """Return the most recent change set that was not undone and
+        changed something, or None."""
+        try:
+            idents = sorted(os.listdir(FOLDER))
+        except FileNotFoundError:
+            return None
+        for ident in reversed(idents):
+            try:
+                changes = ChangeSet.load(ident)
+            except (OSError, ValueError):
+                continue
+            if changes.changed:
+                return changes
+        return None
+
+    @property
+    def changed(self):
+        return [entry for entry in self.files if entry[3] is None]
+
+    def undo(self, workers=1):
+        """Restore the originals; return [(path, error)] of files that
+        could not be restored. Only those stay in the change set, which is
+        dropped once it is empty."""
+        jobs = [(path, backup, after) for path, backup, after, error in self.changed]
+        failed = [(path, error) for path, error in pool_map(restore_file, jobs, workers) if error]
+        paths = set(path for path, error in failed)
+        self.files = [entry for entry in self.changed if entry[0] in paths]
+        if self.files:
+            self.save()
+        else:
+            shutil.rmtree(self.folder, ignore_errors=True)
+        return failed
+
+
+def apply(found, workers=os.cpu_count() or 1, skip=()):
+    """Write the previewed replacements and return their ChangeSet. It is
+    saved for undo only if some file was changed."""
+    ident = time.strftime("%Y%m%d-%H%M%S-") + digest(os.urandom(8))[:6]
+    changes = ChangeSet(ident, found.root, found.query, [])
+    jobs = [(result.path, found.query, result.digest,
+             os.path.join(changes.folder, "{}.orig".format(number)))
+            for number, result in enumerate(found.matched) if result.path not in skip]
+    if not jobs:
+        return changes
+
+    os.makedirs(changes.folder, exist_ok=True)
+    for (path, query, expected, backup), (_, after, error) in zip(
+            jobs, pool_map(replace_file, jobs, workers)):
+        changes.files.append([path, backup, after, error])
+    if changes.changed:
+        changes.save()
+    else:
+        shutil.rmtree(changes.folder, ignore_errors=True)
+    return changes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m multireplace", description="Find and replace across a folder of notes.")
+    parser.add_argument("root", nargs="?", help="folder searched recursively for .md and .txt files")
+    parser.add_argument("find", nargs="?")
+    parser.add_argument("replace", nargs="?")
+    parser.add_argument("--regex", action="store_true", help="FIND is a regular expression")
+    parser.add_argument("--case", action="store_true", help="match case")
+    parser.add_argument("--word", action="store_true", help="match whole words only")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default: preview only)")
+    parser.add_argument("--undo", nargs="?", const="", default=None, metavar="ID",
+                        help="undo a change set (default: the latest)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    if args.undo is None and (args.root is None or args.find is None or args.replace is None):
+        parser.error("ROOT, FIND and REPLACE are required unless --undo is given")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.undo is not None:
+        changes = ChangeSet.load(args.undo) if args.undo else ChangeSet.latest()
+        if changes is None:
+            print("nothing to undo")
+            return 1
+        jobs = changes.changed
+        failed = changes.undo(args.workers)
+        for path, error in failed:
+            print("NOT RESTORED", path, error)
+        print("undid {}: {} file(s) restored".format(changes.ident, len(jobs) - len(failed)))
+        return 1 if failed else 0
+
+    query = Query(args.find, args.replace, args.case, args.word, args.regex)
+
+    def progress(found, result):
+        if result.error:
+            print("FAILED  ", result.path, result.error)
+        elif result.count:
+            print("{:6} hit(s)  {}".format(result.count, os.path.relpath(result.path, found.root)))
+            for hit in result.hits:
+                print("   {:6}  - {}\n           + {}".format(hit.line, hit.before, hit.after))
+
+    found = preview(args.root, query, args.workers, progress)
+    totals = found.totals()
+    print("{} hit(s) in {} of {} file(s), {:.1f} KiB in {:.2f}s with {} worker(s): "
+          "{:.1f} files/s, {:.1f} MiB/s".format(
+              totals.hits, totals.matched, totals.files, totals.bytes / 1024, totals.seconds,
+              args.workers, totals.files / max(totals.seconds, 1e-9),
+              totals.bytes / 1024 / 1024 / max(totals.seconds, 1e-9)))
+
+    if not args.apply or not totals.hits:
+        return 0
+    changes = apply(found, args.workers)
+    for path, backup, after, error in changes.files:
+        if error:
+            print("SKIPPED ", path, error)
+    print("changed {} file(s); undo with: python -m multireplace --undo {}".format(
+        len(changes.changed), changes.ident))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
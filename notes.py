@@ -0,0 +1,176 @@
+"""
+Full-text index over a folder of notes
+
+Every .md and .txt file below a folder is indexed in an SQLite FTS5 table
+kept in the cache directory, one database per folder. refresh() compares
+each file's mtime and size with what was indexed and only reads the files
+that changed, so keeping the index current costs a directory walk.
+
+Queries take words, "quoted phrases", prefix* terms and OR/NOT; results are
+ranked with bm25, matches in the title counting more than in the body.
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import collections
+
+import appdirs
+
+import largefile
+
+
+EXTENSIONS = (".md", ".markdown", ".txt")
+SCHEMA = 1
+# bm25 weights of the title and body columns
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+Hit = collections.namedtuple("Hit", "path title snippet score")
+Changes = collections.namedtuple("Changes", "added updated removed")
+
+OPERATORS = ("OR", "NOT", "AND")
+TERM = re.compile(r'"[^"]*"?|\S+')
+
+
+def index_path(root):
+    folder = os.path.join(appdirs.user_cache_dir("Littera"), "notes")
+    key = hashlib.blake2b(os.path.abspath(root).encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(folder, key + ".sqlite")
+
+
+def note_files(root):
+    """Yield (relative path, stat) of every note below root."""
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            if name.lower().endswith(EXTENSIONS):
+                path = os.path.join(folder, name)
+                try:
+                    yield os.path.relpath(path, root), os.stat(path)
+                except OSError:
+                    continue
+
+
+def note_title(path, text):
+    for line in text.splitlines()[:20]:
+        if line.startswith("#"):
+            title = line.lstrip("#").strip()
+            if title:
+                return title
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def match_query(text):
+    """Turn what was typed into an FTS5 query: every word is quoted, so
+    punctuation is never taken for query syntax. NOT only excludes from
+    what comes before it, so a query with nothing before a NOT (or only
+    an OR) is rejected as a whole and "" returned."""
+    terms = []
+    for term in TERM.findall(text):
+        if term in OPERATORS:
+            if term == "NOT" and (not terms or terms[-1] == "OR"):
+                return ""
+            if term == "NOT" and terms[-1] == "AND":
+                terms[-1] = term
+            elif terms and terms[-1] not in OPERATORS:
+                terms.append(term)
+            continue
+        prefix = term.endswith("*") and not term.startswith('"')
+        words = term.strip('"').rstrip("*") if prefix else term.strip('"')
+        if not words.strip():
+            continue
+        terms.append('"' + words.replace('"', '""') + '"' + ("*" if prefix else ""))
+    while terms and terms[-1] in OPERATORS:
+        terms.pop()
+    return " ".join(terms)
+
+
+class NotesIndex:
+    def __init__(self, root, path=None):
+        self.root = os.path.abspath(root)
+        self.path = path or index_path(self.root)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # WAL lets the editor search while a refresh writes
+        self.db = sqlite3.connect(self.path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA:
+            self._create()
+
+    def _create(self):
+        with self.db:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("DROP TABLE IF EXISTS notes")
+            self.db.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT UNIQUE,"
+                            " mtime INTEGER, size INTEGER)")
+            self.db.execute("CREATE VIRTUAL TABLE notes USING fts5(title, body,"
+                            " tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+            # Used by "ORDER BY rank"
+            self.db.execute("INSERT INTO notes (notes, rank) VALUES ('rank', 'bm25({}, {})')".format(
+                TITLE_WEIGHT, BODY_WEIGHT))
+            self.db.execute("PRAGMA user_version={}".format(SCHEMA))
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT count(*) FROM files").fetchone()[0]
+
+    def _read(self, path):
+        with open(os.path.join(self.root, path), "rb") as file:
+            data = file.read()
+        text = data.decode(largefile.data_encoding(data), errors="replace")
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def refresh(self, cancelled=lambda: False):
+        """Bring the index up to date with the folder; return Changes."""
+        known = dict((path, (ident, mtime, size)) for ident, path, mtime, size in
+                     self.db.execute("SELECT id, path, mtime, size FROM files"))
+        added = updated = 0
+
+        with self.db:
+            for path, stat in note_files(self.root):
+                if cancelled():
+                    break
+                entry = known.pop(path, None)
+                if entry is not None and entry[1:] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    text = self._read(path)
+                except OSError:
+                    continue
+
+                if entry is None:
+                    ident = self.db.execute("INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                                            (path, stat.st_mtime_ns, stat.st_size)).lastrowid
+                    added += 1
+                else:
+                    ident = entry[0]
+                    self.db.execute("UPDATE files SET mtime=?, size=? WHERE id=?",
+                                    (stat.st_mtime_ns, stat.st_size, ident))
+                    self.db.execute("DELETE FROM notes WHERE rowid=?", (ident,))
+                    updated += 1
+                self.db.execute("INSERT INTO notes (rowid, title, body) VALUES (?, ?, ?)",
+                                (ident, note_title(path, text), text))
+            else:
+                # Only a complete walk knows which files are gone
+                for path, (ident, mtime, size) in known.items():
+                    self.db.execute("DELETE FROM files WHERE id=?", (ident,))
+                    self.db.execute("DELETE FROM notes WHERE rowid=?", (ident,))
+                return Changes(added, updated, len(known))
+        return Changes(added, updated, 0)
+
+    def search(self, query, limit=100):
+        """Return up to limit Hits for query, best first."""
+        query = match_query(query)
+        if not query:
+            return []
+        rows = self.db.execute(
+            "SELECT files.path, notes.title, snippet(notes, 1, '[', ']', '...', 12), rank"
+            " FROM notes JOIN files ON files.id = notes.rowid"
+            " WHERE notes MATCH ? ORDER BY rank LIMIT ?", (query, limit))
+        return [Hit(os.path.join(self.root, path), title, " ".join(snippet.split()), -score)
+                for path, title, snippet, score in rows]
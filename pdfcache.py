@@ -0,0 +1,148 @@
+"""
+On-disk cache of rendered PDF fragments
+
+Each top-level section of an export is stored as a small PDF plus the table
+of contents entries it produced, keyed by the section HTML, the template and
+the fonts it was rendered with. Re-exporting after a small edit then only
+renders the sections that changed. The folder is capped in size and evicts
+the least recently used fragments.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+import appdirs
+
+import export
+
+
+def digest(*parts):
+    hasher = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else part.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class FragmentCache:
+    def __init__(self, folder=None, maxbytes=256 * 1024 * 1024):
+        self.folder = folder or os.path.join(
+            appdirs.user_cache_dir("Littera"), "fragments")
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.stamps = {}
+        self.fonts = None
+        self.total = None
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _stamp(self, path):
+        # Hash of a file or of every file below a folder, cached per mtime
+        if os.path.isdir(path):
+            entries = []
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    stat = os.stat(full)
+                    entries.append("{}:{}:{}".format(
+                        os.path.relpath(full, path), stat.st_size, stat.st_mtime_ns))
+            return digest(*entries)
+
+        stat = os.stat(path)
+        known = self.stamps.get(path)
+        if known is None or known[0] != stat.st_mtime_ns:
+            with open(path, "rb") as file:
+                known = (stat.st_mtime_ns, digest(file.read()))
+            self.stamps[path] = known
+        return known[1]
+
+    def key(self, section, template=export.TEMPLATE):
+        if self.fonts is None:
+            self.fonts = self._stamp(os.path.join(export.BASEDIR, "fonts"))
+        return digest(section, self._stamp(template), self.fonts)
+
+    def _paths(self, key):
+        base = os.path.join(self.folder, key)
+        return base + ".pdf", base + ".json"
+
+    def get(self, key):
+        """Return (pdf bytes, toc entries, pisa errors) or None."""
+        pdf, meta = self._paths(key)
+        try:
+            with open(meta, "r", encoding="utf-8") as file:
+                info = json.load(file)
+            with open(pdf, "rb") as file:
+                data = file.read()
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # mtime doubles as the last-used time for eviction
+        for path in (pdf, meta):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        self.hits += 1
+        return data, [tuple(entry) for entry in info["toc"]], info["err"]
+
+    def put(self, key, data, toc, err):
+        if err:
+            return
+        pdf, meta = self._paths(key)
+        info = json.dumps({"toc": [list(entry) for entry in toc], "err": err}).encode("utf-8")
+        self._write(pdf, data)
+        self._write(meta, info)
+
+        if self.total is None:
+            self.total = self.size()
+        else:
+            self.total += len(data) + len(info)
+        if self.total > self.maxbytes:
+            self.evict()
+
+    def _write(self, path, data):
+        handle, temp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    def size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.folder)
+                   if entry.is_file())
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith(".pdf"):
+                key = entry.name[:-4]
+                stat = entry.stat()
+                meta = os.path.join(self.folder, key + ".json")
+                size = stat.st_size + (os.path.getsize(meta) if os.path.exists(meta) else 0)
+                entries.append((stat.st_mtime, key, size))
+                total += size
+
+        # Evict down to a low-water mark so the next puts do not rescan
+        entries.sort()
+        while entries and total > self.maxbytes * 0.8:
+            _, key, size = entries.pop(0)
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+        self.total = total
+
+    def clear(self):
+        for entry in os.scandir(self.folder):
+            if entry.is_file():
+                os.remove(entry.path)
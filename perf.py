@@ -0,0 +1,127 @@
+"""
+Performance instrumentation
+
+Spans time an operation and, when instrumentation is on, are written as one
+JSON object per line to a rotating log and kept in a short per-operation
+history for the perf panel. When it is off, span() and begin() hand back a
+shared object whose methods do nothing, so instrumented code pays for one
+function call and a flag check.
+
+    with perf.span("find", query=word):
+        ...
+
+    timer = perf.begin("save")     # for work finished in a callback
+    ...
+    timer.end(path=path)
+
+Set LITTERA_PERF=1 to switch it on at startup.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import collections
+from logging.handlers import RotatingFileHandler
+
+import appdirs
+
+
+LOG_FILE = os.path.join(appdirs.user_log_dir("Littera"), "perf.log")
+HISTORY = 200
+
+enabled = False
+logger = logging.getLogger("littera.perf")
+logger.propagate = False
+
+lock = threading.Lock()
+history = collections.defaultdict(lambda: collections.deque(maxlen=HISTORY))
+
+
+class Span:
+    __slots__ = ("name", "fields", "start")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is not None:
+            self.fields["error"] = kind.__name__
+        self.end()
+
+    def end(self, **fields):
+        elapsed = time.perf_counter() - self.start
+        self.fields.update(fields)
+        record(self.name, elapsed, **self.fields)
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        pass
+
+    def end(self, **fields):
+        pass
+
+
+NULL = NullSpan()
+
+
+def span(name, **fields):
+    return Span(name, fields) if enabled else NULL
+
+
+begin = span
+
+
+def record(name, seconds, **fields):
+    if not enabled:
+        return
+    with lock:
+        history[name].append(seconds)
+    event = {"ts": round(time.time(), 3), "op": name, "ms": round(seconds * 1000, 3)}
+    event.update(fields)
+    logger.info(json.dumps(event, default=str))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def stats():
+    """Return {operation: (count, last, p95)} with times in seconds."""
+    with lock:
+        return dict((name, (len(values), values[-1], percentile(values, 0.95)))
+                    for name, values in history.items() if values)
+
+
+def enable(path=LOG_FILE, maxBytes=1024 * 1024, backupCount=3):
+    global enabled
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=maxBytes,
+                                      backupCount=backupCount, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+if os.environ.get("LITTERA_PERF"):
+    enable()
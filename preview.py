@@ -0,0 +1,240 @@
+"""
+Background preview rendering
+
+Markdown is converted on a worker thread so the editor stays responsive.
+Bursts of requests are coalesced, and results for anything but the newest
+revision are thrown away before they reach the UI.
+
+The rendered blocks are shown by VirtualPreview, which hands the HtmlWindow
+only the blocks around the visible one, so layout time and memory follow
+the size of the view rather than of the document.
+"""
+
+import threading
+import time
+
+import wx
+
+
+# Characters of HTML laid out at a time: a few screens of text
+BUDGET = 64 * 1024
+
+
+class PreviewRenderer(threading.Thread):
+    def __init__(self, render, callback, delay=0.0):
+        super().__init__(name="PreviewRenderer", daemon=True)
+
+        self.render = render
+        self.callback = callback
+        self.delay = delay
+
+        self.revision = 0
+        self.pending = None
+        self.deadline = 0.0
+        self.running = True
+        self.condition = threading.Condition()
+
+        self.start()
+
+    def submit(self, text, delay=None):
+        """Queue text for rendering and return its revision number."""
+        with self.condition:
+            self.revision += 1
+            self.pending = (self.revision, text)
+            self.deadline = time.monotonic() + \
+                (self.delay if delay is None else delay)
+            self.condition.notify()
+            return self.revision
+
+    def cancel(self):
+        with self.condition:
+            self.revision += 1
+            self.pending = None
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.pending = None
+            self.condition.notify()
+
+    def isCurrent(self, revision):
+        return revision == self.revision
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if self.pending is None:
+                        self.condition.wait()
+                        continue
+                    remaining = self.deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # A newer submit moves the deadline; keep waiting for it
+                    self.condition.wait(remaining)
+                if not self.running:
+                    return
+                revision, text = self.pending
+                self.pending = None
+
+            try:
+                html = self.render(text)
+            except Exception as error:
+                print("preview render failed:", error)
+                continue
+
+            if self.isCurrent(revision):
+                wx.CallAfter(self.callback, revision, html)
+
+
+def window_range(sizes, anchor, budget=BUDGET):
+    """Return (start, end) of the blocks to lay out around block anchor:
+    about a quarter of budget before it and the rest after it."""
+    if not sizes:
+        return 0, 0
+    anchor = max(0, min(anchor, len(sizes) - 1))
+    start, end = anchor, anchor + 1
+    used = sizes[anchor]
+
+    while end < len(sizes) and used + sizes[end] <= budget * 3 // 4:
+        used += sizes[end]
+        end += 1
+    while start > 0 and used + sizes[start - 1] <= budget:
+        start -= 1
+        used += sizes[start]
+    while end < len(sizes) and used + sizes[end] <= budget:
+        used += sizes[end]
+        end += 1
+    return start, end
+
+
+class VirtualPreview:
+    """Shows rendered blocks in an HtmlWindow one window at a time.
+
+    Scrolling near either end of the laid out blocks moves the window. The
+    block at the top of the view, and how far into it the view is, stay put
+    across updates."""
+
+    def __init__(self, window, budget=BUDGET):
+        self.window = window
+        self.budget = budget
+        self.blocks = []
+        self.sizes = []
+        self.start = 0
+        self.end = 0
+        # (y, block index) of every block laid out, in page order
+        self.offsets = []
+
+        window.Bind(wx.EVT_SCROLLWIN, self.onScroll)
+        window.Bind(wx.EVT_MOUSEWHEEL, self.onScroll)
+        window.Bind(wx.EVT_SIZE, self.onScroll)
+
+    def setBlocks(self, blocks, position=None):
+        """Show blocks, at position (block index, pixels into it) if given,
+        otherwise where the view is now. Return False if nothing had to be
+        laid out again."""
+        anchor, offset = self.position() if position is None else position
+        shown = self.blocks[self.start:self.end]
+        self.blocks = blocks
+        self.sizes = [len(block) for block in blocks]
+
+        # An edit outside the laid out blocks leaves the page as it is;
+        # otherwise only this window is laid out again
+        if position is None and self.offsets and blocks[self.start:self.end] == shown and \
+                window_range(self.sizes, anchor, self.budget) == (self.start, self.end):
+            return False
+        self.show(anchor, offset)
+        return True
+
+    def clear(self):
+        self.blocks = []
+        self.sizes = []
+        self.start = self.end = 0
+        self.offsets = []
+        self.window.SetPage("")
+
+    def scrollTo(self, index, fraction=0.0):
+        """Scroll so that the given part of block index is at the top."""
+        if not self.blocks:
+            return
+        index = max(0, min(index, len(self.blocks) - 1))
+        if not self.start <= index < self.end:
+            self.show(index)
+
+        positions = dict((blockIndex, y) for y, blockIndex in self.offsets)
+        if index not in positions:
+            return
+        following = positions.get(index + 1, self.window.GetVirtualSize().height)
+        target = positions[index] + int((following - positions[index]) * fraction)
+
+        unit = self.window.GetScrollPixelsPerUnit()[1] or 1
+        self.window.Scroll(0, target // unit)
+        self.checkEdges()
+
+    def position(self):
+        """Return (block index, pixels into it) at the top of the view."""
+        if not self.offsets:
+            return self.start, 0
+        top = self.window.GetViewStart()[1] * self.window.GetScrollPixelsPerUnit()[1]
+        y, index = self.offsets[0]
+        for blockY, blockIndex in self.offsets:
+            if blockY > top:
+                break
+            y, index = blockY, blockIndex
+        return index, top - y
+
+    def show(self, anchor, offset=0):
+        start, end = window_range(self.sizes, anchor, self.budget)
+        page = "".join('<div id="b{}">{}</div>'.format(index, self.blocks[index])
+                       for index in range(start, end))
+
+        self.window.Freeze()
+        try:
+            self.window.SetPage(page)
+            self.start, self.end = start, end
+            self.offsets = self.measure()
+
+            target = next((y for y, index in self.offsets if index == anchor), None)
+            if target is not None:
+                unit = self.window.GetScrollPixelsPerUnit()[1] or 1
+                self.window.Scroll(0, (target + offset) // unit)
+        finally:
+            self.window.Thaw()
+
+    def measure(self):
+        offsets = []
+        cells = [self.window.GetInternalRepresentation()]
+        while cells:
+            cell = cells.pop()
+            if cell is None:
+                continue
+            ident = cell.GetId()
+            if ident.startswith("b") and ident[1:].isdigit():
+                offsets.append((cell.GetAbsPos().y, int(ident[1:])))
+                continue
+            child = cell.GetFirstChild()
+            while child is not None:
+                cells.append(child)
+                child = child.GetNext()
+        offsets.sort()
+        return offsets
+
+    def onScroll(self, e):
+        e.Skip()
+        # The view has not moved yet while the event is handled
+        wx.CallAfter(self.checkEdges)
+
+    def checkEdges(self):
+        if not self.offsets:
+            return
+        unit = self.window.GetScrollPixelsPerUnit()[1] or 1
+        top = self.window.GetViewStart()[1] * unit
+        height = self.window.GetClientSize().height
+        total = self.window.GetVirtualSize().height
+
+        if (self.start > 0 and top < height) or \
+                (self.end < len(self.blocks) and top + 2 * height > total):
+            anchor, offset = self.position()
+            # A block bigger than the budget cannot be windowed any further
+            if window_range(self.sizes, anchor, self.budget) != (self.start, self.end):
+                self.show(anchor, offset)
@@ -0,0 +1,186 @@
+"""
+Indexed search over the editor buffer
+
+The buffer is kept as blocks of whole lines. Each block carries the set of
+lower-cased trigrams it contains and the results of queries already run
+against it, so a repeated query only scans blocks that changed since, and a
+literal query skips blocks that cannot contain it.
+"""
+
+import re
+import bisect
+
+
+BLOCK_SIZE = 8192
+
+
+def trigrams(text):
+    return set(zip(text, text[1:], text[2:]))
+
+
+class Block:
+    __slots__ = ("text", "grams", "results")
+
+    def __init__(self, text):
+        self.text = text
+        # Built once a second query has to scan the block, so that a single
+        # search costs no more than a plain scan
+        self.grams = None
+        self.results = {}
+
+
+def split_lines(text, size=BLOCK_SIZE):
+    """Split text into pieces of about size characters ending on a newline."""
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + size)
+        end = len(text) if end == -1 else end + 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+def compile_pattern(query, case=False, word=False, regex=False):
+    """Compile a query with the options of the find dialog."""
+    source = query if regex else re.escape(query)
+    if word:
+        source = r"\b(?:" + source + r")\b"
+    return re.compile(source, 0 if case else re.IGNORECASE)
+
+
+class SearchResults:
+    """Match spans with a cursor; next() is O(1) and never re-scans."""
+
+    def __init__(self, spans):
+        self.spans = spans
+        self.index = -1
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __bool__(self):
+        return bool(self.spans)
+
+    def first(self):
+        self.index = 0
+        return self.spans[0]
+
+    def next(self):
+        self.index = (self.index + 1) % len(self.spans)
+        return self.spans[self.index]
+
+    def after(self, position):
+        """Jump to the first match at or after position, wrapping around."""
+        self.index = bisect.bisect_left(self.spans, (position,)) % len(self.spans)
+        return self.spans[self.index]
+
+
+class SearchIndex:
+    def __init__(self, text=""):
+        self.blocks = []
+        self.starts = []
+        self.length = 0
+        self.revision = 0
+        self.cache = {}
+        self.update(text)
+
+    def text(self):
+        return "".join(block.text for block in self.blocks)
+
+    def _reindex(self):
+        self.starts = []
+        position = 0
+        for block in self.blocks:
+            self.starts.append(position)
+            position += len(block.text)
+        self.length = position
+
+    def update(self, text):
+        """Bring the index up to date with text, rebuilding only the blocks
+        between the first and last character that differ."""
+        if not self.blocks:
+            self.edit(0, 0, text)
+            return
+
+        old = self.length
+        limit = min(len(text), old)
+
+        # Common prefix and suffix, compared block by block
+        start = 0
+        for index, block in enumerate(self.blocks):
+            size = len(block.text)
+            if text[start:start + size] != block.text:
+                break
+            start += size
+        else:
+            if len(text) == old:
+                return
+
+        end = 0
+        for block in reversed(self.blocks):
+            size = len(block.text)
+            if end + size > limit - start or text[len(text) - end - size:len(text) - end] != block.text:
+                break
+            end += size
+
+        self.edit(start, old - end, text[start:len(text) - end])
+
+    def edit(self, start, end, replacement):
+        """Replace characters start:end of the indexed text."""
+        self.revision += 1
+        self.cache.clear()
+        if not self.blocks:
+            self.blocks = [Block(piece) for piece in split_lines(replacement)]
+            self._reindex()
+            return
+
+        first = max(0, bisect.bisect_right(self.starts, start) - 1)
+        last = max(first, bisect.bisect_right(self.starts, end - 1) - 1)
+        head = self.starts[first]
+        old = "".join(block.text for block in self.blocks[first:last + 1])
+        text = old[:start - head] + replacement + old[end - head:]
+
+        # Blocks end on a newline so that no line is split between two
+        while not text.endswith("\n") and last + 1 < len(self.blocks):
+            last += 1
+            text += self.blocks[last].text
+
+        self.blocks[first:last + 1] = [Block(piece) for piece in split_lines(text)]
+        self._reindex()
+
+    def _scan(self, block, key, pattern, grams):
+        results = block.results.get(key)
+        if results is None:
+            if grams and block.grams is not None and not grams <= block.grams:
+                results = []
+            else:
+                results = [(m.start(), m.end()) for m in pattern.finditer(block.text)
+                           if m.end() > m.start()]
+                if block.grams is None and block.results:
+                    block.grams = trigrams(block.text.lower())
+            block.results[key] = results
+        return results
+
+    def find(self, query, case=False, word=False, regex=False):
+        """Return SearchResults with the (start, end) of every match."""
+        if not query:
+            return SearchResults([])
+
+        pattern = compile_pattern(query, case, word, regex)
+        key = (pattern.pattern, case)
+
+        # Matches of a literal query lie inside one line, and so inside one
+        # block; anything that may span lines is searched in the whole text.
+        if regex or "\n" in query:
+            if key not in self.cache:
+                self.cache[key] = [(m.start(), m.end()) for m in pattern.finditer(self.text())
+                                   if m.end() > m.start()]
+            return SearchResults(self.cache[key])
+
+        grams = trigrams(query.lower())
+        spans = []
+        for start, block in zip(self.starts, self.blocks):
+            spans.extend((start + a, start + b)
+                         for a, b in self._scan(block, key, pattern, grams))
+        return SearchResults(spans)
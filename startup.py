@@ -0,0 +1,132 @@
+"""
+Startup timing
+
+The editor imports this module before anything else and marks the steps of
+a launch on it: imports done, frame built, first paint, deferred resources
+loaded. Run as a script it prints a report to compare across releases:
+
+    python -m startup [--module main] [--top 15] [--json FILE] [--no-launch]
+
+Per-module import times come from a fresh interpreter run with
+-X importtime. The launch steps come from starting the editor with
+LITTERA_STARTUP set to a file, which makes it write its marks there and
+quit once the deferred resources are loaded.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+
+
+START = time.perf_counter()
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+ENV = "LITTERA_STARTUP"
+
+# (step, milliseconds since this module was imported)
+marks = []
+
+
+def mark(name):
+    marks.append((name, round((time.perf_counter() - START) * 1000, 1)))
+
+
+def report_path():
+    return os.environ.get(ENV)
+
+
+def write_marks(path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(marks, file)
+
+
+def import_times(module="main"):
+    """Return (module, depth, self ms, cumulative ms) for module and every
+    module it pulls in, in the order -X importtime lists them."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            cwd=BASEDIR, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in result.stderr.splitlines():
+        fields = line.partition("import time:")[2].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), depth, int(fields[0]) / 1000, int(fields[1]) / 1000))
+
+    # Children are listed before their parent; drop what the interpreter
+    # itself imported before module
+    end = max(index for index, entry in enumerate(times)
+              if entry[0] == module and entry[1] == 0)
+    start = end
+    while start > 0 and times[start - 1][1] > 0:
+        start -= 1
+    return times[start:end + 1]
+
+
+def launch(module="main", timeout=120):
+    """Start the editor once and return the marks it recorded."""
+    handle, path = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    try:
+        subprocess.run([sys.executable, "-m", module], cwd=BASEDIR, timeout=timeout,
+                       env=dict(os.environ, **{ENV: path}), check=True)
+        with open(path, "r", encoding="utf-8") as file:
+            return [tuple(entry) for entry in json.load(file)]
+    finally:
+        os.remove(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="startup", description="Report editor startup times.")
+    parser.add_argument("--module", default="main",
+                        help="editor module to measure (default: main)")
+    parser.add_argument("--top", type=int, default=15,
+                        help="number of slowest imports to list")
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the full report as JSON")
+    parser.add_argument("--no-launch", action="store_true",
+                        help="only measure imports (no display needed)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    times = import_times(args.module)
+    total = next((cumulative for name, depth, _, cumulative in times
+                  if name == args.module and depth == 0), 0.0)
+
+    print("import {}: {:.1f} ms".format(args.module, total))
+    print("{:>10} {:>10}  {}".format("self ms", "total ms", "module"))
+    slowest = sorted((entry for entry in times if entry[1] > 0),
+                     key=lambda entry: entry[3], reverse=True)
+    for name, depth, own, cumulative in slowest[:args.top]:
+        print("{:10.1f} {:10.1f}  {}".format(own, cumulative, name))
+
+    steps = []
+    if not args.no_launch:
+        steps = launch(args.module)
+        print()
+        for name, elapsed in steps:
+            print("{:>14}: {:8.1f} ms".format(name, elapsed))
+
+    if args.json:
+        report = {"module": args.module, "python": platform.python_version(),
+                  "platform": platform.platform(), "import_ms": total,
+                  "imports": [{"module": name, "depth": depth, "self_ms": own, "cumulative_ms": cumulative}
+                              for name, depth, own, cumulative in times],
+                  "marks": dict(steps)}
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
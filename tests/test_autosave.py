@@ -0,0 +1,103 @@
+import os
+import random
+
+import pytest
+
+import autosave
+
+
+def naive_diff(old, new):
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[-end - 1] == new[-end - 1]:
+        end += 1
+    return start, len(old) - end, new[start:len(new) - end]
+
+
+@pytest.mark.parametrize("old, new", [
+    ("", ""), ("", "abc"), ("abc", ""), ("abc", "abc"),
+    ("aaaa", "aaaaa"), ("abcabc", "abc"), ("abXc", "abYc"),
+])
+def test_diff_small(old, new):
+    assert autosave.diff(old, new) == naive_diff(old, new)
+
+
+def test_diff_matches_character_scan():
+    rng = random.Random(1)
+    for _ in range(300):
+        old = "".join(rng.choice("ab\n") for _ in range(rng.randrange(0, 20000)))
+        start = rng.randrange(len(old) + 1)
+        end = rng.randrange(start, min(len(old), start + 50) + 1)
+        new = old[:start] + "".join(rng.choice("ab\n") for _ in range(rng.randrange(0, 30))) + old[end:]
+        found = autosave.diff(old, new)
+        assert found == naive_diff(old, new)
+        assert old[:found[0]] + found[2] + old[found[1]:] == new
+
+
+def recovered(folder):
+    found = []
+    saver = autosave.Autosaver(str(folder))
+    saver.recover(found.extend)
+    saver.stop()
+    return found
+
+
+def test_journal_starts_at_the_first_edit(tmp_path):
+    folder = tmp_path / "autosave"
+    document = tmp_path / "doc.md"
+    document.write_text("text\n", encoding="utf-8")
+
+    saver = autosave.Autosaver(str(folder))
+    saver.begin(str(document), "utf-8", "text\n")
+    saver.save(str(document), "saved\n", "utf-8")
+    saver.record("saved\n")
+    saver.stop(keep=True)
+    assert sorted(os.listdir(folder)) == []
+
+    saver = autosave.Autosaver(str(folder))
+    saver.begin(str(document), "utf-8", "saved\n")
+    saver.record("saved, then edited\n")
+    saver.record("saved, then edited twice\n")
+    # Left behind as after a crash
+    saver.tasks.put(None)
+    saver.join()
+    found = recovered(folder)
+    assert [(recovery.path, recovery.text) for recovery in found] == [
+        (str(document), "saved, then edited twice\n")]
+
+
+def test_recovery_skips_empty_untitled_and_locked_journals(tmp_path):
+    folder = tmp_path / "autosave"
+    folder.mkdir()
+    # An empty untitled snapshot, as earlier versions left on a crash
+    empty = autosave.Journal(str(folder), "untitled-1-2")
+    empty.begin(None, "utf-8", "")
+    empty.compact()
+    empty.close()
+    assert os.path.exists(empty.snapshot)
+
+    # Still open, as in another window
+    live = autosave.Autosaver(str(folder))
+    live.begin(None, "utf-8", "")
+    live.record("not saved yet")
+    try:
+        live.record("not saved yet, still typing")
+        assert recovered(folder) == []
+    finally:
+        live.stop(keep=True)
+
+    assert [recovery.text for recovery in recovered(folder)] == ["not saved yet, still typing"]
+
+
+def test_save_keeps_platform_line_endings(tmp_path, monkeypatch):
+    monkeypatch.setattr(autosave.os, "linesep", "\r\n")
+    path = tmp_path / "doc.md"
+    saved = []
+    saver = autosave.Autosaver(str(tmp_path / "autosave"))
+    saver.save(str(path), "one\ntwo\n", "utf-8", lambda path, error: saved.append(error))
+    saver.stop()
+    assert saved == [None]
+    assert path.read_bytes() == b"one\r\ntwo\r\n"
@@ -0,0 +1,79 @@
+import time
+import asyncio
+import contextlib
+
+import bulkgen
+import mockllm
+from jsonlstore import JsonlStore
+
+
+class Error(Exception):
+    def __init__(self, headers):
+        super().__init__("rate limited")
+        self.headers = headers
+
+
+def test_retry_after():
+    assert bulkgen.retry_after(Error({"Retry-After": "1.5"})) == 1.5
+    assert bulkgen.retry_after(Error({"retry-after": "3600"})) == bulkgen.MAX_BACKOFF
+    assert bulkgen.retry_after(Error({})) is None
+    assert bulkgen.retry_after(Error({"Retry-After": "soon"})) is None
+    assert 0 <= bulkgen.retry_delay(Error({}), 2) <= bulkgen.BACKOFF * 4
+
+
+def test_pause_holds_every_request():
+    async def run():
+        limiter = bulkgen.RateLimiter(rpm=6000)
+        await limiter.acquire(0)
+        limiter.pause(0.2)
+        start = time.monotonic()
+        await limiter.acquire(0)
+        waited = time.monotonic() - start
+        # Nothing was saved up during the pause: the next one waits its turn
+        start = time.monotonic()
+        await limiter.acquire(0)
+        return waited, time.monotonic() - start, limiter.scale
+
+    waited, after, scale = asyncio.run(run())
+    assert waited >= 0.19
+    assert after >= 0.005
+    assert scale == 1.0
+
+
+def test_slow_down_and_recover():
+    limiter = bulkgen.RateLimiter(rpm=60)
+    # A burst of 429s slows down once
+    for _ in range(8):
+        limiter.slow_down()
+    assert limiter.scale == bulkgen.SLOWDOWN
+    successes = 0
+    while limiter.scale < 1.0:
+        limiter.speed_up()
+        successes += 1
+    assert successes <= 4
+
+
+def test_run_retries_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulkgen, "BACKOFF", 0.01)
+    items = [("p{}".format(number), [{"role": "user", "content": "prompt {}".format(number)}])
+             for number in range(20)]
+    output = str(tmp_path / "answers.jsonl")
+
+    async def run():
+        server = mockllm.MockServer(ttft=0.0, delay=0.0, tokens=5, errors=0.3)
+        url = await server.start()
+        try:
+            first = bulkgen.Scheduler(output, 4, apiBase=url, maxTokens=5)
+            second = bulkgen.Scheduler(output, 4, apiBase=url, maxTokens=5)
+            with contextlib.redirect_stdout(None):
+                await first.run(items[:10])
+                skipped, todo = await second.run(items)
+            return first, second, skipped, todo
+        finally:
+            server.close()
+
+    first, second, skipped, todo = asyncio.run(run())
+    assert first.retries > 0
+    assert first.done == 10 and skipped == 10 and todo == 10
+    with JsonlStore(output) as store:
+        assert bulkgen.answered(store) == {ident for ident, _ in items}
@@ -0,0 +1,7 @@
+import chapters
+
+
+def test_toc_escapes_heading_text():
+    toc = chapters.toc_html([(0, "Fish & <b>chips</b>", 3)])
+    assert "Fish &amp; &lt;b&gt;chips&lt;/b&gt;" in toc
+    assert "<b>" not in toc
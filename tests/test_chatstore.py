@@ -0,0 +1,35 @@
+import pytest
+
+import chatstore
+
+
+def test_rows_windows_and_reopen(tmp_path):
+    path = str(tmp_path / "chat.sqlite")
+    store = chatstore.MessageStore(path, page=10, pages=2)
+    store.extend(("user", "message {}".format(number)) for number in range(25))
+    assert len(store) == 25
+    assert store[0].content == "message 0"
+    assert store[-1].content == "message 24"
+    assert [message.index for message in store.window(-5, 3)] == [0, 1, 2]
+    assert [message.index for message in store.window(8, 22)] == list(range(8, 22))
+    assert store.window(30, 40) == []
+    assert len(store.cache) <= 2
+
+    # A row added to a cached page shows up
+    store[24]
+    assert store.append("assistant", "reply") == 25
+    assert store[25] == store.window(25, 26)[0]
+    assert store[25].role == "assistant"
+    store.close()
+
+    store = chatstore.MessageStore(path, page=10)
+    assert len(store) == 26
+    assert store[25].content == "reply"
+    store.close()
+
+
+def test_index_out_of_range(tmp_path):
+    store = chatstore.MessageStore(str(tmp_path / "chat.sqlite"))
+    with pytest.raises(IndexError):
+        store[0]
+    store.close()
@@ -0,0 +1,63 @@
+import queue
+
+import export
+
+
+class ExitedProcess:
+    exitcode = 0
+
+    def is_alive(self):
+        return False
+
+    def join(self):
+        pass
+
+
+class SlowQueue:
+    """A queue whose blocking read times out once before the result shows,
+    as when the process exits right after sending it."""
+
+    def __init__(self, events):
+        self.events = queue.Queue()
+        for event in events:
+            self.events.put(event)
+        self.timedOut = False
+
+    def get(self, timeout=None):
+        if not self.timedOut:
+            self.timedOut = True
+            raise queue.Empty
+        return self.events.get(timeout=timeout)
+
+    def get_nowait(self):
+        return self.events.get_nowait()
+
+
+def watched(events, cancelled=False):
+    job = export.ExportJob.__new__(export.ExportJob)
+    job.output = "unused.pdf"
+    job.cancelled = cancelled
+    job.process = ExitedProcess()
+    job.events = SlowQueue(events)
+    progress = []
+    results = []
+    job.onProgress = lambda kind, value: progress.append((kind, value))
+    job.onDone = lambda result, value: results.append((result, value))
+    job.watch()
+    return results
+
+
+def test_result_sent_just_before_exit_is_not_lost():
+    assert watched([("PAGE", 3), ("DONE", 0)]) == [("DONE", 0)]
+    assert watched([("ERROR", "boom")]) == [("ERROR", "boom")]
+
+
+def test_exit_without_result_is_an_error():
+    assert watched([("PASS", 1)]) == [("ERROR", "export process exited with code 0")]
+    assert watched([], cancelled=True) == [("CANCELLED", None)]
+
+
+def test_html_page_escapes_the_title():
+    page = export.html_page("<p>body</p>", 'Notes <draft> & "ideas"')
+    assert "<title>Notes &lt;draft&gt; &amp; &quot;ideas&quot;</title>" in page
+    assert "<p>body</p>" in page
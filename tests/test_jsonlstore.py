@@ -0,0 +1,55 @@
+import os
+
+import jsonlstore
+
+
+def test_append_get_and_reopen(tmp_path):
+    path = str(tmp_path / "store.jsonl")
+    with jsonlstore.JsonlStore(path, batch=2) as store:
+        store.append({"id": "a", "value": 1})
+        # Pending records are visible before they are written
+        assert store.get("a") == {"id": "a", "value": 1}
+        store.append({"id": "b", "value": 2})
+        store.append({"id": "a", "value": 3})
+        assert len(store) == 2
+    with jsonlstore.JsonlStore(path) as store:
+        assert store.get("a") == {"id": "a", "value": 3}
+        assert store.get("missing") is None
+        assert [record["value"] for record in store.records()] == [1, 2, 3]
+        assert [record["value"] for record in store.records(latest=True)] == [2, 3]
+
+
+def test_torn_record_and_stale_index(tmp_path):
+    path = str(tmp_path / "store.jsonl")
+    with jsonlstore.JsonlStore(path) as store:
+        store.extend({"id": number} for number in range(10))
+    # Records the index has not caught up with, then a crash mid-write
+    with open(path, "ab") as file:
+        file.write(b'{"id": 10}\n{"id": 11, "cut')
+    with jsonlstore.JsonlStore(path) as store:
+        assert len(store) == 11
+        assert store.get(10) == {"id": 10}
+        assert store.get(11) is None
+    with open(path, "rb") as file:
+        assert file.read().endswith(b'{"id": 10}\n')
+
+    os.remove(path)
+    with open(path, "w") as file:
+        file.write('{"id": "new"}\n')
+    # The index of the file that was there before is not used
+    with jsonlstore.JsonlStore(path) as store:
+        assert store.ids() == ["new"]
+
+
+def test_compact(tmp_path):
+    path = str(tmp_path / "store.jsonl")
+    with jsonlstore.JsonlStore(path) as store:
+        for turn in range(3):
+            store.extend({"id": number, "round": turn} for number in range(5))
+        store.append({"note": "no id"})
+        assert store.compact(keep=lambda record: record.get("id") != 4) > 0
+        assert len(store) == 4
+        assert list(store) == [{"id": number, "round": 2} for number in range(4)] + [{"note": "no id"}]
+        assert store.get(3) == {"id": 3, "round": 2}
+    with jsonlstore.JsonlStore(path) as store:
+        assert store.get(4) is None and store.get(0) == {"id": 0, "round": 2}
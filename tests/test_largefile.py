@@ -0,0 +1,82 @@
+import codecs
+
+import pytest
+
+import largefile
+
+
+@pytest.mark.parametrize("text, encoding", [
+    ("café\n", "latin-1"),
+    ("I had a café au lait in Zürich.\n", "latin-1"),
+    ("“Smart quotes” — and a café.\n", "cp1252"),
+    ("Привет, как дела?\n", "cp1251"),
+    ("Да\n", "cp1251"),
+    ("Привет, как дела? Это текст на русском языке.\n", "koi8-r"),
+])
+def test_single_byte_encodings_round_trip(tmp_path, text, encoding):
+    path = tmp_path / "note.md"
+    path.write_bytes(("# Title\n\n" + text).encode(encoding))
+    detected = largefile.detect_encoding(str(path))
+    assert path.read_bytes().decode(detected) == "# Title\n\n" + text
+
+
+@pytest.mark.parametrize("data, encoding", [
+    ("plain ascii\n".encode("utf-8"), "utf-8"),
+    ("é and ж\n".encode("utf-8"), "utf-8"),
+    (codecs.BOM_UTF8 + "é".encode("utf-8"), "utf-8-sig"),
+    ("é".encode("utf-16"), "utf-16"),
+    (b"", "utf-8"),
+])
+def test_bom_and_utf8(data, encoding):
+    assert largefile.data_encoding(data) == encoding
+
+
+def test_utf8_split_across_chunks(tmp_path):
+    path = tmp_path / "note.md"
+    path.write_bytes(("x" * 1023 + "é" * 10).encode("utf-8"))
+    assert largefile.detect_encoding(str(path), chunkSize=1024) == "utf-8"
+
+
+def test_latin1_after_a_long_ascii_head(tmp_path):
+    path = tmp_path / "note.md"
+    path.write_bytes(b"ascii line\n" * 50000 + "Le café est très bon.\n".encode("latin-1"))
+    assert largefile.detect_encoding(str(path), chunkSize=4096) in ("cp1252", "iso8859-1")
+
+
+def test_worker_detects_and_decodes(tmp_path):
+    text = "Le café est très bon.\r\n" * 2000
+    path = tmp_path / "big.md"
+    path.write_bytes(text.encode("latin-1"))
+    loader = largefile.ChunkedLoader(str(path), chunkSize=1000)
+    loader.start()
+    pieces = []
+    while True:
+        piece = loader.poll()
+        if piece is None:
+            break
+        pieces.append(piece)
+    assert "".join(pieces) == text.replace("\r\n", "\n")
+    assert loader.encoding == "cp1252"
+
+
+def test_close_stops_worker(tmp_path):
+    path = tmp_path / "big.md"
+    path.write_bytes(b"line\n" * 100000)
+    loader = largefile.ChunkedLoader(str(path), chunkSize=100)
+    loader.start()
+    loader.close()
+    loader.worker.join(5)
+    assert not loader.worker.is_alive()
+    assert loader.file is None
+
+
+def test_worker_error_is_raised_by_poll(tmp_path):
+    path = tmp_path / "big.md"
+    path.write_bytes(b"line\n" * 1000)
+    loader = largefile.ChunkedLoader(str(path), "no-such-encoding", chunkSize=100)
+    loader.start()
+    loader.worker.join(5)
+    with pytest.raises(LookupError):
+        while loader.poll() is not None:
+            pass
+    assert loader.file is None
@@ -0,0 +1,98 @@
+import os
+import asyncio
+import threading
+
+import pytest
+
+import llm
+import llmcache
+import mockllm
+
+
+def test_history_is_rotated(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm, "HISTORY_LIMIT", 1000)
+    path = str(tmp_path / "answers.jsonl")
+    client = llm.LLMClient(apiBase="http://127.0.0.1:9", cache=False, history=path)
+    try:
+        for number in range(30):
+            client.record({"id": number, "answer": "x" * 100})
+    finally:
+        client.stop()
+
+    assert os.path.getsize(path + ".1") >= 1000
+    assert os.path.getsize(path) < 1000
+    with llm.jsonlstore.JsonlStore(path) as current, llm.jsonlstore.JsonlStore(path + ".1") as previous:
+        assert max(previous.ids()) < min(current.ids())
+        assert max(current.ids()) == 29
+
+
+def test_no_history(tmp_path):
+    client = llm.LLMClient(apiBase="http://127.0.0.1:9", cache=False)
+    client.record({"id": 1})
+    client.stop()
+    assert client.historyStore is None
+
+
+@pytest.fixture
+def server():
+    server = mockllm.MockServer(ttft=0.2, delay=0.002, tokens=100)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server.url = asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    yield server
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def ask(client, question, count=1):
+    """Send question count times at once; return [(texts, stats, error)]."""
+    results = [([], None, None) for _ in range(count)]
+    done = threading.Semaphore(0)
+
+    def submit(number):
+        texts = results[number][0]
+
+        def onDone(stats, error):
+            results[number] = (texts, stats, error)
+            done.release()
+        client.submit([{"role": "user", "content": question}], texts.append, onDone)
+
+    for number in range(count):
+        submit(number)
+    for _ in range(count):
+        assert done.acquire(timeout=10)
+    return results
+
+
+def test_stream_in_batches(server):
+    client = llm.LLMClient(apiBase=server.url, cache=False, interval=0.05)
+    try:
+        [(texts, stats, error)] = ask(client, "how are you?")
+    finally:
+        client.stop()
+    assert error is None
+    expected = "".join(server.answer([{"role": "user", "content": "how are you?"}]))
+    assert "".join(texts) == expected
+    # The first token on its own, the rest in batches
+    assert texts[0] == "You "
+    assert stats.tokens == 100
+    assert stats.updates == len(texts) < 50
+    assert 0.2 <= stats.ttft <= stats.seconds
+
+
+def test_identical_requests_share_one_call(server, tmp_path):
+    cache = llmcache.CompletionCache(str(tmp_path / "completions.sqlite"))
+    client = llm.LLMClient(apiBase=server.url, cache=cache)
+    try:
+        results = ask(client, "shared question", 4)
+        again = ask(client, "shared question")
+    finally:
+        client.stop()
+    answers = {"".join(texts) for texts, stats, error in results + again}
+    assert len(answers) == 1 and all(error is None for _, _, error in results + again)
+    assert server.requests == 1
+    assert client.shared == 3
+    # The last one came from the cache, whole
+    assert again[0][1].cached and len(again[0][0]) == 1
@@ -0,0 +1,40 @@
+import llmcache
+
+
+def key(content, params=None):
+    return llmcache.cache_key("http://api", "model", [{"role": "user", "content": content}], params or {})
+
+
+def test_key_ignores_layout_only():
+    assert key("hello\r\nworld  \n\n") == key("\nhello\nworld")
+    assert key("hello world") != key("hello  world")
+    assert key("hello", {"temperature": 0}) != key("hello")
+
+
+def test_get_put_and_expiry(tmp_path):
+    path = str(tmp_path / "cache" / "completions.sqlite")
+    cache = llmcache.CompletionCache(path)
+    assert cache.get(key("q")) is None
+    cache.put(key("q"), "answer", 3)
+    assert cache.get(key("q")) == ("answer", 3)
+    assert cache.hit_rate() == 0.5
+    cache.close()
+
+    expired = llmcache.CompletionCache(path, ttl=-1)
+    assert expired.get(key("q")) is None
+    expired.close()
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1000000, 2000000))
+    monkeypatch.setattr(llmcache.time, "time", lambda: next(clock))
+    size = 1000 + llmcache.ROW_OVERHEAD
+    cache = llmcache.CompletionCache(str(tmp_path / "completions.sqlite"), maxbytes=3 * size)
+    for name in "abc":
+        cache.put(key(name), name * 1000, 1)
+    cache.get(key("a"))
+    cache.put(key("d"), "d" * 1000, 1)
+    assert cache.get(key("b")) is None
+    assert [cache.get(key(name)) is not None for name in "acd"] == [True, True, True]
+    assert cache.bytes == 3 * size
+    cache.close()
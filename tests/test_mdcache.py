@@ -0,0 +1,57 @@
+import re
+
+import markdown
+import pytest
+
+import export
+from mdcache import BlockCache, split_blocks
+
+
+CASES = [
+    "para\n\n<!-- a comment\n\nstill comment -->\n\nafter",
+    "para\n<!-- opened mid paragraph\n\nclosed -->\n\nafter",
+    "<!-- one -->\n\ntext\n\n<!-- two\n\n-->\n<p>x\n\ny</p>\n\nz",
+    "<div>\n\ninner\n\n</div>\n\ntext",
+    "<div>\n<div>\n\nx\n\n</div>\n\ny\n</div>\n\nz",
+    "<hr>\n\ntext\n\nmore",
+    "```\n[foo]: http://example.com\n```\n\nsee [foo]\n",
+    "```\ncode\n\n[bar]: http://example.com\n```\n\n[bar] and [baz]\n\n[baz]: http://example.org\n",
+    "# Title\n\n* one\n* two\n\n    indented [ref]\n\n[ref]: /x \"t\"\n",
+    "## Steps\n1. Install\n\n2. Open\n\n3. Export\n",
+    "# T\n* one\n\n* two\n",
+    "## Q\n> a\n\n> b\n",
+    "[r]: /url\n===\n\nsee [r]\n",
+    "text\n\n[r]: /url\n---\n\nsee [r]\n",
+    "para\n[r]: /url\n---\n\nsee [r]\n",
+]
+
+
+def same(html):
+    # Blocks are joined with one newline; a full render sometimes puts two
+    return re.sub(r"\n+", "\n", html)
+
+
+@pytest.mark.parametrize("extensions", [[], export.MD_EXTENSIONS], ids=["plain", "editor"])
+@pytest.mark.parametrize("text", CASES)
+def test_cached_render_matches_full_render(text, extensions):
+    cache = BlockCache()
+    expected = same(markdown.markdown(text, extensions=extensions))
+    assert same(cache.render(text, extensions)) == expected
+    # Again, from the cache
+    assert same(cache.render(text, extensions)) == expected
+
+
+def test_blank_lines_inside_comment_and_fence_do_not_split():
+    text = "a\n\n<!-- x\n\ny -->\n\n```\n1\n\n2\n```\n\nb"
+    assert [source for _, source in split_blocks(text)] == [
+        "a", "<!-- x\n\ny -->", "```\n1\n\n2\n```", "b"]
+    assert [line for line, _ in split_blocks(text)] == [0, 2, 6, 12]
+
+
+def test_edit_rerenders_only_changed_block():
+    cache = BlockCache()
+    text = "one\n\ntwo\n\nthree"
+    cache.render(text)
+    misses = cache.misses
+    cache.render(text.replace("two", "2"))
+    assert cache.misses == misses + 1
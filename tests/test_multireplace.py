@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import multireplace
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setattr(multireplace, "FOLDER", str(tmp_path / "changesets"))
+    root = tmp_path / "notes"
+    root.mkdir()
+    (root / "a.md").write_text("cat and cat\n", encoding="utf-8")
+    (root / "b.txt").write_bytes("le chat, café\n".encode("cp1252"))
+    (root / "c.md").write_text("dog\n", encoding="utf-8")
+    return root
+
+
+def query(find, replacement):
+    return multireplace.Query(find, replacement, case=False, word=False, regex=False)
+
+
+def test_preview(root):
+    found = multireplace.preview(str(root), query("cat", "dog"), workers=1)
+    assert found.totals()[:3] == (3, 1, 2)
+    assert [hit.after for hit in found.matched[0].hits] == ["dog and cat", "cat and dog"]
+    assert (root / "a.md").read_text(encoding="utf-8") == "cat and cat\n"
+
+
+def test_apply_and_undo(root):
+    found = multireplace.preview(str(root), query("café", "thé"), workers=1)
+    changes = multireplace.apply(found, workers=1)
+    assert [os.path.basename(entry[0]) for entry in changes.changed] == ["b.txt"]
+    # Written back in the encoding it was read in
+    assert (root / "b.txt").read_bytes() == "le chat, thé\n".encode("cp1252")
+
+    latest = multireplace.ChangeSet.latest()
+    assert latest.ident == changes.ident
+    assert latest.undo() == []
+    assert (root / "b.txt").read_bytes() == "le chat, café\n".encode("cp1252")
+    assert multireplace.ChangeSet.latest() is None
+
+
+def test_changed_files_are_left_alone(root):
+    found = multireplace.preview(str(root), query("cat", "dog"), workers=1)
+    (root / "a.md").write_text("cat, edited\n", encoding="utf-8")
+    changes = multireplace.apply(found, workers=1)
+    assert changes.changed == []
+    assert changes.files[0][3] == "changed since the preview"
+    assert (root / "a.md").read_text(encoding="utf-8") == "cat, edited\n"
+    # Nothing changed, so there is nothing to undo
+    assert not os.path.exists(multireplace.FOLDER) or os.listdir(multireplace.FOLDER) == []
+    assert multireplace.ChangeSet.latest() is None
+
+
+def test_apply_nothing(root):
+    found = multireplace.preview(str(root), query("cat", "dog"), workers=1)
+    changes = multireplace.apply(found, workers=1, skip={found.matched[0].path})
+    assert changes.files == []
+    assert not os.path.exists(changes.folder)
+    assert multireplace.ChangeSet.latest() is None
+
+
+def test_undo_keeps_files_edited_since(root):
+    found = multireplace.preview(str(root), query("cat", "dog"), workers=1)
+    multireplace.apply(found, workers=1)
+    (root / "a.md").write_text("dog, edited\n", encoding="utf-8")
+    changes = multireplace.ChangeSet.latest()
+    assert [error for path, error in changes.undo()] == ["changed since the replace"]
+    assert (root / "a.md").read_text(encoding="utf-8") == "dog, edited\n"
+    assert multireplace.ChangeSet.latest().ident == changes.ident
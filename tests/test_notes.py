@@ -0,0 +1,48 @@
+import pytest
+
+import notes
+
+
+@pytest.mark.parametrize("typed, query", [
+    ("hello world", '"hello" "world"'),
+    ("hello OR world", '"hello" OR "world"'),
+    ("hello NOT world", '"hello" NOT "world"'),
+    ("hello AND NOT world", '"hello" NOT "world"'),
+    ('"exact phrase" pre*', '"exact phrase" "pre"*'),
+    ("a-b (c)", '"a-b" "(c)"'),
+    ("hello OR", '"hello"'),
+    ("OR hello", '"hello"'),
+    ("NOT hello", ""),
+    ("NOT", ""),
+    ("hello OR NOT world", ""),
+    ("", ""),
+])
+def test_match_query(typed, query):
+    assert notes.match_query(typed) == query
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / "notes"
+    root.mkdir()
+    (root / "greeting.md").write_text("# Greeting\n\nhello there\n", encoding="utf-8")
+    (root / "other.md").write_text("# Other\n\nhello world\n", encoding="utf-8")
+    (root / "cafe.txt").write_bytes("Le café est très bon.\r\n".encode("latin-1"))
+    index = notes.NotesIndex(str(root), str(tmp_path / "index.sqlite"))
+    yield root, index
+    index.close()
+
+
+def test_search_and_refresh(index):
+    root, index = index
+    assert index.refresh() == notes.Changes(3, 0, 0)
+    assert sorted(hit.title for hit in index.search("hello")) == ["Greeting", "Other"]
+    assert [hit.title for hit in index.search("hello NOT world")] == ["Greeting"]
+    assert index.search("NOT world") == []
+    assert [hit.title for hit in index.search("café")] == ["cafe"]
+
+    (root / "other.md").write_text("# Other\n\ngoodbye\n", encoding="utf-8")
+    (root / "greeting.md").unlink()
+    assert index.refresh() == notes.Changes(0, 1, 1)
+    assert index.search("hello") == []
+    assert index.refresh() == notes.Changes(0, 0, 0)
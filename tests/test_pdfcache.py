@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+import export
+import pdfcache
+
+
+@pytest.fixture
+def basedir(tmp_path, monkeypatch):
+    base = tmp_path / "app"
+    (base / "fonts").mkdir(parents=True)
+    (base / "fonts" / "Sans.ttf").write_bytes(b"font")
+    template = base / "template.html"
+    template.write_text("<style>body {}</style>", encoding="utf-8")
+    monkeypatch.setattr(export, "BASEDIR", str(base))
+    return base
+
+
+def test_key_changes_with_template_and_fonts(basedir, tmp_path):
+    template = str(basedir / "template.html")
+    cache = pdfcache.FragmentCache(str(tmp_path / "cache"))
+    key = cache.key("<h1>One</h1>", template)
+    assert cache.key("<h1>One</h1>", template) == key
+    assert cache.key("<h1>Two</h1>", template) != key
+
+    cache.put(key, b"%PDF", [(0, "One", 1)], 0)
+    assert cache.get(key) == (b"%PDF", [(0, "One", 1)], 0)
+
+    (basedir / "template.html").write_text("<style>body { color: red }</style>", encoding="utf-8")
+    os.utime(template, ns=(0, 1))
+    changed = cache.key("<h1>One</h1>", template)
+    assert changed != key and cache.get(changed) is None
+
+    # Fonts are stamped once per cache; a new one sees the added font
+    (basedir / "fonts" / "Serif.ttf").write_bytes(b"another font")
+    assert pdfcache.FragmentCache(str(tmp_path / "cache")).key("<h1>One</h1>", template) != changed
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = pdfcache.FragmentCache(str(tmp_path / "cache"), maxbytes=10000)
+    for number in range(4):
+        key = "k{}".format(number)
+        cache.put(key, b"x" * 2000, [], 0)
+        for path in cache._paths(key):
+            os.utime(path, (1000 + number, 1000 + number))
+    # Used again, so no longer the oldest
+    cache.get("k0")
+
+    cache.put("k4", b"x" * 2000, [], 0)
+    assert cache.size() <= 10000 * 0.8
+    assert cache.get("k1") is None and cache.get("k2") is None
+    assert [cache.get(key) is not None for key in ("k0", "k3", "k4")] == [True, True, True]
+    # Errors are never cached
+    cache.put("bad", b"x", [], 1)
+    assert cache.get("bad") is None
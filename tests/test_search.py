@@ -0,0 +1,44 @@
+import random
+
+import search
+
+
+def spans(text, query, **options):
+    pattern = search.compile_pattern(query, **options)
+    return [(m.start(), m.end()) for m in pattern.finditer(text) if m.end() > m.start()]
+
+
+def test_find_matches_a_plain_scan():
+    text = "".join("line {} has Needle and needles\n".format(number) for number in range(2000))
+    index = search.SearchIndex(text)
+    assert len(index.blocks) > 1
+    for query, options in [("needle", {}), ("Needle", {"case": True}), ("needle", {"word": True}),
+                           (r"\d+ has", {"regex": True}), ("needles\nline", {})]:
+        assert index.find(query, **options).spans == spans(text, query, **options)
+        # Again, from the cached results
+        assert index.find(query, **options).spans == spans(text, query, **options)
+    assert not index.find("nowhere")
+    assert not index.find("")
+
+
+def test_update_after_edits():
+    rng = random.Random(3)
+    text = "".join("row {}\n".format(number) for number in range(5000))
+    index = search.SearchIndex(text)
+    index.find("row 4")
+    for _ in range(50):
+        start = rng.randrange(len(text))
+        end = min(len(text), start + rng.randrange(200))
+        text = text[:start] + rng.choice(["", "row X\n", "new text"]) + text[end:]
+        index.update(text)
+        assert index.text() == text
+        assert all(block.text.endswith("\n") for block in index.blocks[:-1])
+        assert index.find("row x").spans == spans(text, "row x")
+
+
+def test_results_cursor():
+    results = search.SearchIndex("ab ab ab").find("ab")
+    assert results.first() == (0, 2)
+    assert results.next() == (3, 5)
+    assert results.after(4) == (6, 8)
+    assert results.next() == (0, 2)
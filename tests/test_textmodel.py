@@ -0,0 +1,51 @@
+import random
+
+import textmodel
+
+
+def test_edits_match_a_string():
+    rng = random.Random(7)
+    model = textmodel.TextModel("first line\nsecond line\n")
+    expected = model.text()
+    for _ in range(500):
+        start = rng.randint(0, len(expected))
+        end = rng.randint(start, min(len(expected), start + 10))
+        text = rng.choice(["", "x", "new\nlines\n", "é"])
+        model.replace(start, end, text)
+        expected = expected[:start] + text + expected[end:]
+    assert model.text() == expected
+    assert len(model) == len(expected)
+    assert model.slice(5, 40) == expected[5:40]
+    snapshot = model.snapshot()
+    for offset in range(0, len(expected), 7):
+        line = expected.count("\n", 0, offset)
+        assert snapshot.line_of(offset) == line
+        assert snapshot.line_start(line) == expected.rfind("\n", 0, offset) + 1
+
+
+def test_snapshot_survives_edits():
+    model = textmodel.TextModel("hello world")
+    snapshot = model.snapshot()
+    changes = []
+    model.subscribe(changes.append)
+    model.delete(0, 6)
+    model.insert(0, "goodbye ")
+    assert str(snapshot) == "hello world"
+    assert model.text() == "goodbye world"
+    assert [(change.start, change.end, change.text) for change in changes] == [(0, 6, ""), (0, 0, "goodbye ")]
+
+
+def test_matches():
+    text = "a" * 1000 + "b" * 1000
+    model = textmodel.TextModel(text)
+
+    def read(start, end):
+        return editor[start:end]
+
+    editor = text
+    assert model.matches(len(editor), read, (0, 1500))
+    # Same length, different text near the caret
+    editor = text[:1500] + "c" + text[1501:]
+    assert not model.matches(len(editor), read, (0, 1500))
+    assert model.matches(len(editor), read, (0, 200))
+    assert not model.matches(len(editor) + 1, read, (0,))
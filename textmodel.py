@@ -0,0 +1,264 @@
+"""
+Piece-table model of an editor buffer
+
+The text is a sequence of pieces, each a range of an immutable buffer: the
+text the document was loaded with, or a string that was inserted later.
+Pieces are kept in a persistent treap ordered by position, so an edit,
+a slice or a line lookup costs O(log n), and an edit copies only the nodes
+on its path. A snapshot is the root at one revision: taking one is O(1),
+and it stays valid while the editor goes on changing, so the preview and
+the autosaver can read it on their own threads.
+
+Subscribers are told about each edit as a Change, the range it replaced
+and the new text, instead of being handed the whole buffer.
+"""
+
+import bisect
+import random
+import collections
+
+
+Change = collections.namedtuple("Change", "start end text revision")
+
+
+class Buffer:
+    __slots__ = ("text", "newlines")
+
+    def __init__(self, text):
+        self.text = text
+        # Offsets of every newline, so a piece of any size counts its lines
+        # with two bisects
+        newlines = []
+        index = text.find("\n")
+        while index != -1:
+            newlines.append(index)
+            index = text.find("\n", index + 1)
+        self.newlines = newlines
+
+    def count(self, start, end):
+        return bisect.bisect_left(self.newlines, end) - bisect.bisect_left(self.newlines, start)
+
+
+class Node:
+    __slots__ = ("buffer", "start", "length", "breaks", "left", "right",
+                 "priority", "size", "lines")
+
+    def __init__(self, buffer, start, length, left=None, right=None, priority=None, breaks=None):
+        self.buffer = buffer
+        self.start = start
+        self.length = length
+        self.breaks = buffer.count(start, start + length) if breaks is None else breaks
+        self.left = left
+        self.right = right
+        self.priority = random.random() if priority is None else priority
+        self.size = length + size(left) + size(right)
+        self.lines = self.breaks + lines(left) + lines(right)
+
+    def copy(self, left, right):
+        return Node(self.buffer, self.start, self.length, left, right, self.priority, self.breaks)
+
+
+def size(node):
+    return node.size if node is not None else 0
+
+
+def lines(node):
+    return node.lines if node is not None else 0
+
+
+def merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        return left.copy(left.left, merge(left.right, right))
+    return right.copy(merge(left, right.left), right.right)
+
+
+def split(node, offset):
+    """Return (first offset characters, the rest) as two trees."""
+    if node is None:
+        return None, None
+    before = size(node.left)
+    if offset <= before:
+        left, right = split(node.left, offset)
+        return left, node.copy(right, node.right)
+    if offset >= before + node.length:
+        left, right = split(node.right, offset - before - node.length)
+        return node.copy(node.left, left), right
+
+    # The split falls inside this piece: it becomes two
+    cut = offset - before
+    head = Node(node.buffer, node.start, cut)
+    tail = Node(node.buffer, node.start + cut, node.length - cut)
+    return merge(node.left, head), merge(tail, node.right)
+
+
+def pieces(node, start=0, end=None):
+    """Yield the text of node between start and end, piece by piece."""
+    if end is None:
+        end = size(node)
+    stack = []
+    offset = 0
+    while stack or node is not None:
+        if node is not None:
+            # Subtrees that end before start are skipped whole
+            if offset + node.size > start:
+                stack.append((node, offset))
+                node = node.left
+            else:
+                node = None
+            continue
+
+        node, offset = stack.pop()
+        position = offset + size(node.left)
+        if position >= end:
+            return
+        low = max(start, position) - position
+        high = min(end, position + node.length) - position
+        if high > low:
+            yield node.buffer.text[node.start + low:node.start + high]
+        offset = position + node.length
+        node = node.right
+
+
+class Snapshot:
+    """The text at one revision; immutable and safe to share."""
+
+    __slots__ = ("root", "revision")
+
+    def __init__(self, root, revision):
+        self.root = root
+        self.revision = revision
+
+    def __len__(self):
+        return size(self.root)
+
+    def __str__(self):
+        return "".join(pieces(self.root))
+
+    text = __str__
+
+    def slice(self, start, end):
+        return "".join(pieces(self.root, max(0, start), min(end, len(self))))
+
+    def chunks(self, start=0, end=None):
+        return pieces(self.root, start, len(self) if end is None else end)
+
+    def line_count(self):
+        return lines(self.root) + 1
+
+    def line_of(self, offset):
+        """Return the 0-based line that offset is on."""
+        node = self.root
+        line = 0
+        while node is not None:
+            before = size(node.left)
+            if offset < before:
+                node = node.left
+                continue
+            line += lines(node.left)
+            offset -= before
+            if offset < node.length:
+                return line + node.buffer.count(node.start, node.start + offset)
+            line += node.breaks
+            offset -= node.length
+            node = node.right
+        return line
+
+    def line_start(self, line):
+        """Return the offset of the first character of 0-based line."""
+        node = self.root
+        offset = 0
+        while node is not None and line > 0:
+            if line <= lines(node.left):
+                node = node.left
+                continue
+            line -= lines(node.left)
+            offset += size(node.left)
+            if line <= node.breaks:
+                newline = node.buffer.newlines[
+                    bisect.bisect_left(node.buffer.newlines, node.start) + line - 1]
+                return offset + newline - node.start + 1
+            line -= node.breaks
+            offset += node.length
+            node = node.right
+        return offset if line == 0 else size(self.root)
+
+
+class TextModel:
+    """Mirror of an editor buffer that records edits as deltas."""
+
+    def __init__(self, text=""):
+        self.root = None
+        self.revision = 0
+        self.subscribers = []
+        if text:
+            self.root = leaf(text)
+
+    def __len__(self):
+        return size(self.root)
+
+    def snapshot(self):
+        return Snapshot(self.root, self.revision)
+
+    def text(self):
+        return "".join(pieces(self.root))
+
+    def slice(self, start, end):
+        return self.snapshot().slice(start, end)
+
+    def line_of(self, offset):
+        return self.snapshot().line_of(offset)
+
+    def matches(self, length, read, positions, width=256):
+        """Cheap check against another copy of the text: whether it is
+        length long and read(start, end) agrees with the model within width
+        of each of positions."""
+        if length != size(self.root):
+            return False
+        snapshot = self.snapshot()
+        for position in positions:
+            start, end = max(0, position - width), min(length, position + width)
+            if read(start, end) != snapshot.slice(start, end):
+                return False
+        return True
+
+    def subscribe(self, callback):
+        """Call callback(change) after every edit."""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def replace(self, start, end, text):
+        length = size(self.root)
+        start = max(0, min(start, length))
+        end = max(start, min(end, length))
+        if start == end and not text:
+            return
+
+        left, rest = split(self.root, start)
+        _, right = split(rest, end - start)
+        if text:
+            left = merge(left, leaf(text))
+        self.root = merge(left, right)
+        self.revision += 1
+
+        change = Change(start, end, text, self.revision)
+        for callback in self.subscribers:
+            callback(change)
+
+    def insert(self, position, text):
+        self.replace(position, position, text)
+
+    def delete(self, start, end):
+        self.replace(start, end, "")
+
+    def set(self, text):
+        self.replace(0, size(self.root), text)
+
+
+def leaf(text):
+    return Node(Buffer(text), 0, len(text))
@@ -0,0 +1,147 @@
+"""
+Open documents and their memory budget
+
+Each tab of the editor is a Document holding everything that belongs to
+one buffer: file name and encoding, unsaved state, its autosave journal,
+search index and last rendered preview. Switching tabs only swaps which
+Document is active, so nothing is re-read or re-rendered.
+
+Idle documents are trimmed when the estimated memory of all documents
+exceeds the workspace budget, least recently used first: they are first
+compacted (search index and rendered preview dropped, both rebuilt on
+demand), then evicted (editor widget dropped; the text is kept only when
+it has unsaved changes, otherwise it is read from disk again).
+"""
+
+import os
+import time
+
+import perf
+from search import SearchIndex, SearchResults
+from textmodel import TextModel
+
+
+# Rough cost per character of text held by an editor widget, its model,
+# and by the search index and rendered preview
+EDITOR_BYTES = 16
+MODEL_BYTES = 2
+INDEX_BYTES = 3
+PREVIEW_BYTES = 4
+
+
+class Document:
+    def __init__(self, dirname=".", filename="untitled", encoding="utf-8"):
+        self.dirname = dirname
+        self.filename = filename
+        self.encoding = encoding
+        self.modify = False
+        self.readOnly = False
+
+        # Large-file mode: chunked loading, preview of the visible part only
+        self.largeFile = False
+        self.loader = None
+        self.loadTimer = perf.NULL
+
+        self.searchIndex = SearchIndex()
+        self.searchResults = SearchResults([])
+        self.sourceMap = None
+        self.autosaver = None
+
+        # Mirrors the editor; the search index follows its edits
+        self.model = TextModel()
+        self.model.subscribe(self.updateIndex)
+
+        # Set by the editor: the tab page, its text widget (None while
+        # evicted) and where the views were when the tab was left
+        self.page = None
+        self.editor = None
+        self.text = None
+        self.length = 0
+        self.insertion = 0
+        self.previewPosition = None
+
+        self.used = time.monotonic()
+
+    @property
+    def path(self):
+        return os.path.join(self.dirname, self.filename)
+
+    def updateIndex(self, change):
+        # An index that was never built, or was compacted, is built on demand
+        if self.searchIndex.blocks:
+            self.searchIndex.edit(change.start, change.end, change.text)
+
+    def footprint(self):
+        size = len(self.model) * MODEL_BYTES
+        if self.editor is not None:
+            size += self.length * EDITOR_BYTES
+        elif self.text is not None:
+            size += len(self.text) * 2
+        size += self.searchIndex.length * INDEX_BYTES
+        if self.sourceMap is not None:
+            size += sum(len(block) for block in self.sourceMap.blocks) * PREVIEW_BYTES
+        return size
+
+    def compact(self):
+        """Drop state that can be rebuilt; return the bytes freed."""
+        before = self.footprint()
+        self.searchIndex = SearchIndex()
+        self.searchResults = SearchResults([])
+        self.sourceMap = None
+        self.previewPosition = None
+        return before - self.footprint()
+
+
+class Workspace:
+    def __init__(self, budget=256 * 1024 * 1024):
+        self.budget = budget
+        self.documents = []
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def add(self, document):
+        self.documents.append(document)
+
+    def remove(self, document):
+        self.documents.remove(document)
+
+    def touch(self, document):
+        document.used = time.monotonic()
+
+    def find(self, path):
+        path = os.path.abspath(path)
+        for document in self.documents:
+            if document.filename != "untitled" and os.path.abspath(document.path) == path:
+                return document
+        return None
+
+    def footprint(self):
+        return sum(document.footprint() for document in self.documents)
+
+    def trim(self, active):
+        """Compact idle documents until the workspace fits its budget and
+        return the ones whose editor should be evicted as well."""
+        total = self.footprint()
+        idle = sorted((document for document in self.documents if document is not active),
+                      key=lambda document: document.used)
+
+        for document in idle:
+            if total <= self.budget:
+                return []
+            total -= document.compact()
+
+        evict = []
+        for document in idle:
+            if total <= self.budget:
+                break
+            # A file still loading keeps its editor until it is complete
+            if document.editor is not None and document.loader is None:
+                evict.append(document)
+                total -= document.length * (EDITOR_BYTES + MODEL_BYTES)
+                if document.modify:
+                    total += document.length * 2
+        return evict